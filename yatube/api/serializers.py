@@ -0,0 +1,148 @@
+"""Сериализация ответов API одним проходом по values()-выборке.
+
+Поле ресурса — имя в JSON и путь для values(). Запрос выбирает только
+запрошенные поля (?fields=), объекты моделей не создаются.
+"""
+from core.db import sharding
+from posts.models import Comment, Group, Post
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def _image_url(name):
+    if not name:
+        return None
+    return Post._meta.get_field("image").storage.url(name)
+
+
+class Resource:
+    """Поля ресурса API.
+
+    Поля связанных моделей берутся JOIN'ом в том же запросе, а если
+    модель лежит на шардах (JOIN между базами невозможен) — одним
+    запросом на связь по id со всей страницы.
+    """
+
+    def __init__(self, model, fields, default=None, converters=None):
+        self.model = model
+        self.fields = fields
+        self.default = tuple(default or fields)
+        self.converters = converters or {}
+
+    def select(self, requested):
+        """Имена полей из параметра ?fields=a,b; пусто — по умолчанию"""
+        if not requested:
+            return self.default
+        names = tuple(dict.fromkeys(
+            name.strip() for name in requested.split(",") if name.strip()
+        ))
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise InvalidFields(
+                "Неизвестные поля: {}. Доступны: {}".format(
+                    ", ".join(unknown) or "-", ", ".join(self.fields)
+                )
+            )
+        return names
+
+    def _plan(self, names):
+        """Пути values() для полей и связи, догружаемые отдельно"""
+        paths, joins = {}, {}
+        split = sharding.enabled() and sharding.is_sharded(self.model)
+        for name in names:
+            path = self.fields[name]
+            relation, _, field = path.partition("__")
+            if split and field:
+                related = self.model._meta.get_field(relation)
+                paths[name] = related.attname
+                joins.setdefault(
+                    related.attname, (related.related_model, {})
+                )[1][name] = field
+            else:
+                paths[name] = path
+        return paths, joins
+
+    def values(self, queryset, names, keys=()):
+        """values()-выборка полей names и ключей пагинации keys"""
+        paths, _ = self._plan(names)
+        return queryset.values(*dict.fromkeys((*paths.values(), *keys)))
+
+    def serialize(self, rows, names):
+        paths, joins = self._plan(names)
+        related = {}
+        for attname, (model, fields) in joins.items():
+            ids = {row[attname] for row in rows} - {None}
+            related[attname] = {
+                values["pk"]: values
+                for values in model._default_manager.filter(pk__in=ids)
+                .values("pk", *fields.values())
+            } if ids else {}
+
+        columns = []
+        for name in names:
+            path = paths[name]
+            lookup = None
+            if path in joins:
+                lookup = (related[path], joins[path][1][name])
+            columns.append((name, path, lookup, self.converters.get(name)))
+        return [
+            {
+                name: _value(row, path, lookup, converter)
+                for name, path, lookup, converter in columns
+            }
+            for row in rows
+        ]
+
+
+def _value(row, path, lookup, converter):
+    value = row[path]
+    if lookup is not None:
+        objects, field = lookup
+        value = objects[value][field] if value in objects else None
+    return converter(value) if converter else value
+
+
+POSTS = Resource(
+    Post,
+    {
+        "id": "id",
+        "text": "text",
+        "pub_date": "pub_date",
+        "author": "author__username",
+        "group": "group__slug",
+        "image": "image",
+    },
+    converters={"image": _image_url},
+)
+
+# Счетчик комментариев меняется без сигналов Post, поэтому только
+# в ответе по одному посту, который не кэшируется
+POST_DETAIL = Resource(
+    Post,
+    {**POSTS.fields, "comments_count": "comments_count"},
+    converters=POSTS.converters,
+)
+
+COMMENTS = Resource(
+    Comment,
+    {
+        "id": "id",
+        "post": "post_id",
+        "author": "author__username",
+        "text": "text",
+        "created": "created",
+    },
+)
+
+GROUPS = Resource(
+    Group,
+    {
+        "id": "id",
+        "title": "title",
+        "slug": "slug",
+        "description": "description",
+        "posts_count": "posts_count",
+    },
+)
@@ -0,0 +1,229 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.feed import rebuild_all
+from posts.models import Comment, FeedItem, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(API_PAGE_SIZE=4)
+class ApiViewsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author")
+        cls.other = User.objects.create_user(username="other")
+        cls.reader = User.objects.create_user(username="reader")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author if i % 2 else cls.other,
+                text=f"Пост {i}",
+                group=cls.group if i < 6 else None,
+            )
+            for i in range(10)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text="Комментарий"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def walk(self, url, client=None):
+        """id всех объектов, пройденных по ссылкам next"""
+        client = client or self.client
+        ids = []
+        while url:
+            data = client.get(url).json()
+            ids.extend(item["id"] for item in data["results"])
+            url = data["next"]
+        return ids
+
+    def test_posts_page(self):
+        """Страница постов: поля по умолчанию и курсоры"""
+        response = self.client.get(reverse("api:posts"))
+
+        self.assertEqual(response["Content-Type"], "application/json")
+        data = response.json()
+        self.assertEqual(len(data["results"]), 4)
+        self.assertIsNone(data["previous"])
+        self.assertEqual(data["results"][0], {
+            "id": self.post.pk,
+            "text": self.post.text,
+            "pub_date": data["results"][0]["pub_date"],
+            "author": "author",
+            "group": None,
+            "image": None,
+        })
+        self.assertIn("Пост", response.content.decode())
+
+    def test_keyset_pages_cover_feeds(self):
+        """Курсоры проходят ленты целиком без повторов"""
+        newest_first = [post.pk for post in reversed(self.posts)]
+        feeds = {
+            reverse("api:posts"): newest_first,
+            reverse("api:group_posts", args=("group",)): [
+                post.pk for post in reversed(self.posts[:6])
+            ],
+            reverse("api:user_posts", args=("author",)): [
+                post.pk for post in reversed(self.posts[1::2])
+            ],
+            reverse("api:groups"): [self.group.pk],
+        }
+        for url, expected in feeds.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.walk(url), expected)
+
+    def test_previous_page(self):
+        first = self.client.get(reverse("api:posts")).json()
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+
+        self.assertEqual(back["results"], first["results"])
+
+    def test_fields_selection(self):
+        """?fields= сужает и ответ, и запрос"""
+        url = reverse("api:posts") + "?fields=id,author"
+        with self.assertNumQueries(1) as context:
+            data = self.client.get(url).json()
+
+        self.assertEqual(set(data["results"][0]), {"id", "author"})
+        sql = context.captured_queries[0]["sql"]
+        self.assertNotIn('"text"', sql)
+        self.assertIn("fields=id%2Cauthor", data["next"])
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse("api:posts") + "?fields=id,secret")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["detail"])
+
+    def test_values_without_models(self):
+        """Ответ собирается без создания объектов моделей"""
+        original = Post.from_db
+
+        def from_db(*args, **kwargs):
+            raise AssertionError("model instantiated")
+
+        Post.from_db = classmethod(from_db)
+        try:
+            response = self.client.get(reverse("api:posts"))
+        finally:
+            Post.from_db = original
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_and_comments(self):
+        detail = self.client.get(
+            reverse("api:post_detail", args=(self.post.pk,))
+        ).json()
+        comments = self.client.get(
+            reverse("api:comments", args=(self.post.pk,))
+        ).json()
+
+        self.assertEqual(detail["comments_count"], 1)
+        self.assertEqual(detail["author"], "author")
+        self.assertEqual(len(comments["results"]), 1)
+        self.assertEqual(comments["results"][0]["author"], "reader")
+        self.assertEqual(comments["results"][0]["post"], self.post.pk)
+
+    def test_new_comment_listed(self):
+        """Новый комментарий сразу виден в списке и меняет ETag"""
+        url = reverse("api:comments", args=(self.post.pk,))
+        etag = self.client.get(url)["ETag"]
+        Comment.objects.create(
+            post=self.post, author=self.author, text="Новый"
+        )
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["text"], "Новый")
+
+    def test_bad_cursor_returns_first_page(self):
+        """Битый или подделанный курсор — первая страница, а не 500"""
+        url = reverse("api:posts")
+        first = self.client.get(url).json()["results"]
+        crafted = [
+            base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for values in ([None, None], ["x", []], [{"a": 1}, 1])
+        ]
+        for cursor in ("%%%", "a b", "x" * 600, *crafted):
+            for param in ("after", "before"):
+                with self.subTest(cursor=cursor, param=param):
+                    response = self.client.get(url, {param: cursor})
+
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json()["results"], first)
+
+    def test_not_found(self):
+        urls = (
+            reverse("api:post_detail", args=(10 ** 6,)),
+            reverse("api:comments", args=(10 ** 6,)),
+            reverse("api:group_posts", args=("missing",)),
+            reverse("api:user_posts", args=("missing",)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {"detail": "Не найдено"})
+
+    def test_read_only(self):
+        response = self.client.post(reverse("api:posts"))
+
+        self.assertEqual(response.status_code, 405)
+
+    def test_follow_feed(self):
+        """Лента подписок — только для вошедших"""
+        self.assertEqual(
+            self.client.get(reverse("api:follow")).status_code, 401
+        )
+        self.assertEqual(
+            self.walk(reverse("api:follow"), self.reader_client),
+            [post.pk for post in reversed(self.posts[1::2])],
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_follow_feed_of_popular_author(self):
+        """Лента из таблицы постов, если автор не раскладывается"""
+        rebuild_all()
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(
+            self.walk(reverse("api:follow"), self.reader_client),
+            [post.pk for post in reversed(self.posts[1::2])],
+        )
+
+    def test_etag(self):
+        url = reverse("api:posts")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text="Новый пост")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_cache(self):
+        """Повторный запрос страницы не обращается к базе,
+        новый пост сбрасывает кэш"""
+        url = reverse("api:posts")
+        first = self.client.get(url).content
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, first)
+        Post.objects.create(author=self.author, text="Новый пост")
+        data = self.client.get(url).json()
+        self.assertEqual(data["results"][0]["text"], "Новый пост")
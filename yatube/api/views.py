@@ -0,0 +1,205 @@
+"""JSON API лент для мобильных и партнерских клиентов.
+
+Ответ — страница keyset-пагинации: {"results": [...], "next": ...,
+"previous": ...}; ?fields= выбирает поля. Ленты, как и HTML-страницы,
+отдают ETag и кэшируются до смены версии данных.
+"""
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_safe
+
+from core.db.routers import replica_reads
+from posts import feed
+from posts.cache import (
+    INDEX_SCOPE, cache_versioned, get_version, page_etag, profile_scope
+)
+from posts.models import Comment, Group, Post
+from posts.paginator import CursorPaginator
+from posts.views import feed_etag, post_etag
+
+from .serializers import (  # isort:skip
+    COMMENTS, GROUPS, POST_DETAIL, POSTS, InvalidFields
+)
+
+User = get_user_model()
+
+
+def json_response(data, status=200):
+    # Кириллица без \uXXXX и без пробелов: ответ заметно короче
+    return JsonResponse(
+        data,
+        status=status,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def api_view(view):
+    """Только GET и HEAD; ошибки — JSON, а не HTML-страница"""
+
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return json_response({"detail": "Не найдено"}, 404)
+        except InvalidFields as error:
+            return json_response({"detail": str(error)}, 400)
+
+    return wrapper
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({"detail": "Требуется вход"}, 401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def follow_etag(request):
+    # Лента меняется и от новых постов, и от подписок пользователя
+    return page_etag(
+        request,
+        get_version(INDEX_SCOPE),
+        get_version(profile_scope(request.user.username)),
+    )
+
+
+def _ordering_keys(queryset):
+    """Поля сортировки, по которым строится курсор страницы"""
+    opts = queryset.model._meta
+    ordering = queryset.query.order_by or opts.ordering
+    return [opts.get_field(name.lstrip("-")).attname for name in ordering]
+
+
+def _page_url(request, param, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop("after", None)
+    query.pop("before", None)
+    query[param] = cursor
+    return f"{request.path}?{query.urlencode()}"
+
+
+def _page(request, rows, transform=None):
+    paginator = CursorPaginator(
+        rows, settings.API_PAGE_SIZE, transform=transform
+    )
+    return paginator.get_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
+
+
+def _page_response(request, page, resource, names):
+    return json_response({
+        "results": resource.serialize(page.object_list, names),
+        "next": _page_url(request, "after", page.next_cursor),
+        "previous": _page_url(request, "before", page.previous_cursor),
+    })
+
+
+def _list(request, queryset, resource):
+    names = resource.select(request.GET.get("fields"))
+    rows = resource.values(queryset, names, _ordering_keys(queryset))
+    return _page_response(request, _page(request, rows), resource, names)
+
+
+@replica_reads
+@condition(etag_func=feed_etag)
+@cache_versioned(
+    settings.CACHE_TIMEOUT, key_prefix="api_posts", scope=INDEX_SCOPE
+)
+@api_view
+def posts(request):
+    return _list(request, Post.objects.all(), POSTS)
+
+
+@replica_reads
+@condition(etag_func=feed_etag)
+@cache_versioned(
+    settings.CACHE_TIMEOUT, key_prefix="api_group_posts", scope=INDEX_SCOPE
+)
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _list(request, Post.objects.filter(group=group), POSTS)
+
+
+@replica_reads
+@condition(etag_func=feed_etag)
+@cache_versioned(
+    settings.CACHE_TIMEOUT, key_prefix="api_user_posts", scope=INDEX_SCOPE
+)
+@api_view
+def user_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return _list(request, Post.objects.filter(author=author), POSTS)
+
+
+@replica_reads
+@condition(etag_func=feed_etag)
+@cache_versioned(
+    settings.CACHE_TIMEOUT, key_prefix="api_groups", scope=INDEX_SCOPE
+)
+@api_view
+def groups(request):
+    return _list(request, Group.objects.order_by("slug"), GROUPS)
+
+
+@replica_reads
+@condition(etag_func=post_etag)
+@api_view
+def post_detail(request, post_id):
+    names = POST_DETAIL.select(request.GET.get("fields"))
+    rows = list(POST_DETAIL.values(Post.objects.filter(pk=post_id), names))
+    if not rows:
+        raise Http404
+    return json_response(POST_DETAIL.serialize(rows, names)[0])
+
+
+# Без cache_versioned: новый комментарий не меняет версию
+# comments_scope (сбрасывается только HTML-блок первой страницы, см.
+# posts.signals), и кэш по версии отдавал бы первую страницу без него.
+# Повторные запросы дешевы и так: ETag учитывает comments_count, и 304
+# обходится одним запросом к базе.
+@replica_reads
+@condition(etag_func=post_etag)
+@api_view
+def comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    return _list(request, Comment.objects.filter(post_id=post_id), COMMENTS)
+
+
+def _feed_posts(names, rows):
+    """Посты страницы разложенной ленты одним запросом по id"""
+    ids = [row["post_id"] for row in rows]
+    # Порядок задает лента, сортировка в запросе не нужна
+    queryset = Post.objects.filter(pk__in=ids).order_by()
+    posts = {row["id"]: row for row in POSTS.values(queryset, names, ["id"])}
+    # Пост мог быть удален после раскладки ленты
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+@replica_reads
+@api_login_required
+@condition(etag_func=follow_etag)
+@api_view
+def follow(request):
+    names = POSTS.select(request.GET.get("fields"))
+    rows = feed.follow_posts(request.user).prefetch_related(None)
+    if rows.model is Post:
+        rows = POSTS.values(rows, names, _ordering_keys(rows))
+        page = _page(request, rows)
+    else:
+        rows = rows.values(*_ordering_keys(rows))
+        page = _page(request, rows, transform=partial(_feed_posts, names))
+    return _page_response(request, page, POSTS, names)
@@ -0,0 +1,7 @@
+"""Общий кэш для нескольких процессов и серверов.
+
+ShardedMemcachedCache раскладывает ключи по узлам с memcached-протоколом
+через консистентное хеширование, TwoLevelCache держит перед ним
+небольшой LRU в памяти процесса. CacheServer — локальная замена
+memcached для тестов и разработки.
+"""
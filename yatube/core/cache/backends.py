@@ -0,0 +1,139 @@
+import pickle
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+
+from . import client
+from .lru import LRUStore
+
+# Локальные LRU общие для всех потоков процесса, как у LocMemCache
+_local_stores = {}
+
+
+class ShardedMemcachedCache(BaseMemcachedCache):
+    """Кэш на нескольких узлах memcached-протокола.
+
+    LOCATION — список "host:port", ключ попадает на узел
+    по консистентному хешу, см. core.cache.hashring.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(
+            server,
+            params,
+            library=client,
+            value_not_found_exception=ValueError,
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        return self._cache.touch(key, self.get_backend_timeout(timeout)) != 0
+
+    def close(self, **kwargs):
+        # Соединения живут в клиенте потока между запросами
+        pass
+
+
+class TwoLevelCache(BaseCache):
+    """Локальный LRU процесса перед общим кэшем.
+
+    OPTIONS:
+        SHARED — алиас общего кэша в CACHES;
+        LOCAL_MAX_ENTRIES, LOCAL_MAX_BYTES — границы LRU;
+        LOCAL_TIMEOUT — сколько секунд запись живет локально. Изменения
+        из других процессов становятся видны не позже этого срока, поэтому
+        он должен быть коротким.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options["SHARED"]
+        self.local_timeout = options.get("LOCAL_TIMEOUT", 2)
+        self._local = _local_stores.setdefault(
+            name,
+            LRUStore(
+                options.get("LOCAL_MAX_ENTRIES", 1000),
+                options.get("LOCAL_MAX_BYTES", 16 * 1024 * 1024),
+            ),
+        )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._local.set(key, data, self._local_timeout(timeout))
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version)
+        data = self._local.get(local_key)
+        if data is not None:
+            return pickle.loads(data)
+        value = self.shared.get(key, version=version)
+        if value is None:
+            return default
+        self._remember(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            data = self._local.get(self.make_key(key, version))
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(data)
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self._remember(self.make_key(key, version), value)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(self.make_key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Блокировки строятся на add, поэтому решает только общий кэш
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local.delete(self.make_key(key, version))
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local.delete(self.make_key(key, version))
+        self.shared.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self._remember(self.make_key(key, version), value)
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
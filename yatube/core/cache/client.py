@@ -0,0 +1,194 @@
+"""Клиент memcached-протокола с шардированием ключей по узлам.
+
+Повторяет интерфейс python-memcached, чтобы его можно было передать
+в django.core.cache.backends.memcached.BaseMemcachedCache как library.
+Ошибка узла не роняет запрос: чтение дает промах, запись — False.
+"""
+import pickle
+import socket
+from collections import defaultdict
+
+from .hashring import HashRing
+
+FLAG_PICKLE = 1
+FLAG_INT = 2
+
+
+class Connection:
+    def __init__(self, server, socket_timeout):
+        host, port = server.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.socket_timeout = socket_timeout
+        self._socket = None
+        self._file = None
+
+    def _connect(self):
+        if self._socket is None:
+            self._socket = socket.create_connection(
+                self.address, self.socket_timeout
+            )
+            self._file = self._socket.makefile("rb")
+
+    def close(self):
+        if self._socket is not None:
+            try:
+                self._file.close()
+                self._socket.close()
+            finally:
+                self._socket = None
+                self._file = None
+
+    def send(self, data):
+        self._connect()
+        self._socket.sendall(data)
+
+    def readline(self):
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        return line.rstrip(b"\r\n")
+
+    def read(self, size):
+        data = self._file.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("Connection closed by server")
+        return data[:-2]
+
+
+def _encode(value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return FLAG_INT, str(value).encode()
+    return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(flags, data):
+    if flags == FLAG_INT:
+        return int(data)
+    return pickle.loads(data)
+
+
+class Client:
+    def __init__(self, servers, replicas=160, socket_timeout=1.0):
+        self._ring = HashRing(servers, replicas)
+        self._connections = {
+            server: Connection(server, socket_timeout) for server in servers
+        }
+
+    def _connection(self, key):
+        return self._connections[self._ring.get_node(key)]
+
+    def _call(self, key, handler, default):
+        connection = self._connection(key)
+        try:
+            return handler(connection)
+        except (OSError, ValueError):
+            # После неожиданного ответа неизвестно, где в потоке
+            # начинается следующий: соединение открывается заново
+            connection.close()
+            return default
+
+    def _read_values(self, connection):
+        values = {}
+        while True:
+            line = connection.readline()
+            if line == b"END":
+                return values
+            _, key, flags, size = line.split()
+            data = connection.read(int(size))
+            values[key.decode()] = _decode(int(flags), data)
+
+    def _store(self, command, key, value, timeout):
+        flags, data = _encode(value)
+
+        def handler(connection):
+            connection.send(
+                b"%s %s %d %d %d\r\n%s\r\n"
+                % (command, key.encode(), flags, timeout, len(data), data)
+            )
+            return connection.readline() == b"STORED"
+
+        return self._call(key, handler, False)
+
+    def get(self, key):
+        def handler(connection):
+            connection.send(b"get %s\r\n" % key.encode())
+            return self._read_values(connection).get(key)
+
+        return self._call(key, handler, None)
+
+    def get_multi(self, keys):
+        by_server = defaultdict(list)
+        for key in keys:
+            by_server[self._ring.get_node(key)].append(key)
+
+        values = {}
+        for server, server_keys in by_server.items():
+            connection = self._connections[server]
+            try:
+                connection.send(
+                    b"get %s\r\n" % b" ".join(k.encode() for k in server_keys)
+                )
+                values.update(self._read_values(connection))
+            except (OSError, ValueError):
+                connection.close()
+        return values
+
+    def set(self, key, value, timeout=0):
+        return self._store(b"set", key, value, timeout)
+
+    def add(self, key, value, timeout=0):
+        return self._store(b"add", key, value, timeout)
+
+    def set_multi(self, mapping, timeout=0):
+        return [
+            key for key, value in mapping.items()
+            if not self.set(key, value, timeout)
+        ]
+
+    def delete(self, key):
+        def handler(connection):
+            connection.send(b"delete %s\r\n" % key.encode())
+            return connection.readline() == b"DELETED"
+
+        return self._call(key, handler, False)
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def touch(self, key, timeout=0):
+        def handler(connection):
+            connection.send(b"touch %s %d\r\n" % (key.encode(), timeout))
+            return int(connection.readline() == b"TOUCHED")
+
+        return self._call(key, handler, 0)
+
+    def _counter(self, command, key, delta):
+        def handler(connection):
+            connection.send(b"%s %s %d\r\n" % (command, key.encode(), delta))
+            line = connection.readline()
+            if line == b"NOT_FOUND":
+                return None
+            if not line.isdigit():
+                raise ValueError(line.decode())
+            return int(line)
+
+        return self._call(key, handler, None)
+
+    def incr(self, key, delta=1):
+        return self._counter(b"incr", key, delta)
+
+    def decr(self, key, delta=1):
+        return self._counter(b"decr", key, delta)
+
+    def flush_all(self):
+        for connection in self._connections.values():
+            try:
+                connection.send(b"flush_all\r\n")
+                connection.readline()
+            except OSError:
+                connection.close()
+
+    def disconnect_all(self):
+        for connection in self._connections.values():
+            connection.close()
@@ -0,0 +1,41 @@
+import hashlib
+from bisect import bisect
+
+
+def _hash(value):
+    digest = hashlib.md5(value.encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+class HashRing:
+    """Консистентное хеширование с виртуальными узлами.
+
+    При добавлении или удалении узла переезжает только ~1/N ключей.
+    """
+
+    def __init__(self, nodes, replicas=160):
+        self.replicas = replicas
+        self._ring = {}
+        self._points = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            self._ring[_hash(f"{node}#{i}")] = node
+        self._points = sorted(self._ring)
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            self._ring.pop(_hash(f"{node}#{i}"), None)
+        self._points = sorted(self._ring)
+
+    def get_node(self, key):
+        if not self._points:
+            raise LookupError("Hash ring is empty")
+        index = bisect(self._points, _hash(key)) % len(self._points)
+        return self._ring[self._points[index]]
+
+    @property
+    def nodes(self):
+        return set(self._ring.values())
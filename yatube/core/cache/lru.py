@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUStore:
+    """LRU в памяти процесса с ограничением по числу записей и байтам.
+
+    Значения хранятся сериализованными, поэтому их размер известен,
+    а изменение полученного объекта не меняет закэшированную копию.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            data, expires = item
+            if expires is not None and expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._items.move_to_end(key)
+            return data
+
+    def set(self, key, data, timeout):
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._pop(key)
+            if len(data) > self.max_bytes:
+                return
+            self._items[key] = (data, expires)
+            self.size += len(data)
+            while (
+                len(self._items) > self.max_entries
+                or self.size > self.max_bytes
+            ):
+                self._pop(next(iter(self._items)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= len(item[0])
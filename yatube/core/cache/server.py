@@ -0,0 +1,165 @@
+import socketserver
+import threading
+import time
+
+# Срок больше 30 дней memcached считает абсолютным unix-временем
+RELATIVE_TIMEOUT_LIMIT = 60 * 60 * 24 * 30
+
+
+class _Storage:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}
+
+    @staticmethod
+    def expires_at(timeout):
+        if timeout == 0:
+            return None
+        if timeout < 0:
+            return 0
+        if timeout > RELATIVE_TIMEOUT_LIMIT:
+            return timeout
+        return time.time() + timeout
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        flags, data, expires = item
+        if expires is not None and expires <= time.time():
+            del self.items[key]
+            return None
+        return item
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Команды, за строкой которых идет блок данных
+    with_data = ("set", "add")
+
+    def handle(self):
+        try:
+            self._serve(self.server.storage)
+        except ConnectionResetError:
+            # Клиент сбрасывает соединение, не дочитав ответ, после
+            # ошибки разбора — для сервера это обычное отключение
+            pass
+
+    def _serve(self, storage):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                continue
+            command, args = parts[0].decode(), parts[1:]
+            handler = getattr(self, f"do_{command}", None)
+            if handler is None:
+                self.wfile.write(b"ERROR\r\n")
+                continue
+            # Данные читаются из сокета до блокировки: медленный клиент
+            # не должен задерживать остальные соединения
+            if command in self.with_data:
+                args.append(self._read_data(args[-1]))
+            with storage.lock:
+                reply = handler(storage, *args)
+            self.wfile.write(reply)
+
+    def _read_data(self, size):
+        return self.rfile.read(int(size) + 2)[:-2]
+
+    def _store(self, storage, key, flags, timeout, data, only_new=False):
+        if only_new and storage.get(key) is not None:
+            return b"NOT_STORED\r\n"
+        storage.items[key] = (
+            int(flags), data, storage.expires_at(int(timeout))
+        )
+        return b"STORED\r\n"
+
+    def do_get(self, storage, *keys):
+        reply = []
+        for key in keys:
+            item = storage.get(key)
+            if item is not None:
+                flags, data, _ = item
+                reply.append(
+                    b"VALUE %s %d %d\r\n%s\r\n" % (key, flags, len(data), data)
+                )
+        reply.append(b"END\r\n")
+        return b"".join(reply)
+
+    def do_set(self, storage, key, flags, timeout, size, data):
+        return self._store(storage, key, flags, timeout, data)
+
+    def do_add(self, storage, key, flags, timeout, size, data):
+        return self._store(storage, key, flags, timeout, data, only_new=True)
+
+    def do_delete(self, storage, key):
+        if storage.get(key) is None:
+            return b"NOT_FOUND\r\n"
+        del storage.items[key]
+        return b"DELETED\r\n"
+
+    def do_touch(self, storage, key, timeout):
+        item = storage.get(key)
+        if item is None:
+            return b"NOT_FOUND\r\n"
+        flags, data, _ = item
+        storage.items[key] = (flags, data, storage.expires_at(int(timeout)))
+        return b"TOUCHED\r\n"
+
+    def _counter(self, storage, key, delta):
+        item = storage.get(key)
+        if item is None:
+            return b"NOT_FOUND\r\n"
+        flags, data, expires = item
+        if not data.isdigit():
+            return (
+                b"CLIENT_ERROR cannot increment or decrement "
+                b"non-numeric value\r\n"
+            )
+        value = max(int(data) + delta, 0)
+        storage.items[key] = (flags, str(value).encode(), expires)
+        return b"%d\r\n" % value
+
+    def do_incr(self, storage, key, delta):
+        return self._counter(storage, key, int(delta))
+
+    def do_decr(self, storage, key, delta):
+        return self._counter(storage, key, -int(delta))
+
+    def do_flush_all(self, storage, *args):
+        storage.items.clear()
+        return b"OK\r\n"
+
+
+class CacheServer(socketserver.ThreadingTCPServer):
+    """Минимальный сервер memcached-протокола в памяти процесса.
+
+    Понимает get, set, add, delete, touch, incr, decr и flush_all —
+    ровно то, что использует core.cache.client.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.storage = _Storage()
+        self._thread = None
+
+    @property
+    def location(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
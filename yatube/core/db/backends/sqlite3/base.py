@@ -0,0 +1,70 @@
+"""SQLite для рабочего сервера.
+
+При подключении включает WAL — читатели не ждут писателя, — и остальные
+PRAGMA из DEFAULT_PRAGMAS; их можно переопределить в OPTIONS["PRAGMAS"].
+Транзакции начинаются с BEGIN IMMEDIATE: запись берет блокировку сразу
+и ждет ее по busy_timeout, а не падает с "database is locked", когда
+читающая транзакция пытается стать пишущей. Соединения только для
+чтения (PRAGMA query_only, реплики) начинают транзакции с BEGIN
+DEFERRED: блокировка записи им не нужна, а с ней они мешали бы
+обновлению файла реплики.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    # В WAL при NORMAL фиксация не ждет fsync, база остается целой
+    "synchronous": "NORMAL",
+    # Отрицательное значение — в КиБ: 64 МиБ страниц на соединение
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+def apply_pragmas(conn, pragmas):
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Ключи OPTIONS этого бэкенда не передаются в sqlite3.connect
+        params.pop("PRAGMAS", None)
+        params.pop("TRANSACTION_MODE", None)
+        return params
+
+    @property
+    def pragmas(self):
+        options = self.settings_dict["OPTIONS"]
+        pragmas = {**DEFAULT_PRAGMAS, **options.get("PRAGMAS", {})}
+        if self.is_in_memory_db():
+            # WAL и mmap для базы в памяти не имеют смысла
+            pragmas.pop("journal_mode", None)
+            pragmas.pop("mmap_size", None)
+        return pragmas
+
+    @property
+    def read_only(self):
+        return bool(int(self.pragmas.get("query_only", 0)))
+
+    @property
+    def transaction_mode(self):
+        default = "DEFERRED" if self.read_only else "IMMEDIATE"
+        mode = self.settings_dict["OPTIONS"].get(
+            "TRANSACTION_MODE", default
+        ).upper()
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f"Unknown SQLite transaction mode: {mode}")
+        return mode
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
@@ -0,0 +1,159 @@
+"""Нагрузочный тест SQLite: параллельные чтения и записи комментариев.
+
+Профиль "default" повторяет прежнюю настройку: журнал отката, новое
+соединение на каждую операцию, как при CONN_MAX_AGE = 0. Профиль
+"tuned" — PRAGMA core.db.backends.sqlite3 и постоянное соединение
+у каждого потока.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from .backends.sqlite3.base import DEFAULT_PRAGMAS, apply_pragmas
+
+PROFILES = {
+    "default": {
+        "pragmas": {"journal_mode": "DELETE", "synchronous": "FULL"},
+        "persistent": False,
+        "begin": "BEGIN",
+    },
+    "tuned": {
+        "pragmas": DEFAULT_PRAGMAS,
+        "persistent": True,
+        "begin": "BEGIN IMMEDIATE",
+    },
+}
+SCHEMA = """
+CREATE TABLE comment (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX comment_post_created ON comment (post_id, created DESC, id DESC);
+CREATE TABLE post (
+    id INTEGER PRIMARY KEY,
+    comments_count INTEGER NOT NULL
+);
+"""
+POSTS = 100
+
+
+def prepare(path, rows):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO post (id, comments_count) VALUES (?, 0)",
+        ((i,) for i in range(POSTS)),
+    )
+    conn.executemany(
+        "INSERT INTO comment (post_id, text, created) VALUES (?, ?, ?)",
+        ((i % POSTS, "x" * 200, i) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class Worker(threading.Thread):
+    def __init__(self, path, profile, write, deadline, stats, n):
+        super().__init__(daemon=True)
+        self.path = path
+        self.profile = profile
+        self.write = write
+        self.deadline = deadline
+        self.stats = stats
+        self.n = n
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            # Ждем блокировку, как Django по умолчанию: до 5 секунд
+            self.conn = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None,
+                check_same_thread=False,
+            )
+            apply_pragmas(self.conn, self.profile["pragmas"])
+        return self.conn
+
+    def disconnect(self):
+        if self.conn is not None and not self.profile["persistent"]:
+            self.conn.close()
+            self.conn = None
+
+    def read(self, conn, post_id):
+        conn.execute(
+            "SELECT id, text, created FROM comment WHERE post_id = ? "
+            "ORDER BY created DESC, id DESC LIMIT 20",
+            (post_id,),
+        ).fetchall()
+
+    def write_comment(self, conn, post_id):
+        # Как add_comment: комментарий и счетчик поста одной транзакцией
+        conn.execute(self.profile["begin"])
+        try:
+            conn.execute(
+                "INSERT INTO comment (post_id, text, created) "
+                "VALUES (?, ?, ?)",
+                (post_id, "y" * 200, time.time()),
+            )
+            conn.execute(
+                "UPDATE post SET comments_count = comments_count + 1 "
+                "WHERE id = ?",
+                (post_id,),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def run(self):
+        done = Counter()
+        i = self.n
+        while time.monotonic() < self.deadline:
+            i += 1
+            post_id = i % POSTS
+            try:
+                conn = self.connect()
+                if self.write:
+                    self.write_comment(conn, post_id)
+                    done["writes"] += 1
+                else:
+                    self.read(conn, post_id)
+                    done["reads"] += 1
+            except sqlite3.OperationalError:
+                done["errors"] += 1
+            finally:
+                self.disconnect()
+        if self.conn is not None:
+            self.conn.close()
+        self.stats.append(done)
+
+
+def run(path, profile, readers=8, writers=4, duration=5.0, rows=10000):
+    """Операций в секунду за duration секунд на свежей базе path"""
+    prepare(path, rows)
+    stats = []
+    deadline = time.monotonic() + duration
+    workers = [
+        Worker(path, PROFILES[profile], n < writers, deadline, stats, n)
+        for n in range(readers + writers)
+    ]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+
+    total = sum(stats, Counter())
+    return {
+        "profile": profile,
+        "reads_per_sec": total["reads"] / elapsed,
+        "writes_per_sec": total["writes"] / elapsed,
+        "errors": total["errors"],
+    }
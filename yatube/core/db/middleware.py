@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+
+from . import routers
+
+
+class PrimaryPinMiddleware:
+    """Закрепляет пользователя за основной базой после его записи.
+
+    Срок закрепления хранится в cookie, поэтому работает между
+    воркерами и серверами без общего состояния.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        cookie = settings.REPLICA_PIN_COOKIE
+        try:
+            pinned_until = float(request.COOKIES.get(cookie, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            routers.pin()
+
+        response = self.get_response(request)
+
+        if routers.wrote() and settings.DATABASE_REPLICAS:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                cookie,
+                str(time.time() + seconds),
+                max_age=seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        routers.reset()
+        return response
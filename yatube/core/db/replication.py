@@ -0,0 +1,33 @@
+"""Синхронизация реплик SQLite с основной базой.
+
+Для разработки и тестов: реплика — файл, в который online backup API
+SQLite копирует основную базу целиком. Читатели реплики во время
+копирования видят прежний согласованный снимок.
+"""
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+from .routers import PRIMARY
+
+
+def backup(source, path):
+    """Копирует открытую базу source (соединение sqlite3) в файл path"""
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
+
+def sync(replica, source=PRIMARY):
+    """Копирует базу source в файл реплики replica"""
+    primary = connections[source]
+    primary.ensure_connection()
+    backup(primary.connection, connections[replica].settings_dict["NAME"])
+
+
+def sync_all():
+    for replica in settings.DATABASE_REPLICAS:
+        sync(replica)
@@ -0,0 +1,134 @@
+"""Чтение с реплик, запись в основную базу.
+
+С реплик читают только views, обернутые в replica_reads, и только пока
+в запросе не было записи. После записи пользователь на время
+REPLICA_PIN_SECONDS закрепляется за основной базой
+(см. core.db.middleware), чтобы видеть свои изменения сразу,
+а не после синхронизации реплики.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+from . import sharding
+
+PRIMARY = sharding.PRIMARY
+
+_state = threading.local()
+
+
+def reset():
+    _state.replica = None
+    _state.pinned = False
+    _state.wrote = False
+
+
+def pin():
+    _state.pinned = True
+
+
+def wrote():
+    """Была ли в текущем запросе запись"""
+    return getattr(_state, "wrote", False)
+
+
+def replica_reads(view):
+    """Разрешает view читать с реплик.
+
+    Реплика выбирается одна на запрос: реплики отстают по-разному,
+    и запросы одной страницы к разным репликам видели бы разные
+    состояния данных.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        previous = getattr(_state, "replica", None)
+        replicas = settings.DATABASE_REPLICAS
+        if previous is None and replicas:
+            _state.replica = random.choice(replicas)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = previous
+
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Читать из основной базы, например, чтобы не положить в кэш
+    страницу с отстающей реплики"""
+    previous = getattr(_state, "replica", None)
+    _state.replica = None
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, "replica", None)
+        if (
+            replica in settings.DATABASE_REPLICAS
+            and not getattr(_state, "pinned", False)
+            and not wrote()
+        ):
+            return replica
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплики получают вместе с данными при синхронизации
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ShardRouter:
+    """Выбирает шард для моделей с shard_by по подсказке instance.
+
+    Подсказку дают сохранение и удаление объекта, связанные менеджеры
+    (user.posts, post.comment) и обращение по внешнему ключу
+    (comment.post). Запросы без подсказки ShardedManager сам
+    направляет на нужные шарды; для остальных моделей решает
+    следующий роутер.
+    """
+
+    def _db(self, model, instance):
+        if instance is None or not sharding.enabled():
+            return None
+        if not sharding.is_sharded(model):
+            return None
+        if isinstance(instance, model):
+            return sharding.shard_of(instance)
+        # Связанный менеджер по ключу шардирования: user.posts
+        key = model._meta.get_field(model.shard_by)
+        if isinstance(instance, key.related_model):
+            if sharding.is_sharded(key.related_model):
+                return sharding.shard_of(instance)
+            return sharding.shard_for_key(instance.pk)
+        # Внешний ключ на шардированную модель: comment.post, item.post
+        for field in instance._meta.concrete_fields:
+            if field.is_relation and field.related_model is model:
+                pk = getattr(instance, field.attname)
+                if pk is not None:
+                    return sharding.shard_for_pk(pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        db = self._db(model, hints.get("instance"))
+        if db is not None:
+            _state.wrote = True
+        return db
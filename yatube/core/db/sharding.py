@@ -0,0 +1,473 @@
+"""Горизонтальное шардирование моделей по ключу.
+
+Модель с атрибутом shard_by (имя внешнего ключа) хранится на базах
+из DATABASE_SHARDS: строка лежит на шарде значения ключа по модулю
+числа шардов, а если ключ ссылается на шардированную модель — рядом
+с родительской строкой. id выдает общая последовательность в основной
+базе, и номер шарда зашит в младших разрядах id, поэтому строку можно
+найти по одному первичному ключу.
+
+Менеджер ShardedManager сам сужает запрос до одного шарда, если
+фильтр задает первичный ключ или ключ шардирования; остальные
+запросы выполняются на всех шардах и сливаются ShardedQuerySet
+в один упорядоченный поток. Связи с моделями основной базы
+загружаются через prefetch_related: JOIN между базами невозможен.
+"""
+import heapq
+from functools import total_ordering
+from itertools import islice
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, prefetch_related_objects
+from django.db.models.expressions import OrderBy
+
+PRIMARY = "default"
+# Сколько шардов можно задать, не меняя уже выданные id
+SHARD_SLOTS = 64
+
+
+def shards():
+    return settings.DATABASE_SHARDS
+
+
+def enabled():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def is_sharded(model):
+    return getattr(model, "shard_by", None) is not None
+
+
+def shard_for_key(key):
+    aliases = shards()
+    return aliases[int(key) % len(aliases)]
+
+
+def shard_for_pk(pk):
+    """Шард строки по ее id; None, если такого шарда нет"""
+    try:
+        index = int(pk) % SHARD_SLOTS
+    except (TypeError, ValueError):
+        return None
+    aliases = shards()
+    return aliases[index] if index < len(aliases) else None
+
+
+def shard_of(instance):
+    """Шард, на котором лежит или будет лежать строка"""
+    if instance._state.db in shards():
+        return instance._state.db
+    if instance.pk is not None:
+        return shard_for_pk(instance.pk)
+    field = instance._meta.get_field(instance.shard_by)
+    key = getattr(instance, field.attname)
+    if is_sharded(field.related_model):
+        return shard_for_pk(key)
+    return shard_for_key(key)
+
+
+def databases(model):
+    """Базы, на которых лежат строки модели"""
+    if enabled() and is_sharded(model):
+        return list(shards())
+    return [PRIMARY]
+
+
+def allocate_ids(model, shard, count=1):
+    """count новых id модели для строк шарда shard"""
+    from core.models import IdSequence
+
+    name = model._meta.label_lower
+    with transaction.atomic(using=PRIMARY):
+        sequence = IdSequence.objects.using(PRIMARY)
+        if not sequence.filter(name=name).update(value=F("value") + count):
+            sequence.create(name=name, value=count)
+        last = sequence.filter(name=name).values_list(
+            "value", flat=True
+        ).get()
+    index = shards().index(shard)
+    return [
+        ticket * SHARD_SLOTS + index
+        for ticket in range(last - count + 1, last + 1)
+    ]
+
+
+def assign_shards(model, objs):
+    """Раскладывает строки по шардам и выдает id новым:
+    {шард: строки}"""
+    by_shard = {}
+    for obj in objs:
+        by_shard.setdefault(shard_of(obj), []).append(obj)
+    for alias, group in by_shard.items():
+        new = [obj for obj in group if obj.pk is None]
+        ids = allocate_ids(model, alias, len(new)) if new else []
+        for obj, pk in zip(new, ids):
+            obj.pk = pk
+    return by_shard
+
+
+class ShardedModel(models.Model):
+    """Модель, строки которой раскладываются по шардам.
+
+    shard_by — внешний ключ, по которому выбирается шард.
+    """
+
+    shard_by = None
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self.pk is None and enabled():
+            shard = kwargs.get("using")
+            if shard not in shards():
+                shard = shard_of(self)
+            self.pk = allocate_ids(type(self), shard)[0]
+            kwargs.update(using=shard, force_insert=True)
+        super().save(*args, **kwargs)
+
+
+class CrossShardForeignKey(models.ForeignKey):
+    """Внешний ключ, концы которого могут оказаться в разных базах.
+
+    Ограничение FOREIGN KEY создается, только пока шардирование
+    выключено: проверяется при migrate, поэтому в миграциях поле
+    одинаково при любых DATABASE_SHARDS.
+    """
+
+    @property
+    def db_constraint(self):
+        return not enabled()
+
+    @db_constraint.setter
+    def db_constraint(self, value):
+        if not value:
+            raise ValueError(
+                "CrossShardForeignKey сам выбирает db_constraint"
+            )
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop("db_constraint", None)
+        return name, path, args, kwargs
+
+
+def _shard_filters(model, kwargs):
+    """Шарды, которыми ограничивает выборку фильтр по id или по ключу
+    шардирования; None — ограничения нет"""
+    field = model._meta.get_field(model.shard_by)
+    by_pk = {"pk", "pk__exact", model._meta.pk.name}
+    by_key = {
+        model.shard_by,
+        f"{model.shard_by}__exact",
+        f"{model.shard_by}__pk",
+        field.attname,
+    }
+    for name, value in kwargs.items():
+        if isinstance(value, models.Model):
+            value = value.pk
+        if name in by_pk:
+            return {shard_for_pk(value)} - {None}
+        if name in ("pk__in", f"{model._meta.pk.name}__in") and isinstance(
+            value, (list, tuple, set, frozenset)
+        ):
+            return {shard_for_pk(pk) for pk in value} - {None}
+        if name in by_key:
+            if is_sharded(field.related_model):
+                return {shard_for_pk(value)} - {None}
+            return {shard_for_key(value)}
+    return None
+
+
+def _order_keys(queryset):
+    """Атрибуты и направления сортировки queryset"""
+    query = queryset.query
+    ordering = query.order_by or (
+        queryset.model._meta.ordering if query.default_ordering else ()
+    )
+    keys = []
+    for item in ordering:
+        if isinstance(item, OrderBy):
+            name, descending = item.expression.name, item.descending
+        elif isinstance(item, F):
+            name, descending = item.name, False
+        else:
+            name, descending = item.lstrip("-"), item.startswith("-")
+        if name == "pk":
+            name = queryset.model._meta.pk.name
+        if name not in query.annotations:
+            name = queryset.model._meta.get_field(name).attname
+        keys.append((name, descending))
+    return keys
+
+
+def merge_ordered(queryset, streams):
+    """k-путевое слияние потоков строк, каждый из которых уже
+    упорядочен по сортировке queryset"""
+    keys = _order_keys(queryset)
+    if not keys:
+        for stream in streams:
+            yield from stream
+        return
+    names = [name for name, _ in keys]
+    directions = [descending for _, descending in keys]
+
+    def key(row):
+        if isinstance(row, dict):
+            return _MergeKey([row[name] for name in names], directions)
+        return _MergeKey([getattr(row, name) for name in names], directions)
+
+    yield from heapq.merge(*streams, key=key)
+
+
+@total_ordering
+class _MergeKey:
+    def __init__(self, values, directions):
+        self.values = values
+        self.directions = directions
+
+    def __eq__(self, other):
+        return self.values == other.values
+
+    def __lt__(self, other):
+        for mine, theirs, descending in zip(
+            self.values, other.values, self.directions
+        ):
+            if mine != theirs:
+                return (mine > theirs) if descending else (mine < theirs)
+        return False
+
+
+class ShardedQuerySet:
+    """Один и тот же запрос на нескольких шардах.
+
+    Цепочки методов QuerySet применяются к запросу каждого шарда,
+    а результаты сливаются k-путевым слиянием по сортировке запроса:
+    каждый шард уже отдает строки по порядку, поэтому срез [a:b]
+    читает с шарда не больше b строк.
+    """
+
+    def __init__(self, model, querysets, prefetch=()):
+        self.model = model
+        self._querysets = querysets
+        self._prefetch = tuple(prefetch)
+
+    def __repr__(self):
+        return f"<ShardedQuerySet {list(self._querysets)} {self.model}>"
+
+    # Построение запроса
+
+    def _clone(self, querysets):
+        prefetch = list(self._prefetch)
+        result = {}
+        for alias, queryset in querysets.items():
+            # prefetch_related выполняется один раз после слияния,
+            # а не на каждом шарде
+            prefetch.extend(queryset._prefetch_related_lookups)
+            result[alias] = queryset.prefetch_related(None)
+        if len(result) == 1 and not prefetch:
+            return next(iter(result.values()))
+        if len(result) == 1:
+            return next(iter(result.values())).prefetch_related(*prefetch)
+        return ShardedQuerySet(self.model, result, dict.fromkeys(prefetch))
+
+    def _apply(self, name, *args, **kwargs):
+        return self._clone({
+            alias: getattr(queryset, name)(*args, **kwargs)
+            for alias, queryset in self._querysets.items()
+        })
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(next(iter(self._querysets.values())), name)
+        if not callable(attr):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            results = {
+                alias: getattr(queryset, name)(*args, **kwargs)
+                for alias, queryset in self._querysets.items()
+            }
+            if not all(
+                isinstance(result, models.QuerySet)
+                for result in results.values()
+            ):
+                raise TypeError(f"{name}() is not supported across shards")
+            return self._clone(results)
+
+        return method
+
+    @property
+    def query(self):
+        return next(iter(self._querysets.values())).query
+
+    @property
+    def ordered(self):
+        return next(iter(self._querysets.values())).ordered
+
+    def filter(self, *args, **kwargs):
+        aliases = _shard_filters(self.model, kwargs)
+        querysets = self._querysets
+        if aliases is not None:
+            querysets = {
+                alias: queryset for alias, queryset in querysets.items()
+                if alias in aliases
+            }
+            if not querysets:
+                return self.none()
+        return self._clone({
+            alias: queryset.filter(*args, **kwargs)
+            for alias, queryset in querysets.items()
+        })
+
+    def prefetch_related(self, *lookups):
+        if lookups == (None,):
+            return ShardedQuerySet(self.model, self._querysets)._clone(
+                self._querysets
+            )
+        return self._apply("prefetch_related", *lookups)
+
+    def none(self):
+        alias, queryset = next(iter(self._querysets.items()))
+        return queryset.none()
+
+    def using(self, alias):
+        queryset = self._querysets.get(alias)
+        if queryset is None:
+            queryset = next(iter(self._querysets.values()))
+        return queryset.using(alias).prefetch_related(*self._prefetch)
+
+    # Выполнение
+
+    def _merge(self, querysets):
+        return merge_ordered(
+            next(iter(self._querysets.values())),
+            [queryset.iterator() for queryset in querysets],
+        )
+
+    def _fetch(self, rows):
+        rows = list(rows)
+        if self._prefetch and rows and isinstance(rows[0], models.Model):
+            prefetch_related_objects(rows, *self._prefetch)
+        return rows
+
+    def __iter__(self):
+        return iter(self._fetch(self._merge(self._querysets.values())))
+
+    def iterator(self, chunk_size=2000):
+        return self._merge(self._querysets.values())
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __bool__(self):
+        return self.exists()
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            rows = self[key:key + 1]
+            if not rows:
+                raise IndexError("ShardedQuerySet index out of range")
+            return rows[0]
+        start, stop = key.start or 0, key.stop
+        if key.step or start < 0 or (stop is not None and stop < 0):
+            raise ValueError("Only forward slices are supported")
+        querysets = self._querysets.values()
+        if stop is not None:
+            querysets = [queryset[:stop] for queryset in querysets]
+        return self._fetch(islice(self._merge(querysets), start, stop))
+
+    def count(self):
+        return sum(
+            queryset.count() for queryset in self._querysets.values()
+        )
+
+    def exists(self):
+        return any(
+            queryset.exists() for queryset in self._querysets.values()
+        )
+
+    def get(self, *args, **kwargs):
+        queryset = self.filter(*args, **kwargs)
+        if not isinstance(queryset, ShardedQuerySet):
+            return queryset.get()
+        rows = queryset[:2]
+        if not rows:
+            raise self.model.DoesNotExist(
+                f"{self.model._meta.object_name} matching query "
+                "does not exist."
+            )
+        if len(rows) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f"get() returned more than one "
+                f"{self.model._meta.object_name}"
+            )
+        return rows[0]
+
+    def first(self):
+        queryset = self if self.ordered else self.order_by("pk")
+        rows = queryset[:1]
+        return rows[0] if rows else None
+
+    def in_bulk(self, id_list):
+        by_shard = {}
+        for pk in id_list:
+            alias = shard_for_pk(pk)
+            if alias in self._querysets:
+                by_shard.setdefault(alias, []).append(pk)
+        objects = {}
+        for alias, ids in by_shard.items():
+            objects.update(self._querysets[alias].in_bulk(ids))
+        if self._prefetch and objects:
+            prefetch_related_objects(list(objects.values()), *self._prefetch)
+        return objects
+
+    def update(self, **kwargs):
+        return sum(
+            queryset.update(**kwargs)
+            for queryset in self._querysets.values()
+        )
+
+    def delete(self):
+        deleted, rows = 0, {}
+        for queryset in self._querysets.values():
+            count, per_model = queryset.delete()
+            deleted += count
+            for label, value in per_model.items():
+                rows[label] = rows.get(label, 0) + value
+        return deleted, rows
+
+    def create(self, **kwargs):
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for alias, group in assign_shards(self.model, objs).items():
+            self.model._default_manager.db_manager(alias).bulk_create(
+                group, *args, **kwargs
+            )
+        return objs
+
+
+class ShardedManager(models.Manager):
+    """Менеджер шардированной модели: без шардов — обычный, с шардами
+    выдает ShardedQuerySet по всем шардам"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Связанные менеджеры (user.posts) и db_manager() выбирают базу
+        # сами — через подсказки роутеру или явно
+        if (
+            not enabled()
+            or self._db
+            or getattr(self, "instance", None) is not None
+        ):
+            return queryset
+        return ShardedQuerySet(
+            self.model,
+            {alias: queryset.using(alias) for alias in shards()},
+        )
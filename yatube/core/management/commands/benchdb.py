@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from core.db import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность SQLite с прежней настройкой "
+        "и с профилем core.db.backends.sqlite3 при параллельных "
+        "чтениях и записях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument(
+            "--duration", type=float, default=5.0,
+            help="Секунд на каждый профиль",
+        )
+        parser.add_argument(
+            "--rows", type=int, default=10000,
+            help="Комментариев в базе перед началом",
+        )
+        parser.add_argument(
+            "--path",
+            help="Файл базы для теста, по умолчанию во временном каталоге",
+        )
+
+    def handle(self, *args, **options):
+        path, tmp = options["path"], None
+        if path is None:
+            tmp = tempfile.mkdtemp()
+            path = os.path.join(tmp, "bench.sqlite3")
+        try:
+            results = self.run(path, options)
+        finally:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+        before, after = results["default"], results["tuned"]
+        for kind in ("reads_per_sec", "writes_per_sec"):
+            if before[kind]:
+                self.stdout.write(
+                    f"{kind}: x{after[kind] / before[kind]:.1f}"
+                )
+
+    def run(self, path, options):
+        results = {}
+        for profile in bench.PROFILES:
+            result = bench.run(
+                path,
+                profile,
+                readers=options["readers"],
+                writers=options["writers"],
+                duration=options["duration"],
+                rows=options["rows"],
+            )
+            results[profile] = result
+            self.stdout.write(
+                "{profile:>8}: {reads_per_sec:10.0f} reads/s "
+                "{writes_per_sec:8.0f} writes/s {errors:6d} errors".format(
+                    **result
+                )
+            )
+        return results
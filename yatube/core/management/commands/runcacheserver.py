@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core.cache.server import CacheServer
+
+
+class Command(BaseCommand):
+    help = "Запускает локальный сервер memcached-протокола для разработки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=11211)
+
+    def handle(self, *args, **options):
+        server = CacheServer(options["host"], options["port"])
+        self.stdout.write(f"Cache server listening on {server.location}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import replication
+
+
+class Command(BaseCommand):
+    help = "Копирует основную базу SQLite в файлы реплик"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Повторять каждые N секунд, пока не прервут",
+        )
+
+    def handle(self, *args, interval=None, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("DATABASE_REPLICAS is empty")
+        try:
+            while True:
+                started = time.monotonic()
+                replication.sync_all()
+                self.stdout.write(
+                    f"Synced {len(settings.DATABASE_REPLICAS)} replicas "
+                    f"in {time.monotonic() - started:.3f}s"
+                )
+                if interval is None:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
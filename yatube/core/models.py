@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class IdSequence(models.Model):
+    """Общая последовательность id для шардированных моделей,
+    см. core.db.sharding"""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
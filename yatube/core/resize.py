@@ -0,0 +1,210 @@
+"""Ресайз картинок по запросу.
+
+Шаблоны выдают подписанный URL вида /media/r/<w>x<h>/<путь>?s=<подпись>
+(фильтр resized), а сама картинка строится уже при запросе этого URL
+пулом потоков. Результат лежит в дисковом кэше под хешем содержимого
+исходника и размера; при превышении объема вытесняются файлы, к которым
+дольше всего не обращались.
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps
+
+SALT = "core.resize"
+FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+
+class BadImage(Exception):
+    """Исходник не удалось прочитать как картинку"""
+
+
+def signature(name, width, height):
+    value = f"{width}x{height}/{name}"
+    return salted_hmac(SALT, value).hexdigest()[:16]
+
+
+def check_signature(name, width, height, sig):
+    return constant_time_compare(signature(name, width, height), sig or "")
+
+
+def url(name, width, height):
+    """Подписанный URL картинки, вписанной в width x height"""
+    path = reverse(
+        "resize_image",
+        kwargs={"width": width, "height": height, "name": name},
+    )
+    return f"{path}?s={signature(name, width, height)}"
+
+
+class DiskCache:
+    """Файлы результатов с вытеснением по суммарному объему.
+
+    Время последнего обращения хранится в mtime файла, поэтому порядок
+    вытеснения переживает перезапуск процесса.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key, ext):
+        return os.path.join(self.root, key[:2], key + ext)
+
+    def get(self, key, ext):
+        path = self.path(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, ext, data):
+        path = self.path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            # Перезаписанный файл больше не занимает места
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, path)
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Чистим с запасом, чтобы не сканировать каталог на каждой записи
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+
+_caches = {}
+_executor = None
+_lock = threading.Lock()
+_in_flight = {}
+
+
+def get_cache():
+    root = settings.RESIZE_CACHE_DIR
+    with _lock:
+        cache = _caches.get(root)
+        if cache is None or cache.max_bytes != settings.RESIZE_CACHE_BYTES:
+            cache = _caches[root] = DiskCache(
+                root, settings.RESIZE_CACHE_BYTES
+            )
+        return cache
+
+
+@lru_cache(maxsize=4096)
+def _digest(path, mtime_ns, size):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def source_digest(path):
+    """Хеш содержимого файла; пересчитывается, только если файл менялся"""
+    stat = os.stat(path)
+    return _digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def resize(source, width, height):
+    """Картинка, вписанная в width x height без увеличения, и ее формат.
+
+    BadImage, если исходник не картинка, обрезан или слишком велик.
+    """
+    try:
+        with Image.open(source) as image:
+            fmt = image.format if image.format in FORMATS else "JPEG"
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((width, height), Image.LANCZOS)
+            if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, quality=settings.RESIZE_QUALITY)
+    except (Image.DecompressionBombError, OSError, SyntaxError) as error:
+        raise BadImage(source) from error
+    return buffer.getvalue(), fmt
+
+
+def _build(cache, key, source, width, height):
+    try:
+        data, fmt = resize(source, width, height)
+        return cache.put(key, FORMATS[fmt], data)
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+
+
+def get_resized(source, width, height):
+    """Путь к файлу ресайза из кэша; при промахе строит его в пуле.
+
+    Одновременные запросы одного размера ждут одну и ту же задачу.
+    """
+    global _executor
+    cache = get_cache()
+    key = hashlib.sha256(
+        f"{source_digest(source)}:{width}x{height}".encode()
+    ).hexdigest()
+    for ext in FORMATS.values():
+        path = cache.get(key, ext)
+        if path is not None:
+            return path
+
+    if not settings.RESIZE_WORKERS:
+        return _build(cache, key, source, width, height)
+    with _lock:
+        future = _in_flight.get(key)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.RESIZE_WORKERS,
+                    thread_name_prefix="resize",
+                )
+            future = _executor.submit(
+                _build, cache, key, source, width, height
+            )
+            _in_flight[key] = future
+    return future.result(timeout=settings.RESIZE_TIMEOUT)
@@ -0,0 +1,16 @@
+from django import template
+
+from core import resize
+
+register = template.Library()
+
+
+@register.filter
+def resized(image, size):
+    """Подписанный URL картинки, вписанной в размер вида "960x540".
+
+    В момент рендера картинка не открывается."""
+    if not image:
+        return ""
+    width, height = (int(x) for x in size.split("x"))
+    return resize.url(image.name, width, height)
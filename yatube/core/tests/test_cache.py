@@ -0,0 +1,197 @@
+import socket
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import client
+from core.cache.backends import ShardedMemcachedCache, TwoLevelCache
+from core.cache.hashring import HashRing
+from core.cache.lru import LRUStore
+from core.cache.server import CacheServer
+
+
+class HashRingTests(SimpleTestCase):
+    def test_keys_spread_over_all_nodes(self):
+        """Ключи распределяются по всем узлам"""
+        ring = HashRing(["a", "b", "c"])
+        nodes = {ring.get_node(f"key-{i}") for i in range(300)}
+        self.assertEqual(nodes, {"a", "b", "c"})
+
+    def test_removing_node_moves_only_its_keys(self):
+        """При удалении узла переезжают только его ключи"""
+        ring = HashRing(["a", "b", "c", "d"])
+        keys = [f"key-{i}" for i in range(2000)]
+        before = {key: ring.get_node(key) for key in keys}
+
+        ring.remove("d")
+        for key in keys:
+            with self.subTest(key=key):
+                if before[key] != "d":
+                    self.assertEqual(ring.get_node(key), before[key])
+
+
+class ShardedMemcachedCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = [CacheServer().start() for _ in range(2)]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache = ShardedMemcachedCache(
+            [server.location for server in self.servers], {}
+        )
+        self.cache.clear()
+
+    def test_set_get_delete(self):
+        """Базовые операции работают через узлы"""
+        self.cache.set("post", {"text": "Пост"})
+        self.assertEqual(self.cache.get("post"), {"text": "Пост"})
+
+        self.cache.delete("post")
+        self.assertIsNone(self.cache.get("post"))
+
+    def test_keys_stored_on_every_node(self):
+        """Ключи попадают на оба узла"""
+        self.cache.set_many({f"key-{i}": i for i in range(50)})
+
+        for server in self.servers:
+            with self.subTest(server=server.location):
+                self.assertTrue(server.storage.items)
+        self.assertEqual(len(self.cache.get_many(
+            [f"key-{i}" for i in range(50)]
+        )), 50)
+
+    def test_add_and_incr(self):
+        """add атомарен, incr работает с числами"""
+        self.assertTrue(self.cache.add("lock", 1))
+        self.assertFalse(self.cache.add("lock", 1))
+
+        self.assertEqual(self.cache.incr("lock", 5), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_expired_key_missing(self):
+        """Запись с нулевым сроком не сохраняется"""
+        self.cache.set("key", "value", 0)
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_dead_node_is_cache_miss(self):
+        """Недоступный узел дает промах, а не ошибку"""
+        cache = ShardedMemcachedCache(["127.0.0.1:1"], {})
+        self.assertFalse(cache.add("key", "value"))
+        self.assertIsNone(cache.get("key"))
+
+
+    def test_malformed_reply_drops_connection(self):
+        """Непонятный ответ узла дает промах и новое соединение"""
+        self.cache.set("key", "value")
+        with mock.patch.object(
+            client.Connection, "readline", return_value=b"VALUE key"
+        ):
+            self.assertIsNone(self.cache.get("key"))
+
+        self.assertEqual(self.cache.get("key"), "value")
+
+    def test_slow_writer_does_not_block_others(self):
+        """Пока клиент передает данные записи, другие запросы идут"""
+        server = self.servers[0]
+        with socket.create_connection(server.server_address[:2]) as slow:
+            slow.sendall(b"set key 0 0 5\r\nab")
+            with socket.create_connection(
+                server.server_address[:2], timeout=1
+            ) as other:
+                other.sendall(b"get key\r\n")
+                self.assertEqual(other.recv(64), b"END\r\n")
+            slow.sendall(b"cde\r\n")
+            self.assertEqual(slow.recv(64), b"STORED\r\n")
+
+
+class LRUStoreTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        """Вытесняется давно не использованная запись"""
+        store = LRUStore(max_entries=2, max_bytes=1024)
+        store.set("a", b"1", None)
+        store.set("b", b"2", None)
+        store.get("a")
+        store.set("c", b"3", None)
+
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.get("a"), b"1")
+
+    def test_bounded_by_bytes(self):
+        """Объем хранилища не превышает лимит"""
+        store = LRUStore(max_entries=100, max_bytes=10)
+        for i in range(10):
+            store.set(str(i), b"1234", None)
+        self.assertLessEqual(store.size, 10)
+
+    def test_entry_expires(self):
+        """Запись истекает по своему сроку"""
+        store = LRUStore(max_entries=10, max_bytes=1024)
+        store.set("a", b"1", 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(store.get("a"))
+
+
+class TwoLevelCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = CacheServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        caches = {
+            "default": {
+                "BACKEND": "core.cache.backends.TwoLevelCache",
+                "LOCATION": f"test-{self.id()}",
+                "OPTIONS": {"SHARED": "shared", "LOCAL_TIMEOUT": 60},
+            },
+            "shared": {
+                "BACKEND": "core.cache.backends.ShardedMemcachedCache",
+                "LOCATION": [self.server.location],
+            },
+        }
+        self.settings_override = override_settings(CACHES=caches)
+        self.settings_override.enable()
+        self.cache = TwoLevelCache(
+            f"test-{self.id()}", caches["default"]
+        )
+        self.cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_read_served_locally(self):
+        """Повторное чтение не ходит в общий кэш"""
+        self.cache.set("key", "value")
+        self.server.storage.items.clear()
+
+        self.assertEqual(self.cache.get("key"), "value")
+
+    def test_write_reaches_shared_tier(self):
+        """Запись видна другому процессу через общий кэш"""
+        self.cache.set("key", "value")
+        other = TwoLevelCache("other", {"OPTIONS": {"SHARED": "shared"}})
+
+        self.assertEqual(other.get("key"), "value")
+
+    def test_delete_and_incr_update_local_copy(self):
+        """delete и incr не оставляют устаревшую локальную копию"""
+        self.cache.set("counter", 1)
+        self.assertEqual(self.cache.incr("counter"), 2)
+        self.assertEqual(self.cache.get("counter"), 2)
+
+        self.cache.delete("counter")
+        self.assertIsNone(self.cache.get("counter"))
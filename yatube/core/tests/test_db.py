@@ -0,0 +1,106 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+
+from core.db import bench
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def connect(self, **options):
+        handler = ConnectionHandler({
+            "default": {
+                "ENGINE": "core.db.backends.sqlite3",
+                "NAME": os.path.join(self.tmp, "db.sqlite3"),
+                "OPTIONS": options,
+            }
+        })
+        connection = handler["default"]
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        """При подключении включаются WAL и остальные PRAGMA"""
+        connection = self.connect()
+
+        self.assertEqual(self.pragma(connection, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(connection, "synchronous"), 1)
+        self.assertEqual(self.pragma(connection, "busy_timeout"), 5000)
+        self.assertEqual(self.pragma(connection, "foreign_keys"), 1)
+
+    def test_pragmas_overridden_in_options(self):
+        """PRAGMA из OPTIONS заменяют значения по умолчанию"""
+        connection = self.connect(PRAGMAS={"cache_size": -1000})
+
+        self.assertEqual(self.pragma(connection, "cache_size"), -1000)
+        self.assertEqual(self.pragma(connection, "journal_mode"), "wal")
+
+    def test_transaction_takes_write_lock(self):
+        """Транзакция сразу берет блокировку записи, а не при первой
+        записи посреди транзакции"""
+        connection = self.connect()
+        other = self.connect(PRAGMAS={"busy_timeout": 0})
+        other.ensure_connection()
+
+        connection.ensure_connection()
+        connection._start_transaction_under_autocommit()
+        self.addCleanup(connection.connection.rollback)
+        with self.assertRaisesMessage(sqlite3.OperationalError, "locked"):
+            other.connection.execute("BEGIN IMMEDIATE")
+
+    def test_read_only_transaction_does_not_lock(self):
+        """Соединение только для чтения не берет блокировку записи"""
+        connection = self.connect(PRAGMAS={"query_only": 1})
+        other = self.connect(PRAGMAS={"busy_timeout": 0})
+        other.ensure_connection()
+
+        connection.ensure_connection()
+        connection._start_transaction_under_autocommit()
+        self.addCleanup(connection.connection.rollback)
+        other.connection.execute("BEGIN IMMEDIATE")
+        other.connection.rollback()
+
+        self.assertEqual(connection.transaction_mode, "DEFERRED")
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_profiles_run(self):
+        """Оба профиля нагрузочного теста выполняют операции"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = os.path.join(tmp, "bench.sqlite3")
+        for profile in bench.PROFILES:
+            with self.subTest(profile=profile):
+                result = bench.run(
+                    path, profile, readers=2, writers=2,
+                    duration=0.2, rows=100,
+                )
+                self.assertGreater(result["reads_per_sec"], 0)
+                self.assertGreater(result["writes_per_sec"], 0)
+
+    def test_command_removes_temporary_database(self):
+        """Команда удаляет временный каталог с базой теста"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        with mock.patch.object(tempfile, "mkdtemp", return_value=tmp):
+            call_command(
+                "benchdb", readers=1, writers=1, duration=0.1, rows=10,
+                stdout=StringIO(),
+            )
+
+        self.assertFalse(os.path.exists(tmp))
@@ -0,0 +1,122 @@
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from core import resize
+
+TEMP_DIR = tempfile.mkdtemp()
+MEDIA_ROOT = os.path.join(TEMP_DIR, "media")
+CACHE_DIR = os.path.join(TEMP_DIR, "resized")
+
+
+def make_image(name, size=(400, 200)):
+    path = os.path.join(MEDIA_ROOT, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, "red").save(path, "JPEG")
+    return name
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, RESIZE_CACHE_DIR=CACHE_DIR, RESIZE_WORKERS=1
+)
+class ResizeViewTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        self.name = make_image("posts/red.jpg")
+
+    def test_signed_url_returns_resized_image(self):
+        """Подписанный URL отдает уменьшенную картинку с долгим кэшем"""
+        response = self.client.get(resize.url(self.name, 100, 100))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+        image = Image.open(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(image.size, (100, 50))
+
+    def test_bad_signature_not_found(self):
+        """Размер без подписи или с чужой подписью не строится"""
+        url = resize.url(self.name, 100, 100)
+        urls = (
+            url.split("?")[0],
+            url.replace("100x100", "101x100"),
+            resize.url("posts/missing.jpg", 100, 100),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertFalse(os.path.exists(CACHE_DIR))
+
+    def test_broken_image_not_found(self):
+        """Обрезанная или слишком большая картинка — 404, а не 500"""
+        buffer = io.BytesIO()
+        Image.new("RGB", (400, 200), "red").save(buffer, "JPEG")
+        with open(os.path.join(MEDIA_ROOT, "posts/cut.jpg"), "wb") as f:
+            f.write(buffer.getvalue()[:-50])
+        response = self.client.get(resize.url("posts/cut.jpg", 100, 100))
+        self.assertEqual(response.status_code, 404)
+
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 100):
+            response = self.client.get(resize.url(self.name, 100, 100))
+        self.assertEqual(response.status_code, 404)
+
+    def test_timeout_unavailable(self):
+        """Не дождались ресайза — 503 с Retry-After"""
+        with mock.patch.object(
+            resize, "get_resized", side_effect=FutureTimeoutError
+        ):
+            response = self.client.get(resize.url(self.name, 100, 100))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+    def test_result_cached_by_content(self):
+        """Одинаковые картинки под разными именами делят запись кэша"""
+        copy = make_image("posts/copy.jpg")
+        self.client.get(resize.url(self.name, 100, 100))
+        self.client.get(resize.url(copy, 100, 100))
+
+        files = [name for _, _, names in os.walk(CACHE_DIR) for name in names]
+        self.assertEqual(len(files), 1)
+
+
+class DiskCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        """При переполнении удаляются давно не читанные файлы"""
+        cache = resize.DiskCache(self.root, max_bytes=25)
+        cache.put("aa1", ".jpg", b"x" * 10)
+        cache.put("bb2", ".jpg", b"x" * 10)
+        os.utime(cache.path("aa1", ".jpg"), (0, 0))
+        os.utime(cache.path("bb2", ".jpg"), (1, 1))
+        cache.get("aa1", ".jpg")
+        cache.put("cc3", ".jpg", b"x" * 10)
+
+        self.assertIsNotNone(cache.get("aa1", ".jpg"))
+        self.assertIsNone(cache.get("bb2", ".jpg"))
+        self.assertIsNotNone(cache.get("cc3", ".jpg"))
+
+    def test_overwrite_counts_size_once(self):
+        """Перезапись ключа не увеличивает учтенный объем"""
+        cache = resize.DiskCache(self.root, max_bytes=25)
+        cache.put("aa1", ".jpg", b"x" * 10)
+        cache.put("bb2", ".jpg", b"x" * 10)
+        for _ in range(3):
+            cache.put("aa1", ".jpg", b"y" * 10)
+
+        self.assertEqual(cache._size, 20)
+        self.assertIsNotNone(cache.get("bb2", ".jpg"))
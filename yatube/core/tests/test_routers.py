@@ -0,0 +1,172 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.db import replication, routers
+from posts.models import Post
+
+User = get_user_model()
+
+
+class RecordingRouter(routers.ReplicaRouter):
+    """Запоминает выбор базы для чтения, но читает из основной:
+    в тестах реплики нет"""
+
+    choices = []
+
+    def db_for_read(self, model, **hints):
+        self.choices.append((model, super().db_for_read(model, **hints)))
+        return routers.PRIMARY
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.ReplicaRouter()
+
+    def read_db(self):
+        return self.router.db_for_read(Post)
+
+    def test_reads_from_replica_only_in_marked_views(self):
+        """С реплики читают только views с replica_reads"""
+        view = routers.replica_reads(lambda request: self.read_db())
+
+        self.assertEqual(self.read_db(), "default")
+        self.assertEqual(view(None), "replica1")
+        self.assertEqual(self.read_db(), "default")
+
+    @override_settings(DATABASE_REPLICAS=["replica1", "replica2", "replica3"])
+    def test_one_replica_per_request(self):
+        """Все чтения запроса идут в одну реплику"""
+        view = routers.replica_reads(
+            lambda request: {self.read_db() for _ in range(20)}
+        )
+
+        for _ in range(5):
+            self.assertEqual(len(view(None)), 1)
+
+    def test_write_switches_reads_to_primary(self):
+        """После записи запрос читает из основной базы"""
+        def view(request):
+            before = self.read_db()
+            self.assertEqual(self.router.db_for_write(Post), "default")
+            return before, self.read_db()
+
+        self.assertEqual(
+            routers.replica_reads(view)(None), ("replica1", "default")
+        )
+
+    def test_pinned_and_primary_reads(self):
+        """Закрепленный пользователь и primary_reads читают из основной"""
+        def view(request):
+            with routers.primary_reads():
+                return self.read_db()
+
+        self.assertEqual(routers.replica_reads(view)(None), "default")
+        routers.pin()
+        view = routers.replica_reads(lambda request: self.read_db())
+        self.assertEqual(view(None), "default")
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "posts"))
+        self.assertTrue(self.router.allow_migrate("default", "posts"))
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica1"],
+    DATABASE_ROUTERS=["core.tests.test_routers.RecordingRouter"],
+)
+class ReadYourWritesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="user")
+        cls.post = Post.objects.create(author=cls.user, text="Пост")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        RecordingRouter.choices = []
+
+    def reads(self, url, model=None):
+        RecordingRouter.choices = []
+        self.client.get(url)
+        return {
+            db for read_model, db in RecordingRouter.choices
+            if model in (None, read_model)
+        }
+
+    def test_feed_pages_read_from_replica(self):
+        """Ленты и страница поста читают с реплики, формы — из основной"""
+        for url in (
+            reverse("posts:group_list", args=("missing",)),
+            reverse("posts:profile", args=(self.user.username,)),
+            reverse("posts:post_detail", args=(self.post.id,)),
+            reverse("posts:follow_index"),
+        ):
+            with self.subTest(url=url):
+                self.assertIn("replica1", self.reads(url))
+        self.assertEqual(
+            self.reads(reverse("posts:post_create")), {"default"}
+        )
+
+    def test_cached_page_built_from_primary(self):
+        """Страница для кэша строится по основной базе"""
+        cache.clear()
+        self.assertEqual(
+            self.reads(reverse("posts:index"), Post), {"default"}
+        )
+
+    def test_own_write_pins_to_primary(self):
+        """После своего комментария пользователь читает из основной"""
+        url = reverse("posts:post_detail", args=(self.post.id,))
+        self.assertIn("replica1", self.reads(url))
+
+        response = self.client.post(
+            reverse("posts:add_comment", args=(self.post.id,)),
+            {"text": "Комментарий"},
+        )
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+        self.assertEqual(self.reads(url), {"default"})
+
+        # Срок закрепления истек
+        self.client.cookies[settings.REPLICA_PIN_COOKIE] = str(
+            time.time() - 1
+        )
+        self.assertIn("replica1", self.reads(url))
+
+
+class ReplicationTests(SimpleTestCase):
+    def test_backup_copies_database(self):
+        """Реплика получает схему и данные основной базы"""
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        replica = os.path.join(tmp, "replica.sqlite3")
+        primary = sqlite3.connect(os.path.join(tmp, "primary.sqlite3"))
+        self.addCleanup(primary.close)
+        primary.execute("CREATE TABLE item (id INTEGER PRIMARY KEY)")
+        primary.execute("INSERT INTO item VALUES (1)")
+        primary.commit()
+
+        replication.backup(primary, replica)
+        primary.execute("INSERT INTO item VALUES (2)")
+        primary.commit()
+        reader = sqlite3.connect(replica)
+        self.addCleanup(reader.close)
+        self.assertEqual(
+            reader.execute("SELECT COUNT(*) FROM item").fetchone(), (1,)
+        )
+
+        replication.backup(primary, replica)
+        self.assertEqual(
+            reader.execute("SELECT COUNT(*) FROM item").fetchone(), (2,)
+        )
@@ -1,4 +1,13 @@
+import mimetypes
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
+
+from . import resize
 
 
 def page_not_found(request, exception):
@@ -15,3 +24,35 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=""):
     return render(request, "core/403csrf.html")
+
+
+@require_safe
+def resize_image(request, width, height, name):
+    """Картинка из MEDIA_ROOT, вписанная в width x height.
+
+    Размер задается только подписанным URL (см. resize.url), поэтому
+    перебором параметров нельзя заставить сервер строить лишние файлы.
+    """
+    if not resize.check_signature(name, width, height, request.GET.get("s")):
+        raise Http404
+    if not 0 < max(width, height) <= settings.RESIZE_MAX_SIZE:
+        raise Http404
+    source = default_storage.path(name)
+    try:
+        path = resize.get_resized(source, width, height)
+    except (FileNotFoundError, IsADirectoryError, resize.BadImage):
+        raise Http404
+    except FutureTimeoutError:
+        # Ресайз продолжается в пуле, повторный запрос его дождется
+        response = HttpResponse(status=503)
+        response["Retry-After"] = settings.RESIZE_TIMEOUT
+        return response
+
+    content_type, _ = mimetypes.guess_type(path)
+    response = FileResponse(open(path, "rb"), content_type=content_type)
+    # Адрес зависит от подписи размера и имени файла, а имена картинок
+    # не переиспользуются — ответ можно кэшировать навсегда
+    response["Cache-Control"] = (
+        f"public, max-age={settings.RESIZE_CACHE_MAX_AGE}, immutable"
+    )
+    return response
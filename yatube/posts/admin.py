@@ -1,14 +1,145 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.views.main import ORDER_VAR
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import path
 
+from core.db import sharding
+
+from . import bulk, exporter
 from .models import Comment, Follow, Group, Post
+from .paginator import EstimatedCountPaginator
+from .search import search_posts
+
+
+class ScaleAdminMixin:
+    """Списки для больших таблиц: связанные объекты одним запросом,
+    оценка количества вместо COUNT(*) и удаление одним DELETE"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    bulk_delete = None
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление загружает и удаляет объекты по одному
+        actions.pop("delete_selected", None)
+        return actions
+
+    def bulk_allowed(self, request):
+        # Массовые операции пишут одним запросом в одну базу
+        # и о шардах не знают
+        if sharding.enabled():
+            self.message_user(
+                request,
+                "Массовые операции недоступны при шардировании",
+                messages.ERROR,
+            )
+            return False
+        return True
+
+    def delete_fast(self, request, queryset):
+        if not self.bulk_allowed(request):
+            return
+        deleted = self.bulk_delete(queryset)
+        self.message_user(request, f"Удалено: {deleted}", messages.SUCCESS)
+
+    delete_fast.short_description = "Удалить выбранные"
+    delete_fast.allowed_permissions = ("delete",)
+
+
+class RegroupActionForm(ActionForm):
+    # Адрес группы вместо выпадающего списка всех групп
+    group_slug = forms.SlugField(
+        label="Группа (адрес)", required=False
+    )
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScaleAdminMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group")
-    list_filter = ("pub_date",)
-    list_editable = ("group",)
+    list_select_related = ("author", "group")
+    date_hierarchy = "pub_date"
+    autocomplete_fields = ("author", "group")
     search_fields = ("text",)
     empty_value_display = "-пусто-"
+    action_form = RegroupActionForm
+    actions = ("delete_fast", "regroup")
+    bulk_delete = staticmethod(bulk.delete_posts)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через поисковый индекс вместо LIKE '%...%' по всем
+        постам; без явной сортировки — по релевантности"""
+        if not search_term:
+            return queryset, False
+        results = search_posts(search_term, queryset)
+        if ORDER_VAR in request.GET:
+            results = results.order_by(*queryset.query.order_by)
+        return results, False
+
+    def regroup(self, request, queryset):
+        if not self.bulk_allowed(request):
+            return
+        slug = request.POST.get("group_slug")
+        group = None
+        if slug:
+            group = Group.objects.filter(slug=slug).first()
+            if group is None:
+                self.message_user(
+                    request, f"Группа «{slug}» не найдена", messages.ERROR
+                )
+                return
+        moved = bulk.regroup_posts(queryset, group)
+        self.message_user(
+            request, f"Перенесено постов: {moved}", messages.SUCCESS
+        )
+
+    regroup.short_description = "Перенести в группу"
+    regroup.allowed_permissions = ("change",)
+
+    def get_urls(self):
+        return [
+            path(
+                "export/",
+                self.admin_site.admin_view(self.export_view),
+                name="posts_post_export",
+            ),
+            *super().get_urls(),
+        ]
+
+    def export_view(self, request):
+        """Выгрузка NDJSON потоком, см. posts.exporter.
+
+        Параметры — как у export_yatube: types, author, group, since,
+        until, after (курсор тип:id), gzip. В выгрузке есть адреса
+        почты пользователей, поэтому она только для суперпользователей.
+        """
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        params = request.GET
+        try:
+            job = exporter.from_params(
+                **{name: params.get(name) for name in exporter.FILTERS}
+            )
+            after = params.get("after")
+            exporter.parse_cursor(after)
+        except exporter.InvalidExport as error:
+            return HttpResponseBadRequest(str(error))
+
+        compress = bool(params.get("gzip"))
+        response = StreamingHttpResponse(
+            (
+                exporter.encode(lines, compress)
+                for _, lines in job.chunks(after)
+            ),
+            content_type=(
+                "application/gzip" if compress else "application/x-ndjson"
+            ),
+        )
+        filename = "yatube.ndjson.gz" if compress else "yatube.ndjson"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -20,12 +151,21 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ("text",)
+class CommentAdmin(ScaleAdminMixin, admin.ModelAdmin):
+    list_display = ("text", "author", "post", "created")
+    list_select_related = ("author", "post")
+    date_hierarchy = "created"
+    autocomplete_fields = ("author", "post")
+    actions = ("delete_fast",)
+    bulk_delete = staticmethod(bulk.delete_comments)
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScaleAdminMixin, admin.ModelAdmin):
     list_display = ("user", "author")
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
+    actions = ("delete_fast",)
+    bulk_delete = staticmethod(bulk.delete_follows)
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,324 @@
+"""Нагрузочный прогон страниц posts.urls и users.urls.
+
+Каждый адрес запрашивается GET-ом iterations раз после warmup
+прогревочных запросов: через тестовый клиент Django или через
+настоящий HTTP к локальному WSGI-серверу. Для каждого адреса
+считаются перцентили задержки, запросов в секунду, запросы к базе
+и размер ответа. Аргументы адресов берутся из самых нагруженных
+объектов базы: группы с наибольшим числом постов, самого популярного
+автора, самого обсуждаемого поста.
+"""
+import http.client
+import math
+import threading
+import time
+from contextlib import ExitStack
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlencode, urlsafe_base64_encode
+
+from posts import urls as posts_urls
+from users import urls as users_urls
+
+from .models import AuthorStats, Follow, Group, Post
+
+User = get_user_model()
+
+URLCONFS = (posts_urls, users_urls)
+# Страницы для анонимов: вошедшего пользователя они перенаправляют
+ANONYMOUS = {
+    "users:only_anon",
+    "users:signup",
+    "users:login",
+    "users:password_reset",
+    "users:password_reset_done",
+    "users:password_reset_confirm",
+    "users:password_reset_complete",
+}
+# После этих страниц сессии больше нет, нужно войти заново
+RELOGIN = {"users:logout"}
+PERCENTILES = (50, 95, 99)
+HOST = "localhost"
+
+
+class BenchmarkError(ValueError):
+    pass
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values отсортированы"""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def _first(queryset, field):
+    return queryset.values_list(field, flat=True).first()
+
+
+def sample():
+    """Пользователь для входа и значения аргументов адресов"""
+    username = _first(
+        AuthorStats.objects.order_by("-followers_count", "pk"),
+        "user__username",
+    )
+    login_id = _first(
+        AuthorStats.objects.order_by("-following_count", "pk"), "user_id"
+    )
+    post = Post.objects.order_by("-comments_count", "-pk").first()
+    slug = _first(Group.objects.order_by("-posts_count", "pk"), "slug")
+    if post is None or slug is None:
+        raise BenchmarkError("В базе нет постов или групп")
+    user = User.objects.get(pk=login_id) if login_id else post.author
+    # Вход меняет last_login, а с ним и токен сброса пароля: сбрасываем
+    # пароль другому пользователю
+    reset = User.objects.exclude(pk=user.pk).order_by("pk").first() or user
+    return user, {
+        "slug": slug,
+        "username": username or post.author.username,
+        "post_id": post.pk,
+        "uidb64": urlsafe_base64_encode(force_bytes(reset.pk)),
+        "token": default_token_generator.make_token(reset),
+        # Первое слово поста наверняка есть в поисковом индексе
+        "q": post.text.split()[0] if post.text.split() else "пост",
+    }
+
+
+def targets(values, exclude=()):
+    """[(имя, адрес)] всех адресов URLCONFS, кроме exclude"""
+    result = []
+    for module in URLCONFS:
+        for pattern in module.urlpatterns:
+            name = f"{module.app_name}:{pattern.name}"
+            if name in exclude or pattern.name in exclude:
+                continue
+            kwargs = {
+                key: values[key] for key in pattern.pattern.converters
+            }
+            url = reverse(name, kwargs=kwargs)
+            if name == "posts:search":
+                url += "?" + urlencode({"q": values["q"]})
+            result.append((name, url))
+    return result
+
+
+def _count_queries():
+    stack = ExitStack()
+    contexts = [
+        stack.enter_context(CaptureQueriesContext(connection))
+        for connection in connections.all()
+    ]
+    return stack, contexts
+
+
+class ClientTransport:
+    """Тестовый клиент: без сети и сервера, только сам Django"""
+
+    def __init__(self, user):
+        self.user = user
+        self.anonymous = Client(SERVER_NAME=HOST)
+        self.client = Client(SERVER_NAME=HOST)
+        self.login()
+
+    def login(self):
+        self.client.force_login(self.user)
+
+    def get(self, url, anonymous=False):
+        client = self.anonymous if anonymous else self.client
+        stack, contexts = _count_queries()
+        with stack:
+            response = client.get(url)
+            body = b"".join(
+                response.streaming_content if response.streaming
+                else [response.content]
+            )
+        queries = sum(len(context) for context in contexts)
+        return response.status_code, len(body), queries
+
+    def close(self):
+        pass
+
+
+class CountingApp:
+    """WSGI-обертка: число запросов к базе в заголовке ответа"""
+
+    header = "X-Bench-Queries"
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured.append((status, headers))
+            return lambda data: None
+
+        stack, contexts = _count_queries()
+        with stack:
+            result = self.app(environ, capture)
+            try:
+                body = b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        status, headers = captured[-1]
+        queries = sum(len(context) for context in contexts)
+        start_response(status, headers + [(self.header, str(queries))])
+        return [body]
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class WSGITransport:
+    """HTTP к wsgiref-серверу в отдельном потоке"""
+
+    def __init__(self, user):
+        self.user = user
+        self.server = make_server(
+            "127.0.0.1", 0, CountingApp(get_wsgi_application()),
+            handler_class=QuietHandler,
+        )
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        self.login()
+
+    def login(self):
+        client = Client()
+        client.force_login(self.user)
+        self.cookie = "{}={}".format(
+            settings.SESSION_COOKIE_NAME,
+            client.cookies[settings.SESSION_COOKIE_NAME].value,
+        )
+
+    def get(self, url, anonymous=False):
+        conn = http.client.HTTPConnection(*self.server.server_address)
+        headers = {"Host": HOST}
+        if not anonymous:
+            headers["Cookie"] = self.cookie
+        try:
+            conn.request("GET", url, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        finally:
+            conn.close()
+        queries = int(response.getheader(CountingApp.header, 0))
+        return response.status, len(body), queries
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {"client": ClientTransport, "wsgi": WSGITransport}
+
+
+def measure(transport, name, url, iterations, warmup):
+    anonymous = name in ANONYMOUS
+    timings, queries = [], []
+    status = size = None
+    for i in range(warmup + iterations):
+        if name in RELOGIN:
+            transport.login()
+        started = time.perf_counter()
+        status, size, count = transport.get(url, anonymous)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(count)
+    if name in RELOGIN:
+        transport.login()
+    timings.sort()
+    total = sum(timings)
+    result = {
+        "url": url,
+        "status": status,
+        "bytes": size,
+        "queries": sum(queries) / len(queries),
+        "max_queries": max(queries),
+        "mean_ms": total / len(timings) * 1000,
+        "rps": len(timings) / total if total else 0.0,
+    }
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = percentile(timings, p) * 1000
+    return result
+
+
+def run(mode="client", iterations=20, warmup=2, exclude=(), debug=False):
+    """Результаты прогона всех адресов; DEBUG на время прогона
+    выключается, иначе замеры включат журнал запросов и панель
+    отладки"""
+    if iterations < 1:
+        raise BenchmarkError("Нужна хотя бы одна итерация")
+    user, values = sample()
+    follows = Follow.objects.filter(
+        user=user, author__username=values["username"]
+    )
+    following = follows.exists()
+    results = {}
+    started = time.perf_counter()
+    with override_settings(DEBUG=settings.DEBUG and debug):
+        transport = TRANSPORTS[mode](user)
+        try:
+            for name, url in targets(values, exclude):
+                results[name] = measure(
+                    transport, name, url, iterations, warmup
+                )
+        finally:
+            transport.close()
+            # profile_follow и profile_unfollow меняют подписку, а с ней
+            # и выбор пользователя в следующем прогоне
+            if following and not follows.exists():
+                Follow.objects.create(
+                    user=user,
+                    author=User.objects.get(username=values["username"]),
+                )
+            elif not following:
+                follows.delete()
+    elapsed = time.perf_counter() - started
+    requests = len(results) * (iterations + warmup)
+    return {
+        "mode": mode,
+        "iterations": iterations,
+        "warmup": warmup,
+        "rps": requests / elapsed if elapsed else 0.0,
+        "urls": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Регрессии относительно baseline: [(имя, описание)]"""
+    regressions = []
+    for name, result in results["urls"].items():
+        base = baseline.get("urls", {}).get(name)
+        if base is None:
+            continue
+        limit = 1 + tolerance
+        if result["p95_ms"] > base["p95_ms"] * limit:
+            regressions.append((
+                name,
+                f"p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms",
+            ))
+        if result["queries"] > base["queries"] * limit:
+            regressions.append((
+                name,
+                f"queries {base['queries']:.1f} -> "
+                f"{result['queries']:.1f}",
+            ))
+        if result["status"] != base["status"]:
+            regressions.append((
+                name, f"status {base['status']} -> {result['status']}"
+            ))
+    return regressions
@@ -0,0 +1,110 @@
+"""Массовые операции админки: один UPDATE или DELETE на таблицу.
+
+Сигналы моделей при этом не посылаются, поэтому счетчики, ленты,
+поисковый индекс и версии кэша обновляются здесь же — тоже по группам
+строк, а не построчно.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, Q
+
+from . import counters, images
+from .cache import INDEX_SCOPE, bump_version, comments_scope, profile_scope
+from .models import Comment, FeedItem, Follow, Post
+from .search import get_backend as search_backend
+
+User = get_user_model()
+
+
+def _grouped(queryset, field):
+    return dict(
+        queryset.order_by()
+        .values_list(field)
+        .annotate(total=Count("pk"))
+    )
+
+
+def _raw_delete(queryset):
+    # Один DELETE без сбора объектов и каскада в Python: зависимые
+    # строки к этому моменту уже удалены так же
+    return queryset._raw_delete(queryset.db)
+
+
+@transaction.atomic
+def regroup_posts(queryset, group):
+    """Переносит посты в группу (None — убрать из групп)"""
+    queryset = queryset.exclude(group=group)
+    old_groups = _grouped(queryset, "group")
+    moved = queryset.update(group=group)
+    for group_id, total in old_groups.items():
+        counters.bump_group(group_id, -total)
+    if group is not None:
+        counters.bump_group(group.pk, moved)
+    bump_version(INDEX_SCOPE)
+    return moved
+
+
+@transaction.atomic
+def delete_posts(queryset):
+    posts = Post.objects.filter(pk__in=queryset.values("pk"))
+    groups = _grouped(posts, "group")
+    authors = _grouped(posts, "author")
+    image_refs = _grouped(posts.exclude(image=""), "image")
+    ids = list(posts.values_list("pk", flat=True))
+
+    _raw_delete(Comment.objects.filter(post__in=posts.values("pk")))
+    _raw_delete(FeedItem.objects.filter(post__in=posts.values("pk")))
+    search_backend().remove(ids)
+    deleted = _raw_delete(posts)
+
+    for group_id, total in groups.items():
+        counters.bump_group(group_id, -total)
+    for author_id, total in authors.items():
+        counters.bump_stats(author_id, posts_count=-total)
+    for name, total in image_refs.items():
+        images.release(name, total)
+    bump_version(INDEX_SCOPE)
+    return deleted
+
+
+@transaction.atomic
+def delete_comments(queryset):
+    comments = Comment.objects.filter(pk__in=queryset.values("pk"))
+    posts = _grouped(comments, "post")
+    deleted = _raw_delete(comments)
+
+    for post_id, total in posts.items():
+        counters.bump_post(post_id, -total)
+    bump_version(*(comments_scope(post_id) for post_id in posts))
+    return deleted
+
+
+@transaction.atomic
+def delete_follows(queryset):
+    follows = Follow.objects.filter(pk__in=queryset.values("pk"))
+    followers = _grouped(follows, "author")
+    following = _grouped(follows, "user")
+    usernames = set(
+        User.objects.filter(
+            Q(pk__in=followers.keys()) | Q(pk__in=following.keys())
+        ).values_list("username", flat=True)
+    )
+
+    # Посты авторов убираются из лент подписчиков одним запросом
+    pairs, params = (
+        follows.values("user_id", "author_id").query.sql_with_params()
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FeedItem._meta.db_table} "
+            f"WHERE (user_id, author_id) IN ({pairs})",
+            params,
+        )
+    deleted = _raw_delete(follows)
+
+    for author_id, total in followers.items():
+        counters.bump_stats(author_id, followers_count=-total)
+    for user_id, total in following.items():
+        counters.bump_stats(user_id, following_count=-total)
+    bump_version(*(profile_scope(name) for name in usernames))
+    return deleted
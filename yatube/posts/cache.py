@@ -0,0 +1,205 @@
+import hashlib
+import math
+import random
+import time
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.db.routers import primary_reads
+
+# Область версий главной ленты
+INDEX_SCOPE = "index"
+
+
+def _version_key(scope):
+    return f"version:{scope}"
+
+
+def _initial_version():
+    # Версия от времени, а не с единицы: если ключ версии вытеснят,
+    # новая версия не совпадет со старыми закэшированными страницами
+    return int(time.time() * 1000)
+
+
+def get_version(scope):
+    """Текущая версия данных области (например, ленты главной)"""
+    return cache.get_or_set(_version_key(scope), _initial_version, None)
+
+
+def bump_version(*scopes):
+    """Инвалидирует все ключи, построенные на версии области"""
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), _initial_version(), None)
+
+
+def comments_scope(post_id):
+    return f"comments:{post_id}"
+
+
+def profile_scope(username):
+    return f"profile:{username}"
+
+
+def page_etag(request, *versions):
+    """ETag страницы из версий ее данных.
+
+    Страница зависит от пользователя и адреса (номер страницы, курсор),
+    поэтому они тоже входят в тег.
+    """
+    user_pk = request.user.pk if request.user.is_authenticated else 0
+    parts = (user_pk, request.get_full_path(), *versions)
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def comments_page_key(post_id, cursor=None):
+    """Ключ отрисованного блока комментариев страницы поста.
+
+    Страницы после курсора не меняются от новых комментариев
+    (они добавляются в начало), поэтому новый комментарий сбрасывает
+    только первую страницу, а удаление — все через версию поста.
+    """
+    version = get_version(comments_scope(post_id))
+    return f"comments:{post_id}:{version}:{cursor or 'first'}"
+
+
+class CacheStats:
+    """Счетчики кэша страниц в общем кэше: их видно со всех воркеров,
+    см. команду cache_stats"""
+
+    names = ("hits", "misses", "stale", "lock_waits")
+    prefix = "cache_stats"
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def incr(self, name):
+        key = self._key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Первое событие или счетчик вытеснен; add не затрет
+            # значение, которое параллельно создал другой воркер
+            if not cache.add(key, 1, None):
+                cache.incr(key)
+
+    def snapshot(self):
+        values = cache.get_many([self._key(name) for name in self.names])
+        return {
+            name: values[self._key(name)]
+            for name in self.names
+            if self._key(name) in values
+        }
+
+    def reset(self):
+        cache.delete_many([self._key(name) for name in self.names])
+
+
+stats = CacheStats()
+
+CachedPage = namedtuple(
+    "CachedPage", ["version", "expires", "delta", "content", "content_type"]
+)
+
+
+def page_key(request, key_prefix):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    user = request.user.pk or 0
+    return f"{key_prefix}:{user}:{path}"
+
+
+def _is_fresh(entry, version):
+    """Вероятностный досрочный пересчет (XFetch): чем ближе истечение
+    и чем дольше страница строится, тем вероятнее пересчитать ее заранее,
+    чтобы запись не истекала у всех воркеров одновременно"""
+    if entry.version != version:
+        return False
+    jitter = entry.delta * settings.CACHE_EARLY_RECOMPUTE_BETA
+    jitter *= -math.log(1 - random.random())
+    return time.time() + jitter < entry.expires
+
+
+def _wait_for(key, version):
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL)
+        entry = cache.get(key)
+        if entry is not None and entry.version == version:
+            return entry
+    return None
+
+
+def _to_response(entry):
+    return HttpResponse(entry.content, content_type=entry.content_type)
+
+
+def cache_versioned(timeout, key_prefix, scope):
+    """Кэширует страницу до изменения версии области scope.
+
+    В отличие от cache_page устаревание определяется не TTL, а сигналами
+    моделей, поэтому timeout может быть большим. Страницу пересобирает
+    один запрос, взявший блокировку; остальные тем временем получают
+    устаревшую копию или ждут новую.
+    """
+
+    def decorator(func):
+        def rebuild(key, version, request, *args, **kwargs):
+            started = time.monotonic()
+            # Кэшируемая страница строится по основной базе, а не по
+            # отстающей реплике
+            with primary_reads():
+                response = func(request, *args, **kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+            if response.status_code == 200 and not response.streaming:
+                entry = CachedPage(
+                    version,
+                    time.time() + timeout,
+                    time.monotonic() - started,
+                    response.content,
+                    response["Content-Type"],
+                )
+                cache.set(key, entry, timeout + settings.CACHE_STALE_TIMEOUT)
+            return response
+
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return func(request, *args, **kwargs)
+
+            key = page_key(request, key_prefix)
+            version = get_version(scope)
+            entry = cache.get(key)
+            if entry is not None and _is_fresh(entry, version):
+                stats.incr("hits")
+                return _to_response(entry)
+
+            lock = f"{key}:lock"
+            if cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+                stats.incr("misses")
+                try:
+                    return rebuild(key, version, request, *args, **kwargs)
+                finally:
+                    cache.delete(lock)
+
+            if entry is not None:
+                stats.incr("stale")
+                return _to_response(entry)
+
+            stats.incr("lock_waits")
+            entry = _wait_for(key, version)
+            if entry is not None:
+                return _to_response(entry)
+            # Держатель блокировки не успел — строим страницу сами
+            stats.incr("misses")
+            return rebuild(key, version, request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
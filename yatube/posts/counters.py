@@ -0,0 +1,146 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from core.db import sharding
+
+from . import images
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def _update(queryset, **deltas):
+    # Счетчик мог разойтись с таблицами (до recount): уменьшение
+    # не уводит его ниже нуля, иначе UPDATE упадет на CHECK >= 0
+    return queryset.update(**{
+        name: F(name) + delta if delta >= 0 else Greatest(F(name) + delta, 0)
+        for name, delta in deltas.items()
+    })
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        _update(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def bump_post(post_id, delta):
+    _update(Post.objects.filter(pk=post_id), comments_count=delta)
+
+
+def bump_stats(user_id, **deltas):
+    """Меняет счетчики пользователя; при первом увеличении создает строку.
+
+    Уменьшение строку не создает: при каскадном удалении пользователя
+    она уже удалена, а создание сломало бы внешний ключ.
+    """
+    if _update(AuthorStats.objects.filter(pk=user_id), **deltas):
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        return
+    try:
+        with transaction.atomic():
+            AuthorStats.objects.create(user_id=user_id, **deltas)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        _update(AuthorStats.objects.filter(pk=user_id), **deltas)
+
+
+def get_stats(user):
+    """Счетчики пользователя без записи в базу для новых пользователей"""
+    return AuthorStats.objects.filter(user=user).first() or AuthorStats(
+        user=user
+    )
+
+
+def count_new_posts(posts):
+    with transaction.atomic():
+        groups = Counter(post.group_id for post in posts if post.group_id)
+        for group_id, delta in groups.items():
+            bump_group(group_id, delta)
+        authors = Counter(post.author_id for post in posts)
+        for author_id, delta in authors.items():
+            bump_stats(author_id, posts_count=delta)
+        names = Counter(post.image.name for post in posts if post.image)
+        for name, count in names.items():
+            images.acquire(name, count)
+
+
+def _count(queryset, field):
+    """Подзапрос количества строк queryset, сгруппированных по field"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def _totals(model, field):
+    """Число строк модели по значениям field, сложенное по всем шардам"""
+    totals = Counter()
+    for alias in sharding.databases(model):
+        totals.update(dict(
+            model._default_manager.db_manager(alias)
+            .filter(**{f"{field}__isnull": False})
+            .order_by()
+            .values_list(field)
+            .annotate(total=Count("pk"))
+        ))
+    return totals
+
+
+def _write_totals(model, name, totals):
+    model.objects.update(**{name: 0})
+    model.objects.bulk_update(
+        [model(pk=pk, **{name: total}) for pk, total in totals.items()],
+        [name],
+        batch_size=500,
+    )
+
+
+@transaction.atomic
+def recount():
+    """Пересчитывает все счетчики набором UPDATE по таблицам.
+
+    С шардами подзапрос к постам из основной базы невозможен: посты
+    считаются на каждом шарде, суммы записываются пачками.
+    """
+    if sharding.enabled():
+        _write_totals(Group, "posts_count", _totals(Post, "group"))
+        # Комментарии лежат на шарде своего поста
+        for alias in sharding.databases(Post):
+            Post.objects.db_manager(alias).update(comments_count=_count(
+                Comment.objects.db_manager(alias), "post"
+            ))
+    else:
+        Group.objects.update(posts_count=_count(Post.objects, "group"))
+        Post.objects.update(comments_count=_count(Comment.objects, "post"))
+
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        "pk", flat=True
+    )
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=pk) for pk in missing.iterator()),
+        # SQLite вставляет пачку одним составным SELECT — не больше 500
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    AuthorStats.objects.update(
+        followers_count=_count(Follow.objects, "author"),
+        following_count=_count(Follow.objects, "user"),
+    )
+    if sharding.enabled():
+        _write_totals(AuthorStats, "posts_count", _totals(Post, "author"))
+    else:
+        AuthorStats.objects.update(
+            posts_count=_count(Post.objects, "author")
+        )
@@ -0,0 +1,218 @@
+"""Потоковая выгрузка в NDJSON в формате posts.importer.
+
+Таблицы читаются пачками по первичному ключу (WHERE id > последний
+ORDER BY id LIMIT n), поэтому в памяти только текущая пачка, а место
+остановки — курсор "тип:id" последней записи. С ним выгрузку можно
+продолжить: каждая запись содержит свои тип и id.
+
+Сжатая выгрузка — gzip-член на пачку: склеенные члены читаются как
+один файл, а дописывать можно с границы любой пачки.
+"""
+import gzip
+import json
+from datetime import datetime, time
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .importer import LOOKUP_CHUNK, TYPES
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Строковые параметры выгрузки, см. from_params
+FILTERS = ("types", "author", "group", "since", "until")
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def parse_cursor(cursor):
+    """("post", 123) из "post:123"; пусто — с начала"""
+    if not cursor:
+        return None
+    kind, _, pk = cursor.partition(":")
+    if kind not in TYPES or not pk.isdigit():
+        raise InvalidExport(f"неверный курсор {cursor!r}")
+    return kind, int(pk)
+
+
+def parse_moment(value):
+    """Дата или дата со временем; дата — начало суток UTC"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise InvalidExport(f"неверная дата {value!r}")
+        moment = datetime.combine(day, time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.utc)
+    return moment
+
+
+def from_params(
+    types=None, author=None, group=None, since=None, until=None,
+    chunk_size=1000,
+):
+    """Exporter из строковых параметров команды или запроса"""
+    types = [kind.strip() for kind in (types or "").split(",") if kind]
+    unknown = set(types) - set(TYPES)
+    if unknown:
+        raise InvalidExport(
+            "неизвестные типы: {}".format(", ".join(sorted(unknown)))
+        )
+    author_obj = group_obj = None
+    if author:
+        author_obj = User.objects.filter(username=author).first()
+        if author_obj is None:
+            raise InvalidExport(f"нет пользователя {author!r}")
+    if group:
+        group_obj = Group.objects.filter(slug=group).first()
+        if group_obj is None:
+            raise InvalidExport(f"нет группы {group!r}")
+    return Exporter(
+        types or TYPES,
+        author=author_obj,
+        group=group_obj,
+        since=parse_moment(since),
+        until=parse_moment(until),
+        chunk_size=chunk_size,
+    )
+
+
+class Exporter:
+    """Записи выбранных типов по порядку TYPES и id.
+
+    Фильтры по автору, группе и датам относятся к постам, комментариям
+    (по их постам и дате комментария) и подпискам (только автор);
+    пользователи и группы выгружаются целиком.
+    """
+
+    def __init__(
+        self, types=TYPES, author=None, group=None, since=None, until=None,
+        chunk_size=1000,
+    ):
+        self.types = [kind for kind in TYPES if kind in types]
+        self.author = author
+        self.group = group
+        self.since = since
+        self.until = until
+        self.chunk_size = chunk_size
+        self.usernames = {}
+        self.slugs = {}
+
+    def _dates(self, field):
+        dates = {}
+        if self.since is not None:
+            dates[f"{field}__gte"] = self.since
+        if self.until is not None:
+            dates[f"{field}__lt"] = self.until
+        return dates
+
+    def querysets(self):
+        # Фильтры — по id: на шардах JOIN с пользователями и группами
+        # невозможен
+        author_id = self.author.pk if self.author else None
+        group_id = self.group.pk if self.group else None
+        posts = Post.objects.filter(**self._dates("pub_date"))
+        comments = Comment.objects.filter(**self._dates("created"))
+        follows = Follow.objects.all()
+        if author_id is not None:
+            posts = posts.filter(author_id=author_id)
+            comments = comments.filter(post__author_id=author_id)
+            follows = follows.filter(author_id=author_id)
+        if group_id is not None:
+            posts = posts.filter(group_id=group_id)
+            comments = comments.filter(post__group_id=group_id)
+        return {
+            "user": User.objects.values(
+                "id", "username", "first_name", "last_name", "email",
+                "date_joined",
+            ),
+            "group": Group.objects.values(
+                "id", "slug", "title", "description"
+            ),
+            "post": posts.values(
+                "id", "author_id", "group_id", "text", "pub_date", "image"
+            ),
+            "comment": comments.values(
+                "id", "post_id", "author_id", "text", "created"
+            ),
+            "follow": follows.values("id", "user_id", "author_id"),
+        }
+
+    def chunks(self, after=None):
+        """Пачки (курсор последней записи, строки NDJSON)"""
+        start = parse_cursor(after)
+        querysets = self.querysets()
+        for kind in self.types:
+            last = None
+            if start is not None:
+                if TYPES.index(kind) < TYPES.index(start[0]):
+                    continue
+                if kind == start[0]:
+                    last = start[1]
+            queryset = querysets[kind].order_by("pk")
+            while True:
+                chunk = queryset
+                if last is not None:
+                    chunk = chunk.filter(pk__gt=last)
+                rows = list(chunk[:self.chunk_size])
+                if not rows:
+                    break
+                last = rows[-1]["id"]
+                yield f"{kind}:{last}", self.lines(kind, rows)
+
+    def _resolve(self, cache, model, field, ids):
+        missing = sorted(
+            {pk for pk in ids if pk is not None and pk not in cache}
+        )
+        for i in range(0, len(missing), LOOKUP_CHUNK):
+            cache.update(
+                model.objects.filter(pk__in=missing[i:i + LOOKUP_CHUNK])
+                .values_list("pk", field)
+            )
+
+    def lines(self, kind, rows):
+        if kind in ("post", "comment", "follow"):
+            self._resolve(
+                self.usernames, User, "username",
+                {
+                    row[name] for row in rows
+                    for name in ("author_id", "user_id") if name in row
+                },
+            )
+        if kind == "post":
+            self._resolve(
+                self.slugs, Group, "slug", {row["group_id"] for row in rows}
+            )
+        records = (self.record(kind, row) for row in rows)
+        return [
+            json.dumps(record, ensure_ascii=False, default=_isoformat) + "\n"
+            for record in records
+        ]
+
+    def record(self, kind, row):
+        record = {"type": kind, **row}
+        if "author_id" in record:
+            record["author"] = self.usernames.get(record.pop("author_id"))
+        if kind == "follow":
+            record["user"] = self.usernames.get(record.pop("user_id"))
+        if kind == "post":
+            record["group"] = self.slugs.get(record.pop("group_id"))
+        if kind == "comment":
+            record["post"] = record.pop("post_id")
+        return record
+
+
+def encode(lines, compress=False):
+    data = "".join(lines).encode()
+    return gzip.compress(data) if compress else data
@@ -0,0 +1,281 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from core.db import sharding
+
+from .models import FEED_POST_FIELDS, AuthorStats, FeedItem, Follow, Post
+
+
+def is_popular(author_id):
+    """Посты популярных авторов не раскладываются по лентам,
+    а читаются из таблицы постов при открытии ленты"""
+    return AuthorStats.objects.filter(user_id=author_id, popular=True).exists()
+
+
+def followed(author_id):
+    """Вызывается после подписки и пересчета счетчика: автор,
+    набравший FEED_FANOUT_LIMIT подписчиков, становится популярным.
+
+    Обратно он переключается только в rebuild_all: иначе отписка
+    одного читателя дописывала бы посты автора во все ленты.
+    """
+    AuthorStats.objects.filter(
+        user_id=author_id,
+        popular=False,
+        followers_count__gte=settings.FEED_FANOUT_LIMIT,
+    ).update(popular=True)
+
+
+def popular_following(user):
+    """id популярных авторов, на которых подписан пользователь"""
+    return Follow.objects.filter(
+        user=user, author__stats__popular=True
+    ).values_list("author_id", flat=True)
+
+
+def fan_out(*posts):
+    """Добавляет новые посты в ленты подписчиков их авторов"""
+    by_author = defaultdict(list)
+    for post in posts:
+        by_author[post.author_id].append(post)
+    popular = AuthorStats.objects.filter(
+        user_id__in=by_author, popular=True
+    ).values_list("user_id", flat=True)
+    follows = Follow.objects.filter(
+        author_id__in=set(by_author) - set(popular)
+    ).values_list("user_id", "author_id")
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id, author_id in follows.iterator()
+            for post in by_author[author_id]
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту последними постами нового автора в подписках"""
+    if is_popular(author_id):
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .values_list("id", "pub_date")[:settings.FEED_BACKFILL_SIZE]
+    )
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки"""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя с нуля"""
+    FeedItem.objects.filter(user_id=user_id).delete()
+    following = Follow.objects.filter(user_id=user_id).values_list(
+        "author_id", flat=True
+    )
+    for author_id in following:
+        backfill(user_id, author_id)
+
+
+def rebuild_all():
+    """Пересобирает все ленты, как rebuild для каждого подписчика:
+    последние FEED_BACKFILL_SIZE постов каждого непопулярного автора
+    у всех его подписчиков. Популярными остаются только авторы
+    с FEED_FANOUT_LIMIT подписчиков"""
+    follows = Follow.objects.exclude(author__stats__popular=True).order_by()
+    using = FeedItem.objects.db
+    table = FeedItem._meta.db_table
+    with transaction.atomic(using), connections[using].cursor() as cursor:
+        AuthorStats.objects.update(popular=False)
+        AuthorStats.objects.filter(
+            followers_count__gte=settings.FEED_FANOUT_LIMIT
+        ).update(popular=True)
+        cursor.execute(f"DELETE FROM {table}")
+        if sharding.enabled():
+            _insert_from_shards(follows, using)
+        else:
+            _insert_ranked(cursor, follows)
+
+
+def _insert_ranked(cursor, follows):
+    """Все ленты одним INSERT ... SELECT в базе постов"""
+    ranked, ranked_params = (
+        Post.objects.annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("author_id")],
+                order_by=[F("pub_date").desc(), F("id").desc()],
+            )
+        )
+        .order_by()
+        .values("id", "author_id", "pub_date", "rank")
+        .query.sql_with_params()
+    )
+    follows, follows_params = (
+        follows.values("user_id", "author_id").query.sql_with_params()
+    )
+    cursor.execute(
+        f"INSERT INTO {FeedItem._meta.db_table} "
+        "(user_id, post_id, author_id, pub_date) "
+        "SELECT f.user_id, p.id, p.author_id, p.pub_date "
+        f"FROM ({follows}) f JOIN ({ranked}) p "
+        "ON p.author_id = f.author_id WHERE p.rank <= %s",
+        (*follows_params, *ranked_params, settings.FEED_BACKFILL_SIZE),
+    )
+
+
+def _insert_from_shards(follows, using):
+    """Посты на шардах, а ленты — в основной базе: последние посты
+    каждого автора читаются с его шарда и вставляются пачками"""
+    followers = defaultdict(list)
+    for user_id, author_id in follows.values_list(
+        "user_id", "author_id"
+    ).iterator():
+        followers[author_id].append(user_id)
+    batch = []
+    for author_id, users in followers.items():
+        posts = (
+            Post.objects.filter(author_id=author_id)
+            .values_list("id", "pub_date")[:settings.FEED_BACKFILL_SIZE]
+        )
+        for post_id, pub_date in posts:
+            batch.extend(
+                FeedItem(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in users
+            )
+            if len(batch) >= settings.FEED_BATCH_SIZE:
+                FeedItem.objects.using(using).bulk_create(batch)
+                batch = []
+    FeedItem.objects.using(using).bulk_create(batch)
+
+
+def follow_posts(user):
+    """Лента подписок.
+
+    Разложенная лента читается проходом по индексу
+    (user, -pub_date, -post) материализованной таблицы; посты
+    популярных авторов подписок читаются из таблицы постов
+    (fan-out-on-read) и вливаются в нее, см. MergedFeed.
+    """
+    popular = list(popular_following(user))
+    items = FeedItem.objects.filter(user=user).order_by("-pub_date", "-post")
+    if sharding.enabled():
+        # Посты лежат на шардах, а лента — в основной базе: JOIN между
+        # ними невозможен, посты ленты догружает as_posts
+        items = items.only("pub_date", "post")
+    else:
+        items = items.select_related("post__author", "post__group").only(
+            "pub_date",
+            "post",
+            *(f"post__{name}" for name in FEED_POST_FIELDS),
+        )
+    if not popular:
+        return items
+    posts = (
+        Post.objects.for_feed()
+        .filter(author_id__in=popular)
+        .annotate(post_id=F("id"))
+        .order_by("-pub_date", "-post_id")
+    )
+    # Записи, разложенные, пока автор еще не был популярным, уже есть
+    # среди его постов
+    return MergedFeed(items.exclude(author_id__in=popular), posts)
+
+
+class MergedFeed:
+    """Разложенная лента вместе с постами популярных авторов.
+
+    Каждая часть выбирается по своему индексу — ленты (user, -pub_date,
+    -post) и постов (author, -pub_date) — и сливается с другой
+    по (pub_date, post_id), как шарды в ShardedQuerySet: срез [:n]
+    читает из каждой части не больше n строк. Сортировку и поля
+    курсора задает лента, у постов post_id — аннотация id.
+    """
+
+    model = FeedItem
+
+    def __init__(self, items, posts):
+        self.items = items
+        self.posts = posts
+
+    @property
+    def query(self):
+        return self.items.query
+
+    def _apply(self, name, *args, **kwargs):
+        return MergedFeed(
+            getattr(self.items, name)(*args, **kwargs),
+            getattr(self.posts, name)(*args, **kwargs),
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._apply("filter", *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._apply("order_by", *fields)
+
+    def values(self, *fields):
+        return self._apply("values", *fields)
+
+    def prefetch_related(self, *lookups):
+        return self._apply("prefetch_related", *lookups)
+
+    def __iter__(self):
+        return sharding.merge_ordered(
+            self.items, [iter(self.items), iter(self.posts)]
+        )
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step or key.stop is None or (
+            (key.start or 0) < 0 or key.stop < 0
+        ):
+            raise ValueError("Only bounded forward slices are supported")
+        streams = [list(self.items[:key.stop]), list(self.posts[:key.stop])]
+        return list(islice(
+            sharding.merge_ordered(self.items, streams), key.start, key.stop
+        ))
+
+
+def as_posts(rows):
+    """Посты для страницы ленты, собранной любым из способов"""
+    if sharding.enabled():
+        ids = [row.post_id for row in rows if isinstance(row, FeedItem)]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        rows = [
+            posts.get(row.post_id) if isinstance(row, FeedItem) else row
+            for row in rows
+        ]
+        # Пост мог быть удален после раскладки ленты
+        return [post for post in rows if post is not None]
+    return [row.post if isinstance(row, FeedItem) else row for row in rows]
@@ -1,17 +1,101 @@
-from django.forms import ModelForm
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.forms import ImageField, ModelForm
+from django.template.defaultfilters import filesizeformat
+from django.utils.functional import cached_property
+from PIL import Image
 
+from . import uploads
 from .models import Comment, Post
 
 
+class UploadedImageField(ImageField):
+    """Картинка, принятая StreamingImageUploadHandler.
+
+    Лимиты размера файла и числа пикселей проверяются до того, как
+    Pillow начнет что-либо декодировать.
+    """
+
+    default_error_messages = {
+        "too_large": "Файл больше %(limit)s",
+        "too_many_pixels": "Картинка больше %(limit)s мегапикселей",
+        "unavailable": "Не удалось обработать картинку, попробуйте позже",
+    }
+
+    @cached_property
+    def limits(self):
+        return {
+            "too_large": filesizeformat(settings.IMAGE_UPLOAD_MAX_SIZE),
+            "too_many_pixels": settings.IMAGE_MAX_PIXELS // 10 ** 6,
+        }
+
+    def error(self, code):
+        return ValidationError(
+            self.error_messages[code],
+            code=code,
+            params={"limit": self.limits[code]},
+        )
+
+    def to_python(self, data):
+        if data in self.empty_values:
+            return super().to_python(data)
+        if getattr(data, "too_large", False) or (
+            data.size > settings.IMAGE_UPLOAD_MAX_SIZE
+        ):
+            raise self.error("too_large")
+        try:
+            fits = uploads.check_pixels(data)
+        except Image.DecompressionBombError:
+            fits = False
+        except (OSError, SyntaxError, ValueError):
+            # Не картинка или битый заголовок — сообщит ImageField
+            fits = True
+        finally:
+            data.seek(0)
+        if not fits:
+            raise self.error("too_many_pixels")
+        return super().to_python(data)
+
+    def process(self, value):
+        """Перекодирует принятую картинку, см. uploads.process; дорого,
+        поэтому вызывается формой, когда остальные поля уже верны"""
+        if not isinstance(value, UploadedFile):
+            return value
+        try:
+            return uploads.process(value)
+        except uploads.Unavailable:
+            raise ValidationError(
+                self.error_messages["unavailable"], code="unavailable"
+            )
+        except (Image.DecompressionBombError, OSError, SyntaxError):
+            # Заголовок прочитался, а данные картинки битые
+            raise ValidationError(
+                self.error_messages["invalid_image"], code="invalid_image"
+            )
+
+
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ("text", "group", "image")
+        field_classes = {"image": UploadedImageField}
         help_texts = {
             "text": "Вырази здесь свою душу",
             "group": "Выберите группу",
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors and "image" in cleaned_data:
+            try:
+                cleaned_data["image"] = self.fields["image"].process(
+                    cleaned_data["image"]
+                )
+            except ValidationError as error:
+                self.add_error("image", error)
+        return cleaned_data
+
 
 class CommentForm(ModelForm):
     class Meta:
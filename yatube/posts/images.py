@@ -0,0 +1,52 @@
+"""Счетчик ссылок постов на файлы картинок.
+
+Одинаковые картинки хранятся одним файлом (см. posts.storage), поэтому
+удалять файл и его миниатюры можно только вместе с последним постом.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import ImageBlob, Post
+from .storage import variant_name
+
+
+def acquire(name, count=1):
+    if not name:
+        return
+    updated = ImageBlob.objects.filter(name=name).update(
+        refs=F("refs") + count
+    )
+    if updated:
+        return
+    storage = Post._meta.get_field("image").storage
+    size = storage.size(name) if storage.exists(name) else 0
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(name=name, size=size, refs=count)
+    except IntegrityError:
+        ImageBlob.objects.filter(name=name).update(refs=F("refs") + count)
+
+
+def release(name, count=1):
+    """Уменьшает счетчик; файл удаляется после фиксации транзакции,
+    если на него так никто и не сослался"""
+    if not name:
+        return
+    ImageBlob.objects.filter(name=name, refs__gte=count).update(
+        refs=F("refs") - count
+    )
+    if ImageBlob.objects.filter(name=name, refs__lte=0).delete()[0]:
+        transaction.on_commit(lambda: purge(name))
+
+
+def purge(name):
+    # Та же картинка могла быть загружена заново, пока шла транзакция
+    if ImageBlob.objects.filter(name=name).exists():
+        return
+    storage = Post._meta.get_field("image").storage
+    delete_thumbnails(ImageFile(name, storage))
+    webp = variant_name(name, ".webp")
+    if webp != name:
+        storage.delete(webp)
@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет задержку, пропускную способность и запросы к базе "
+        "для каждой страницы posts.urls и users.urls"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode", choices=tuple(benchmark.TRANSPORTS), default="client",
+            help="client — тестовый клиент, wsgi — HTTP к локальному "
+                 "WSGI-серверу",
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument(
+            "--exclude", action="append", default=[],
+            help="Имя адреса (posts:index или index), можно несколько раз",
+        )
+        parser.add_argument("--output", help="Сохранить результаты в JSON")
+        parser.add_argument(
+            "--baseline",
+            help="JSON прошлого прогона; регрессии завершают команду "
+                 "с ошибкой",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Допустимый рост p95 и числа запросов относительно "
+                 "baseline",
+        )
+        parser.add_argument(
+            "--debug", action="store_true",
+            help="Не выключать DEBUG на время прогона",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+        try:
+            results = benchmark.run(
+                mode=options["mode"],
+                iterations=options["iterations"],
+                warmup=options["warmup"],
+                exclude=set(options["exclude"]),
+                debug=options["debug"],
+            )
+        except benchmark.BenchmarkError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f"{'url':<32} {'status':>6} {'p50':>8} {'p95':>8} {'p99':>8} "
+            f"{'rps':>8} {'queries':>7} {'bytes':>8}"
+        )
+        for name, result in results["urls"].items():
+            self.stdout.write(
+                "{name:<32} {status:>6} {p50_ms:>8.1f} {p95_ms:>8.1f} "
+                "{p99_ms:>8.1f} {rps:>8.0f} {queries:>7.1f} "
+                "{bytes:>8}".format(name=name, **result)
+            )
+        self.stdout.write(f"total: {results['rps']:.0f} requests/s")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        if baseline is not None:
+            regressions = benchmark.compare(
+                results, baseline, options["tolerance"]
+            )
+            for name, change in regressions:
+                self.stderr.write(f"{name}: {change}")
+            if regressions:
+                raise CommandError(f"Регрессий: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
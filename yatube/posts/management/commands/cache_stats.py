@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import stats
+
+
+class Command(BaseCommand):
+    help = "Показывает счетчики кэша страниц, собранные всеми воркерами"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Обнулить счетчики после вывода",
+        )
+
+    def handle(self, *args, reset=False, **options):
+        counters = stats.snapshot()
+        for name in stats.names:
+            self.stdout.write(f"{name}: {counters.get(name, 0)}")
+        served = counters.get("hits", 0) + counters.get("stale", 0)
+        total = served + counters.get("misses", 0)
+        ratio = served / total if total else 0.0
+        self.stdout.write(f"hit ratio: {ratio:.1%}")
+        if reset:
+            stats.reset()
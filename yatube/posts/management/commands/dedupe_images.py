@@ -0,0 +1,84 @@
+import os
+import shutil
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts import images
+from posts.models import ImageBlob, Post
+from posts.storage import (
+    CONTENT_NAME_RE, UPLOAD_DIR, content_name, hash_file
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит картинки постов в имена по хешу содержимого, "
+        "удаляя повторяющиеся файлы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только посчитать, ничего не менять",
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        storage = Post._meta.get_field("image").storage
+        stats = Counter()
+        # Каталоги обходятся по одному, без списка всех файлов в памяти
+        for dirpath, _, filenames in os.walk(storage.path(UPLOAD_DIR)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.location)
+                name = name.replace(os.sep, "/")
+                if CONTENT_NAME_RE.match(name) or name.endswith(".tmp"):
+                    continue
+                stats["scanned"] += 1
+                if not Post.objects.filter(image=name).exists():
+                    stats["orphans"] += 1
+                    continue
+
+                with open(path, "rb") as f:
+                    target = content_name(hash_file(f), filename)
+                duplicate = storage.exists(target)
+                if duplicate:
+                    stats["duplicates"] += 1
+                    stats["freed"] += os.path.getsize(path)
+                if dry_run:
+                    continue
+                self.move(storage, name, target, duplicate)
+                stats["moved"] += 1
+
+        self.stdout.write(
+            "Scanned {scanned}, moved {moved}, duplicates {duplicates} "
+            "({freed} bytes freed), orphans skipped {orphans}".format(
+                **{key: stats[key] for key in (
+                    "scanned", "moved", "duplicates", "freed", "orphans"
+                )}
+            )
+        )
+
+    def move(self, storage, name, target, duplicate):
+        # Файл копируется до обновления базы, а старый удаляется только
+        # после коммита: при откате посты по-прежнему видят свой файл
+        if not duplicate:
+            path = storage.path(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(storage.path(name), path + ".tmp")
+            os.replace(path + ".tmp", path)
+        with transaction.atomic():
+            refs = Post.objects.filter(image=name).update(image=target)
+            ImageBlob.objects.filter(name=name).delete()
+            images.acquire(target, refs)
+            transaction.on_commit(lambda: self.discard(storage, name))
+
+    def discard(self, storage, name):
+        # Миниатюры старого имени больше никто не покажет; для нового
+        # их построит пул при первом показе
+        default.kvstore.delete_thumbnails(ImageFile(name, storage))
+        storage.delete(name)
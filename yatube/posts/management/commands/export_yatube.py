@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import exporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает пользователей, группы, посты, комментарии и подписки "
+        "в NDJSON для import_yatube, читая таблицы пачками по id"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Файл выгрузки, - — stdout"
+        )
+        parser.add_argument(
+            "--types", help="Типы записей через запятую, по умолчанию все"
+        )
+        parser.add_argument("--author", help="Имя автора постов")
+        parser.add_argument("--group", help="Адрес группы постов")
+        parser.add_argument("--since", help="Дата, с которой (включительно)")
+        parser.add_argument("--until", help="Дата, до которой (не включая)")
+        parser.add_argument(
+            "--gzip", action="store_true",
+            help="Сжать; для файлов .gz включается само",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--after", help="Продолжить после записи тип:id (для stdout)"
+        )
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Дописать файл, прерванный прошлым запуском",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        compress = options["gzip"] or path.endswith(".gz")
+        filters = {name: options[name] for name in exporter.FILTERS}
+        try:
+            job = exporter.from_params(
+                chunk_size=options["chunk_size"], **filters
+            )
+            exporter.parse_cursor(options["after"])
+        except exporter.InvalidExport as error:
+            raise CommandError(error)
+
+        if path == "-":
+            self.export(job, sys.stdout.buffer, compress, options["after"])
+            return
+
+        checkpoint_path = f"{path}.checkpoint"
+        after, offset = options["after"], 0
+        if options["resume"]:
+            if not os.path.exists(checkpoint_path):
+                raise CommandError(f"Нет контрольной точки {checkpoint_path}")
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint["filters"] != filters:
+                raise CommandError("Параметры не совпадают с прерванными")
+            after, offset = checkpoint["cursor"], checkpoint["offset"]
+
+        def on_chunk(cursor, output):
+            tmp = f"{checkpoint_path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(
+                    {
+                        "cursor": cursor,
+                        "offset": output.tell(),
+                        "filters": filters,
+                    },
+                    f,
+                )
+            os.replace(tmp, checkpoint_path)
+
+        mode = "r+b" if options["resume"] else "wb"
+        with open(path, mode) as output:
+            # Хвост после последней сохраненной пачки мог оборваться
+            output.truncate(offset)
+            output.seek(offset)
+            written = self.export(job, output, compress, after, on_chunk)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {written} records to {path}")
+        )
+
+    def export(self, job, output, compress, after, on_chunk=None):
+        written = 0
+        for cursor, lines in job.chunks(after):
+            output.write(exporter.encode(lines, compress))
+            output.flush()
+            written += len(lines)
+            if on_chunk:
+                on_chunk(cursor, output)
+        return written
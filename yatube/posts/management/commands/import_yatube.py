@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.db import sharding
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует пользователей, группы, посты, комментарии и подписки "
+        "из NDJSON или CSV пачками bulk_create"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл с данными, - — stdin")
+        parser.add_argument(
+            "--format", choices=("ndjson", "csv"),
+            help="По умолчанию — по расширению файла",
+        )
+        parser.add_argument(
+            "--type", choices=importer.TYPES, dest="record_type",
+            help="Тип записей без поля type (обязателен для CSV)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл контрольной точки; если он есть, импорт "
+                 "продолжается с сохраненного места",
+        )
+        parser.add_argument(
+            "--skip-rebuild", action="store_true",
+            help="Не пересобирать счетчики, ленты и поисковый индекс "
+                 "(например, до импорта последнего файла)",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options["checkpoint"]
+        if checkpoint and sharding.enabled():
+            # Новые id постов входа помнит только текущий запуск:
+            # продолженный импорт не нашел бы постов для комментариев
+            raise CommandError(
+                "С шардами импорт нельзя продолжать с контрольной точки"
+            )
+        path = options["path"]
+        fmt = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "ndjson"
+        )
+        if fmt == "csv" and not options["record_type"]:
+            raise CommandError("Для CSV нужен --type")
+        source = path if path == "-" else os.path.abspath(path)
+        try:
+            start = importer.load_checkpoint(checkpoint, source)
+        except importer.InvalidRecord as error:
+            raise CommandError(error)
+
+        job = importer.Importer(
+            options["batch_size"], record_type=options["record_type"]
+        )
+        started = time.monotonic()
+
+        def on_batch(position, errors):
+            if checkpoint:
+                importer.save_checkpoint(checkpoint, source, position)
+            if options["verbosity"] >= 2:
+                for line, reason in errors:
+                    self.stderr.write(f"record {line}: {reason}")
+                self.stdout.write(
+                    self.report(position - start, job.stats, started)
+                )
+
+        stream = (
+            nullcontext(sys.stdin) if path == "-"
+            else open(path, encoding="utf-8", newline="")
+        )
+        with stream as stream:
+            records = importer.read_records(
+                stream, fmt, options["record_type"]
+            )
+            position = job.run(records, start, on_batch)
+
+        if not options["skip_rebuild"]:
+            importer.rebuild_derived()
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            self.report(position - start, job.stats, started)
+        ))
+
+    def report(self, records, stats, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        counts = ", ".join(
+            f"{stats[name]} {name}s" for name in importer.TYPES
+        )
+        return (
+            f"{records} records in {elapsed:.1f}s "
+            f"({records / elapsed:.0f} rows/s): {counts}, "
+            f"{stats['duplicates']} duplicates, {stats['skipped']} skipped"
+        )
@@ -0,0 +1,89 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark, microbench
+
+
+class Command(BaseCommand):
+    help = (
+        "Микробенчмарки пагинации, шаблонов, фильтра addclass, форм "
+        "и миниатюр: время вызова, запросы к базе и память"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", action="append", default=[],
+            help="Префикс имени замера (render, form.post), можно "
+                 "несколько раз",
+        )
+        parser.add_argument(
+            "--list", action="store_true", help="Показать замеры и выйти"
+        )
+        parser.add_argument(
+            "--number", type=int, default=100, help="Вызовов в раунде"
+        )
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--output", help="Сохранить результаты в JSON")
+        parser.add_argument(
+            "--baseline",
+            help="JSON прошлого прогона; регрессии завершают команду "
+                 "с ошибкой",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Допустимый рост среднего времени относительно baseline; "
+                 "рост числа запросов не допускается",
+        )
+        parser.add_argument(
+            "--debug", action="store_true",
+            help="Не выключать DEBUG на время прогона",
+        )
+
+    def handle(self, *args, **options):
+        names = microbench.selected(options["only"])
+        if options["list"]:
+            for name in names:
+                self.stdout.write(name)
+            return
+        if not names:
+            raise CommandError("Ни один замер не подходит под --only")
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+        try:
+            results = microbench.run(
+                names,
+                number=options["number"],
+                repeat=options["repeat"],
+                warmup=options["warmup"],
+                debug=options["debug"],
+            )
+        except benchmark.BenchmarkError as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f"{'benchmark':<26} {'mean us':>9} {'stdev':>8} {'min us':>9} "
+            f"{'queries':>7} {'peak KiB':>9} {'blocks':>7}"
+        )
+        for name, result in results["benchmarks"].items():
+            self.stdout.write(
+                "{name:<26} {mean_us:>9.1f} {stdev_us:>8.1f} "
+                "{min_us:>9.1f} {queries:>7} {peak_kib:>9.1f} "
+                "{blocks:>7.1f}".format(name=name, **result)
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        if baseline is not None:
+            regressions = microbench.compare(
+                results, baseline, options["tolerance"]
+            )
+            for name, change in regressions:
+                self.stderr.write(f"{name}: {change}")
+            if regressions:
+                raise CommandError(f"Регрессий: {len(regressions)}")
+            self.stdout.write(self.style.SUCCESS("Регрессий нет"))
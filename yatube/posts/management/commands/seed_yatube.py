@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, группами, постами, "
+        "комментариями и подписками для нагрузочных тестов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=10000)
+        parser.add_argument("--comments", type=int, default=20000)
+        parser.add_argument("--follows", type=int, default=10000)
+        parser.add_argument(
+            "--days", type=int, default=365,
+            help="За сколько последних дней распределить посты",
+        )
+        parser.add_argument(
+            "--skew", type=float, default=1.1,
+            help="Показатель степенного закона для популярности авторов, "
+                 "групп и постов",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Одинаковый seed дает одинаковые данные",
+        )
+        parser.add_argument(
+            "--prefix", default="seed",
+            help="Префикс имен пользователей и адресов групп",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-rebuild", action="store_true",
+            help="Не пересобирать счетчики, ленты и поисковый индекс",
+        )
+
+    def handle(self, *args, **options):
+        if options["skew"] <= 0:
+            raise CommandError("--skew должен быть больше нуля")
+        if options["users"] < 1:
+            raise CommandError("--users должен быть не меньше 1")
+        for name in ("groups", "posts", "comments", "follows"):
+            if options[name] < 0:
+                raise CommandError(f"--{name} не может быть отрицательным")
+        if options["comments"] and not options["posts"]:
+            raise CommandError("Для --comments нужны посты")
+        records = seed.records(
+            users=options["users"],
+            groups=options["groups"],
+            posts=options["posts"],
+            comments=options["comments"],
+            follows=options["follows"],
+            days=options["days"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+            exponent=options["skew"],
+        )
+        job = importer.Importer(options["batch_size"])
+        started = time.monotonic()
+        position = job.run(records)
+        if not options["skip_rebuild"]:
+            importer.rebuild_derived()
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        counts = ", ".join(
+            f"{job.stats[name]} {name}s" for name in importer.TYPES
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{position} records in {elapsed:.1f}s "
+            f"({position / elapsed:.0f} rows/s): {counts}, "
+            f"{job.stats['duplicates']} duplicates"
+        ))
@@ -0,0 +1,282 @@
+"""Микробенчмарки частей, через которые проходит каждая страница.
+
+Пагинация add_pagination, отрисовка article.html и paginator.html
+для страницы постов, фильтр addclass, проверка PostForm и CommentForm
+и разрешение миниатюр. Каждый замер — repeat раундов по number
+вызовов, как в timeit и с тем же выключенным сборщиком мусора:
+среднее и дисперсия времени вызова по раундам. Отдельными проходами
+считаются запросы к базе и память через tracemalloc: пик выделенной
+памяти за вызов и блоки, которые остаются живыми после вызова.
+"""
+import gc
+import statistics
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.template import engines
+from django.template.response import TemplateResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from core.templatetags.user_filters import addclass
+
+from . import thumbnails
+from .benchmark import BenchmarkError
+from .forms import CommentForm, PostForm
+from .models import Group, Post
+from .paginator import CursorPaginator
+from .views import add_pagination
+
+BENCHMARKS = {}
+# Трассировка tracemalloc не попадает в собственную статистику
+TRACE_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),)
+
+
+def register(name):
+    """Регистрирует фабрику замера: по данным возвращает вызов без
+    аргументов, который и замеряется"""
+
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def sample():
+    """Страница постов и запросы, общие для всех замеров"""
+    per_page = settings.PAGINATION_OBJECTS_NUM
+    posts = list(Post.objects.for_feed()[:per_page])
+    if not posts:
+        raise BenchmarkError("В базе нет постов")
+    factory = RequestFactory(SERVER_NAME="localhost")
+    first = CursorPaginator(Post.objects.for_feed(), per_page).get_page()
+    data = SimpleNamespace(
+        posts=posts,
+        group=Group.objects.first(),
+        request=factory.get("/"),
+        offset_request=factory.get("/", {"page": 2}),
+        cursor_request=factory.get(
+            "/", {"after": first.next_cursor or ""}
+        ),
+    )
+    for request in (data.request, data.offset_request, data.cursor_request):
+        request.user = AnonymousUser()
+    return data
+
+
+def _paginated(**options):
+    empty = engines["django"].from_string("")
+
+    @add_pagination(**options)
+    def view(request):
+        return TemplateResponse(
+            request, empty, {"obj": Post.objects.for_feed()}
+        )
+
+    return view
+
+
+@register("pagination.offset")
+def pagination_offset(data):
+    view = _paginated()
+    return lambda: view(data.offset_request)
+
+
+@register("pagination.cursor")
+def pagination_cursor(data):
+    view = _paginated(cursor=True)
+    return lambda: view(data.cursor_request)
+
+
+@register("render.article")
+def render_article(data):
+    # Как в index.html: article.html на каждый пост страницы
+    template = engines["django"].from_string(
+        "{% for post in page_obj %}"
+        "{% include 'posts/includes/article.html' %}"
+        "{% endfor %}"
+    )
+    thumbnails.resolve_page(data.posts)
+    context = {"page_obj": data.posts}
+    return lambda: template.render(context, data.request)
+
+
+def _render_paginator(data, page_obj):
+    template = engines["django"].from_string(
+        "{% include 'posts/includes/paginator.html' %}"
+    )
+    context = {"page_obj": page_obj, "page_query": ""}
+    return lambda: template.render(context, data.request)
+
+
+@register("render.paginator.offset")
+def render_paginator_offset(data):
+    view = _paginated()
+    # Количество постов пагинатор уже посчитал и запомнил
+    page_obj = view(data.offset_request).context_data["page_obj"]
+    return _render_paginator(data, page_obj)
+
+
+@register("render.paginator.cursor")
+def render_paginator_cursor(data):
+    view = _paginated(cursor=True)
+    page_obj = view(data.cursor_request).context_data["page_obj"]
+    return _render_paginator(data, page_obj)
+
+
+@register("filter.addclass")
+def filter_addclass(data):
+    field = CommentForm()["text"]
+    return lambda: addclass(field, "form-control")
+
+
+@register("form.post")
+def form_post(data):
+    form_data = {"text": data.posts[0].text}
+    if data.group is not None:
+        form_data["group"] = str(data.group.pk)
+    return lambda: PostForm(data=form_data).is_valid()
+
+
+@register("form.comment")
+def form_comment(data):
+    form_data = {"text": "Комментарий"}
+    return lambda: CommentForm(data=form_data).is_valid()
+
+
+@register("thumbnails.resolve_page")
+def thumbnails_resolve_page(data):
+    # У постов без картинки разрешать нечего, поэтому каждому посту
+    # страницы — картинка; файлы при разрешении не читаются
+    posts = [
+        Post(
+            pk=post.pk,
+            image=post.image.name or f"posts/microbench-{post.pk}.jpg",
+        )
+        for post in data.posts
+    ]
+    return lambda: thumbnails.resolve_page(posts)
+
+
+def timings(func, number, repeat):
+    """Время одного вызова в каждом из repeat раундов"""
+    rounds = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            rounds.append((time.perf_counter() - started) / number)
+    finally:
+        if enabled:
+            gc.enable()
+    return rounds
+
+
+def allocations(func, number):
+    """Пик памяти за вызов и живые блоки и байты после вызова"""
+    gc.collect()
+    peak = 0
+    for _ in range(number):
+        # tracemalloc.reset_peak есть только с Python 3.9: пик вызова —
+        # пик трассировки, запущенной перед ним
+        tracemalloc.start()
+        try:
+            func()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        for _ in range(number):
+            func()
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    return {
+        "peak_kib": peak / 1024,
+        "blocks": sum(stat.count_diff for stat in diff) / number,
+        "retained_bytes": sum(stat.size_diff for stat in diff) / number,
+    }
+
+
+def queries(func):
+    with CaptureQueriesContext(connection) as context:
+        func()
+    return len(context)
+
+
+def measure(func, number=100, repeat=10, warmup=10):
+    for _ in range(warmup):
+        func()
+    rounds = timings(func, number, repeat)
+    result = {
+        "mean_us": statistics.mean(rounds) * 10 ** 6,
+        "variance_us2": (
+            statistics.variance(rounds) * 10 ** 12 if repeat > 1 else 0.0
+        ),
+        "min_us": min(rounds) * 10 ** 6,
+        "queries": queries(func),
+    }
+    result["stdev_us"] = result["variance_us2"] ** 0.5
+    result.update(allocations(func, number))
+    return result
+
+
+def selected(only=()):
+    """Имена замеров, начинающиеся с любого из only (все, если пусто)"""
+    return [
+        name for name in BENCHMARKS
+        if not only or any(name.startswith(prefix) for prefix in only)
+    ]
+
+
+def run(names=None, number=100, repeat=10, warmup=10, debug=False):
+    """Результаты замеров names; DEBUG выключается, как в benchmark.run"""
+    if number < 1 or repeat < 1:
+        raise BenchmarkError("Нужен хотя бы один вызов и один раунд")
+    unknown = set(names or ()) - set(BENCHMARKS)
+    if unknown:
+        raise BenchmarkError(
+            "Неизвестные замеры: {}".format(", ".join(sorted(unknown)))
+        )
+    results = {}
+    with override_settings(DEBUG=settings.DEBUG and debug):
+        data = sample()
+        for name in names or BENCHMARKS:
+            func = BENCHMARKS[name](data)
+            results[name] = measure(func, number, repeat, warmup)
+    return {
+        "number": number,
+        "repeat": repeat,
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Регрессии относительно baseline: [(имя, описание)]"""
+    regressions = []
+    for name, result in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            continue
+        if result["mean_us"] > base["mean_us"] * (1 + tolerance):
+            regressions.append((
+                name,
+                f"mean {base['mean_us']:.1f} -> {result['mean_us']:.1f} us",
+            ))
+        if result["queries"] > base["queries"]:
+            regressions.append((
+                name, f"queries {base['queries']} -> {result['queries']}"
+            ))
+    return regressions
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:15
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def fill_blobs(apps, schema_editor):
+    Post = apps.get_model("posts", "Post")
+    ImageBlob = apps.get_model("posts", "ImageBlob")
+    storage = Post._meta.get_field("image").storage
+
+    refs = (
+        Post.objects.exclude(image="")
+        .order_by()
+        .values_list("image")
+        .annotate(refs=Count("pk"))
+    )
+    ImageBlob.objects.bulk_create(
+        (
+            ImageBlob(
+                name=name,
+                size=storage.size(name) if storage.exists(name) else 0,
+                refs=count,
+            )
+            for name, count in refs.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to=posts.storage.post_image_path, verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_blobs, migrations.RunPython.noop),
+    ]
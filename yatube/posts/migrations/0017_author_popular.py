@@ -0,0 +1,27 @@
+# Generated by Django 2.2.19 on 2026-10-18 05:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    AuthorStats = apps.get_model("posts", "AuthorStats")
+    AuthorStats.objects.filter(
+        followers_count__gte=settings.FEED_FANOUT_LIMIT
+    ).update(popular=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_shard_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='popular',
+            field=models.BooleanField(default=False, verbose_name='Популярный автор'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models, transaction
+
+from core.db import sharding
+
+from .storage import ContentAddressedStorage, post_image_path
 
 User = get_user_model()
 
@@ -18,12 +22,105 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name="Описание", help_text="Введите описание группы"
     )
+    posts_count = models.PositiveIntegerField(
+        verbose_name="Количество постов",
+        default=0,
+        editable=False,
+    )
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+# Поля, которые нужны карточке поста в ленте
+FEED_POST_FIELDS = (
+    "id",
+    "text",
+    "pub_date",
+    "image",
+    "author__username",
+    "author__first_name",
+    "author__last_name",
+    "group__title",
+    "group__slug",
+)
+
+
+def _split_fields(fields):
+    """Поля модели и поля связей: ("id", "author__username") ->
+    ["id", "author"], {"author": ["username"]}"""
+    local, related = [], {}
+    for name in fields:
+        relation, _, field = name.partition("__")
+        if field:
+            related.setdefault(relation, []).append(field)
+            if relation not in local:
+                local.append(relation)
+        else:
+            local.append(name)
+    return local, related
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для ленты: авторы и группы одним запросом,
+        только поля, которые нужны карточке поста"""
+        if sharding.enabled():
+            # Авторы и группы в основной базе — JOIN с шардом невозможен
+            local, related = _split_fields(FEED_POST_FIELDS)
+            return self.only(*local).prefetch_related(*(
+                models.Prefetch(
+                    name,
+                    self.model._meta.get_field(name)
+                    .related_model.objects.only(*fields),
+                )
+                for name, fields in related.items()
+            ))
+        return self.select_related("author", "group").only(*FEED_POST_FIELDS)
+
+    def with_related(self):
+        """Посты вместе с авторами и группами"""
+        if sharding.enabled():
+            return self.prefetch_related("author", "group")
+        return self.select_related("author", "group")
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        """bulk_create не посылает сигналов — счетчики, поисковый
+        индекс, ленты подписчиков и версию кэша обновляем сами"""
+        from . import feed
+        from .cache import INDEX_SCOPE, bump_version
+        from .counters import count_new_posts
+        from .search import get_backend
+
+        objs = list(objs)
+        new = [obj for obj in objs if obj.pk is None]
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, batch_size, ignore_conflicts)
+            if not ignore_conflicts:
+                self._set_inserted_ids(new)
+        count_new_posts(objs)
+        created = [obj for obj in objs if obj.pk is not None]
+        get_backend().index(created)
+        feed.fan_out(*created)
+        bump_version(INDEX_SCOPE)
+        return objs
+
+    def _set_inserted_ids(self, new):
+        # SQLite не возвращает id вставленных строк, но с первого INSERT
+        # держит блокировку записи до конца транзакции: последние
+        # len(new) id — эти строки, в порядке вставки
+        if not new or new[-1].pk is not None:
+            return
+        if connections[self.db].vendor != "sqlite":
+            return
+        ids = self.order_by("-id").values_list("id", flat=True)[:len(new)]
+        for obj, pk in zip(new, reversed(list(ids))):
+            obj.pk = pk
+            obj._state.adding = False
+            obj._state.db = self.db
+
+
+class Post(sharding.ShardedModel):
     text = models.TextField(
         verbose_name="Текст",
         help_text="Введите текст поста"
@@ -32,13 +129,15 @@ class Post(models.Model):
         verbose_name="Дата публикации",
         auto_now_add=True,
     )
-    author = models.ForeignKey(
+    author = sharding.CrossShardForeignKey(
         User,
         verbose_name="Автор",
         related_name="posts",
         on_delete=models.CASCADE,
+        # Префикс составного индекса post_author_pub_date_idx
+        db_index=False,
     )
-    group = models.ForeignKey(
+    group = sharding.CrossShardForeignKey(
         Group,
         verbose_name="Группа",
         help_text="Группа, к которой будет относиться пост",
@@ -46,27 +145,106 @@ class Post(models.Model):
         on_delete=models.SET_NULL,
         blank=True,
         null=True,
+        db_index=False,
     )
     image = models.ImageField(
         verbose_name="Картинка",
-        upload_to="posts/",
+        upload_to=post_image_path,
+        storage=ContentAddressedStorage(),
         blank=True)
+    comments_count = models.PositiveIntegerField(
+        verbose_name="Количество комментариев",
+        default=0,
+        editable=False,
+    )
+
+    objects = sharding.ShardedManager.from_queryset(PostQuerySet)()
+
+    # Посты автора лежат на одном шарде
+    shard_by = "author"
 
     class Meta:
         ordering = ["-pub_date", "-id"]
+        indexes = [
+            # Сортировка лент и иерархия дат в админке
+            models.Index(
+                fields=["-pub_date", "-id"], name="post_pub_date_idx"
+            ),
+            # Профиль и страница группы: фильтр и сортировка одним
+            # проходом по индексу
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class SearchTextField(models.TextField):
+    """Колонка полнотекстового индекса с lookup match"""
+
+
+@SearchTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class PostSearchIndex(models.Model):
+    """Виртуальная таблица FTS5 с текстами постов (только SQLite).
+
+    Таблицу создает миграция, заполняет posts.search; rank — скрытая
+    колонка FTS5 с bm25 текущего запроса.
+    """
+
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+        on_delete=models.DO_NOTHING,
+    )
+    text = SearchTextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "posts_post_fts"
+
+
+class CommentQuerySet(models.QuerySet):
+    def for_display(self):
+        """Комментарии с именами авторов для страницы поста"""
+        if sharding.enabled():
+            return self.only(
+                "text", "created", "post_id", "author"
+            ).prefetch_related(
+                models.Prefetch("author", User.objects.only("username"))
+            )
+        return self.select_related("author").only(
+            "text", "created", "post_id", "author__username"
+        )
+
+
+class Comment(sharding.ShardedModel):
     post = models.ForeignKey(
         Post,
         verbose_name="Пост",
         related_name="comment",
         on_delete=models.CASCADE,
+        db_index=False,
     )
-    author = models.ForeignKey(
+    author = sharding.CrossShardForeignKey(
         User,
         verbose_name="Автор",
         related_name="comment",
@@ -80,8 +258,23 @@ class Comment(models.Model):
         auto_now_add=True,
     )
 
+    objects = sharding.ShardedManager.from_queryset(CommentQuerySet)()
+
+    # Комментарии лежат на шарде своего поста
+    shard_by = "post"
+
     class Meta:
         ordering = ["-created", "-id"]
+        indexes = [
+            models.Index(
+                fields=["-created", "-id"], name="comment_created_idx"
+            ),
+            # Комментарии поста по страницам
+            models.Index(
+                fields=["post", "-created", "-id"],
+                name="comment_post_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.text[:30]
@@ -93,12 +286,14 @@ class Follow(models.Model):
         verbose_name="Подписчик",
         related_name="follower",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         verbose_name="Автор",
         related_name="following",
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
@@ -108,3 +303,99 @@ class Follow(models.Model):
                 name="unique_following",
             )
         ]
+        indexes = [
+            # Подписчики автора; подписки пользователя покрывает
+            # unique_following
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """Материализованная лента подписок: строка на пост у каждого
+    подписчика автора. pub_date дублируется из поста, чтобы лента
+    читалась одним проходом по индексу (user, -pub_date, -post)"""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name="Подписчик",
+        related_name="feed",
+        on_delete=models.CASCADE,
+    )
+    post = sharding.CrossShardForeignKey(
+        Post,
+        verbose_name="Пост",
+        related_name="feed_items",
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name="Автор",
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_feed_item",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="feed_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"],
+                name="feed_user_author_idx",
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя, которые поддерживают сигналы posts.signals"""
+
+    user = models.OneToOneField(
+        User,
+        verbose_name="Пользователь",
+        related_name="stats",
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name="Количество постов",
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Количество подписчиков",
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name="Количество подписок",
+        default=0,
+    )
+    # Посты автора читаются из таблицы постов при открытии ленты,
+    # а не раскладываются по лентам подписчиков, см. posts.feed
+    popular = models.BooleanField(
+        verbose_name="Популярный автор",
+        default=False,
+    )
+
+
+class ImageBlob(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются"""
+
+    name = models.CharField(
+        verbose_name="Файл",
+        max_length=255,
+        unique=True,
+    )
+    size = models.BigIntegerField(verbose_name="Размер", default=0)
+    refs = models.PositiveIntegerField(
+        verbose_name="Количество ссылок",
+        default=0,
+    )
@@ -0,0 +1,270 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Max, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее известным количеством объектов,
+    например из счетчика — без COUNT(*) на каждый запрос"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @property
+    def count(self):
+        return self._count
+
+
+def estimate_table_rows(model, using="default"):
+    """Примерное число строк таблицы без прохода по ней.
+
+    Берется из статистики планировщика (ANALYZE в SQLite,
+    reltuples в PostgreSQL), а без нее — максимальный id.
+    """
+    connection = connections[using]
+    queries = {
+        "sqlite": (
+            "SELECT stat FROM sqlite_stat1 WHERE tbl = %s "
+            "ORDER BY idx IS NOT NULL LIMIT 1"
+        ),
+        "postgresql": "SELECT reltuples FROM pg_class WHERE relname = %s",
+    }
+    sql = queries.get(connection.vendor)
+    if sql is not None:
+        try:
+            with transaction.atomic(using), connection.cursor() as cursor:
+                cursor.execute(sql, [model._meta.db_table])
+                row = cursor.fetchone()
+            if row:
+                return max(int(float(str(row[0]).split()[0])), 0)
+        except DatabaseError:
+            # Статистики еще нет: ANALYZE не запускался
+            pass
+    return model._default_manager.using(using).aggregate(
+        last=Max("pk")
+    )["last"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator админки без точного COUNT(*) по большим выборкам.
+
+    Точный счет ограничен ESTIMATED_COUNT_LIMIT строк; если выборка
+    больше, число страниц берется из оценки размера таблицы — последние
+    страницы при этом могут оказаться пустыми. Оценка таблицы ничего
+    не говорит о фильтрованной выборке (фильтры, поиск, даты), поэтому
+    такая считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ESTIMATED_COUNT_LIMIT
+        queryset = self.object_list
+        if queryset.query.where:
+            return queryset.count()
+        counted = queryset.order_by()[:limit + 1].count()
+        if counted <= limit:
+            return counted
+        return max(estimate_table_rows(queryset.model, queryset.db), counted)
+
+
+class CursorPage(Sequence):
+    """Страница курсорной пагинации.
+
+    В отличие от django.core.paginator.Page не знает общего количества
+    объектов и номера страницы — только соседей по обе стороны.
+    """
+
+    is_cursor = True
+
+    def __init__(self, rows, paginator, has_next, has_previous):
+        self.rows = rows
+        self.object_list = (
+            paginator.transform(rows) if paginator.transform else rows
+        )
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return "<Cursor page of %s objects>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.rows:
+            return None
+        return self.paginator.encode_cursor(self.rows[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.rows:
+            return None
+        return self.paginator.encode_cursor(self.rows[0])
+
+
+class _AnnotationField:
+    """Аннотация queryset в роли поля сортировки"""
+
+    def __init__(self, name, output_field):
+        self.attname = name
+        self.output_field = output_field
+
+    def to_python(self, value):
+        return self.output_field.to_python(value)
+
+
+class CursorPaginator:
+    """Keyset-пагинация по полям сортировки queryset.
+
+    Вместо OFFSET и COUNT(*) страница выбирается условием по значениям
+    ключа сортировки последнего (первого) объекта соседней страницы,
+    поэтому стоимость запроса не зависит от глубины.
+    Последним полем сортировки должен быть уникальный ключ (обычно id).
+    """
+
+    def __init__(self, object_list, per_page, ordering=None, transform=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        # transform превращает строки queryset в объекты страницы,
+        # например записи материализованной ленты в посты
+        self.transform = transform
+        model = object_list.model
+        annotations = object_list.query.annotations
+        ordering = (
+            ordering
+            or object_list.query.order_by
+            or model._meta.ordering
+        )
+        self.fields = []
+        for name in ordering:
+            descending = name.startswith("-")
+            name = name.lstrip("-")
+            if name in annotations:
+                # Например, оценка релевантности поиска
+                field = _AnnotationField(name, annotations[name].output_field)
+            else:
+                field = model._meta.get_field(name)
+            self.fields.append((field, descending))
+
+    def _ordering(self, reverse=False):
+        # F() не разворачивает внешний ключ в сортировку связанной модели
+        return [
+            F(field.attname).desc()
+            if descending != reverse
+            else F(field.attname).asc()
+            for field, descending in self.fields
+        ]
+
+    def _values(self, obj):
+        if isinstance(obj, dict):
+            return [obj[field.attname] for field, _ in self.fields]
+        return [getattr(obj, field.attname) for field, _ in self.fields]
+
+    def encode_cursor(self, obj):
+        return self._encode(self._values(obj))
+
+    def _encode(self, values):
+        # isoformat сохраняет микросекунды, без них курсор съезжает
+        payload = json.dumps(values, default=_isoformat)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def normalize_cursor(self, cursor):
+        """Курсор в том виде, в каком его выдает encode_cursor;
+        битый — InvalidCursor"""
+        return self._encode(self.decode_cursor(cursor))
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, UnicodeError, ValueError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        try:
+            values = [
+                field.to_python(value)
+                for (field, _), value in zip(self.fields, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor(cursor)
+        # None не сравнивается в условии _seek
+        if any(value is None for value in values):
+            raise InvalidCursor(cursor)
+        return values
+
+    def _seek(self, values, reverse=False):
+        """Условие «строго после values» в порядке сортировки."""
+        condition = Q()
+        for i, (field, descending) in enumerate(self.fields):
+            lookup = "lt" if descending != reverse else "gt"
+            step = Q(**{f"{field.attname}__{lookup}": values[i]})
+            for j, (prev_field, _) in enumerate(self.fields[:i]):
+                step &= Q(**{prev_field.attname: values[j]})
+            condition |= step
+        # Избыточная граница по первому полю дает базе диапазон индекса,
+        # иначе OR проверяется построчно от начала выборки
+        field, descending = self.fields[0]
+        bound = "lte" if descending != reverse else "gte"
+        return Q(**{f"{field.attname}__{bound}": values[0]}) & condition
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу; битый курсор означает первую страницу."""
+        try:
+            if before:
+                return self._page_before(self.decode_cursor(before))
+            if after:
+                return self._page_after(self.decode_cursor(after))
+        except InvalidCursor:
+            pass
+        return self._page_after(None)
+
+    def _page_after(self, values):
+        queryset = self.object_list.order_by(*self._ordering())
+        if values is not None:
+            queryset = queryset.filter(self._seek(values))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(
+            rows[:self.per_page], self, has_next, values is not None
+        )
+
+    def _page_before(self, values):
+        queryset = self.object_list.order_by(*self._ordering(reverse=True))
+        queryset = queryset.filter(self._seek(values, reverse=True))
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self, True, has_previous)
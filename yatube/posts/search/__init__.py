@@ -0,0 +1,39 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд задается настройкой SEARCH_BACKEND; по умолчанию на SQLite
+используется индекс FTS5, на остальных базах — запасной LIKE-поиск.
+Индекс обновляется сигналами Post, см. posts.signals.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKENDS = {
+    "sqlite": "posts.search.backends.SQLiteFTSBackend",
+}
+FALLBACK_BACKEND = "posts.search.backends.LikeSearchBackend"
+
+_backends = {}
+
+
+def get_backend():
+    path = settings.SEARCH_BACKEND or DEFAULT_BACKENDS.get(
+        connection.vendor, FALLBACK_BACKEND
+    )
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends[path] = import_string(path)()
+    return backend
+
+
+def search_posts(query, queryset=None):
+    """Посты по запросу, упорядоченные бэкендом по релевантности.
+
+    Порядок заканчивается на id, поэтому результат можно листать
+    курсорной пагинацией.
+    """
+    if queryset is None:
+        from posts.models import Post
+
+        queryset = Post.objects.all()
+    return get_backend().search(queryset, query)
@@ -0,0 +1,131 @@
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Func
+
+from core.db import sharding
+from posts.models import Post, PostSearchIndex
+
+WORD_RE = re.compile(r"\w+")
+# Длинный запрос превращается в дорогой перебор списков документов
+MAX_TERMS = 8
+
+
+def terms(query):
+    return WORD_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class BaseSearchBackend:
+    def index(self, posts):
+        """Добавляет или обновляет посты в индексе"""
+
+    def remove(self, post_ids):
+        """Убирает посты из индекса"""
+
+    def rebuild(self):
+        """Строит индекс заново по всем постам"""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Поиск без индекса: все слова запроса через LIKE, свежие выше.
+
+    Годится только для небольших баз, где нет своего полнотекстового
+    движка; обновлять ему нечего.
+    """
+
+    def search(self, queryset, query):
+        words = terms(query)
+        if not words:
+            return queryset.none()
+        for word in words:
+            queryset = queryset.filter(text__icontains=word)
+        return queryset.order_by("-pub_date", "-id")
+
+
+class JulianDay(Func):
+    function = "julianday"
+    output_field = FloatField()
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Инвертированный индекс SQLite FTS5 в таблице posts_post_fts.
+
+    rowid строки индекса равен id поста. Релевантность — bm25,
+    к ней добавляется SEARCH_RECENCY_WEIGHT за каждый день свежести.
+    """
+
+    table = PostSearchIndex._meta.db_table
+
+    def index(self, posts):
+        by_db = {}
+        for post in posts:
+            by_db.setdefault(post._state.db or DEFAULT_DB_ALIAS, []).append(
+                (post.pk, post.text)
+            )
+        # Индекс лежит в той же базе, что и посты (на шардах — на каждом)
+        for db, rows in by_db.items():
+            with connections[db].cursor() as cursor:
+                cursor.executemany(
+                    f"DELETE FROM {self.table} WHERE rowid = %s",
+                    [(pk,) for pk, _ in rows],
+                )
+                cursor.executemany(
+                    f"INSERT INTO {self.table}(rowid, text) "
+                    f"VALUES (%s, %s)",
+                    rows,
+                )
+
+    def remove(self, post_ids):
+        by_db = {}
+        for pk in post_ids:
+            db = DEFAULT_DB_ALIAS
+            if sharding.enabled():
+                db = sharding.shard_for_pk(pk)
+            by_db.setdefault(db, []).append((pk,))
+        for db, rows in by_db.items():
+            if db is None:
+                continue
+            with connections[db].cursor() as cursor:
+                cursor.executemany(
+                    f"DELETE FROM {self.table} WHERE rowid = %s", rows
+                )
+
+    def rebuild(self):
+        for db in sharding.databases(Post):
+            with connections[db].cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.table}")
+                cursor.execute(
+                    f"INSERT INTO {self.table}(rowid, text) "
+                    f"SELECT id, text FROM {Post._meta.db_table}"
+                )
+                # Слияние сегментов ускоряет последующие запросы
+                cursor.execute(
+                    f"INSERT INTO {self.table}({self.table}) "
+                    f"VALUES ('optimize')"
+                )
+
+    def match_expression(self, query):
+        """Запрос пользователя как выражение FTS5: каждое слово
+        в кавычках (операторы не работают), последнее — префиксом"""
+        words = terms(query)
+        if not words:
+            return None
+        return " ".join(f'"{word}"' for word in words) + "*"
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset.none()
+        # rank FTS5 — bm25 со знаком минус: чем меньше, тем лучше
+        score = -F("search_index__rank") + (
+            settings.SEARCH_RECENCY_WEIGHT * JulianDay("pub_date")
+        )
+        return (
+            queryset.filter(search_index__text__match=expression)
+            .annotate(score=score)
+            .order_by("-score", "-id")
+        )
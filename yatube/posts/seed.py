@@ -0,0 +1,122 @@
+"""Синтетические данные для нагрузочных тестов.
+
+Записи в формате posts.importer, поэтому пишутся тем же путем: пачками
+bulk_create с пересборкой счетчиков, лент и индекса в конце. Частоты
+неравномерны, как на живом сайте: подписчики и посты у авторов
+распределены по степенному закону, в нескольких группах — большая часть
+постов, комментарии достаются в основном свежим постам.
+"""
+import random
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from core.db import sharding
+
+from .models import Post
+
+WORDS = (
+    "пост лента группа автор подписка комментарий новости город книга "
+    "музыка фото кино погода спорт код python django база данных поиск "
+    "кэш индекс запрос страница день неделя утро вечер идея проект "
+    "вопрос ответ история путешествие работа отпуск кофе"
+).split()
+
+
+def skewed(rng, n, exponent=1.0):
+    """Индекс 0..n-1 с вероятностью ~ 1 / (индекс + 1) ** exponent.
+
+    Обратная функция распределения степенного закона: ни весов,
+    ни таблиц в памяти, сколько бы ни было объектов.
+    """
+    u = rng.random()
+    if exponent == 1:
+        x = (n + 1) ** u
+    else:
+        power = 1 - exponent
+        x = (1 + u * ((n + 1) ** power - 1)) ** (1 / power)
+    return min(int(x) - 1, n - 1)
+
+
+def _text(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize()
+
+
+def records(
+    users=1000, groups=20, posts=10000, comments=20000, follows=10000,
+    days=365, seed=0, prefix="seed", exponent=1.1,
+):
+    """Генератор записей для posts.importer.Importer.
+
+    Посты получают id после уже существующих, чтобы на них могли
+    ссылаться комментарии; дата поста растет с его номером. С шардами
+    импорт выдает постам id на шарде автора, а эти id служат только
+    ссылками комментариев.
+    """
+    rng = random.Random(seed)
+    first_id = max(
+        Post._default_manager.db_manager(alias)
+        .aggregate(last=Max("id"))["last"] or 0
+        for alias in sharding.databases(Post)
+    ) + 1
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    step = (end - start) / max(posts, 1)
+
+    def username(index):
+        return f"{prefix}{index}"
+
+    def pub_date(index):
+        return start + step * index
+
+    for i in range(users):
+        yield {
+            "type": "user",
+            "username": username(i),
+            "first_name": rng.choice(WORDS).capitalize(),
+            "date_joined": start.isoformat(),
+        }
+    for i in range(groups):
+        yield {
+            "type": "group",
+            "slug": f"{prefix}-group-{i}",
+            "title": f"{rng.choice(WORDS).capitalize()} {i}",
+            "description": _text(rng, 5, 20),
+        }
+    for i in range(posts):
+        # Часть постов без группы, остальные — в основном в горячих
+        group = None
+        if groups and rng.random() < 0.7:
+            group = f"{prefix}-group-{skewed(rng, groups, exponent)}"
+        yield {
+            "type": "post",
+            "id": first_id + i,
+            "author": username(skewed(rng, users, exponent)),
+            "group": group,
+            "text": _text(rng, 5, 80),
+            "pub_date": pub_date(i).isoformat(),
+        }
+    for _ in range(comments if posts else 0):
+        # Свежие посты обсуждают чаще
+        index = posts - 1 - skewed(rng, posts, exponent)
+        created = pub_date(index) + timedelta(
+            minutes=skewed(rng, 60 * 24 * 7)
+        )
+        yield {
+            "type": "comment",
+            "post": first_id + index,
+            "author": username(rng.randrange(users)),
+            "text": _text(rng, 3, 30),
+            "created": min(created, end).isoformat(),
+        }
+    for _ in range(follows if users > 1 else 0):
+        author = skewed(rng, users, exponent)
+        user = rng.randrange(users - 1)
+        if user >= author:
+            user += 1
+        yield {
+            "type": "follow",
+            "user": username(user),
+            "author": username(author),
+        }
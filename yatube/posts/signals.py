@@ -0,0 +1,177 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from core.db import sharding
+
+from . import counters, feed, images
+from .cache import (
+    INDEX_SCOPE, bump_version, comments_page_key, comments_scope,
+    profile_scope
+)
+from .models import Comment, Follow, Group, Post
+from .search import get_backend as search_backend
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_post(sender, instance, raw=False, **kwargs):
+    instance._old_group_id = instance._old_image = None
+    instance._old_author_id = instance.author_id
+    if instance.pk and not raw:
+        (
+            instance._old_group_id,
+            instance._old_image,
+            instance._old_author_id,
+        ) = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list("group_id", "image", "author_id")
+            .first()
+        ) or (None, None, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        if created:
+            counters.bump_group(instance.group_id, 1)
+            counters.bump_stats(instance.author_id, posts_count=1)
+            return
+        if instance._old_group_id != instance.group_id:
+            counters.bump_group(instance._old_group_id, -1)
+            counters.bump_group(instance.group_id, 1)
+        if instance._old_author_id != instance.author_id:
+            counters.bump_stats(instance._old_author_id, posts_count=-1)
+            counters.bump_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.bump_group(instance.group_id, -1)
+        counters.bump_stats(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        if created:
+            images.acquire(instance.image.name)
+        elif instance._old_image != instance.image.name:
+            images.release(instance._old_image)
+            images.acquire(instance.image.name)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search_backend().remove([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # Каскадное удаление не видит строк на шардах
+    if sharding.enabled():
+        Comment.objects.filter(author_id=instance.pk).delete()
+        Post.objects.filter(author_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        with transaction.atomic():
+            counters.bump_stats(instance.author_id, followers_count=1)
+            counters.bump_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    with transaction.atomic():
+        counters.bump_stats(instance.author_id, followers_count=-1)
+        counters.bump_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.followed(instance.author_id)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    feed.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_index(sender, **kwargs):
+    bump_version(INDEX_SCOPE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_index_on_user_change(sender, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login — лента не меняется
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    bump_version(INDEX_SCOPE)
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_comments(sender, instance, created, **kwargs):
+    if created:
+        cache.delete(comments_page_key(instance.post_id))
+    else:
+        bump_version(comments_scope(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def invalidate_comments_on_delete(sender, instance, **kwargs):
+    bump_version(comments_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_profiles(sender, instance, **kwargs):
+    bump_version(
+        profile_scope(instance.author.username),
+        profile_scope(instance.user.username),
+    )
@@ -0,0 +1,79 @@
+"""Хранение картинок постов по хешу содержимого.
+
+Имя файла — sha256 его байтов, поэтому повторная загрузка той же
+картинки попадает в уже существующий файл и его готовые миниатюры.
+Сколько постов ссылается на файл, считает posts.images.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+UPLOAD_DIR = "posts"
+CHUNK_SIZE = 64 * 1024
+CONTENT_NAME_RE = re.compile(
+    rf"^{UPLOAD_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.\w+)?$"
+)
+
+
+def hash_file(file_):
+    """sha256 файла, прочитанного по кускам; позиция возвращается в начало.
+
+    Если хеш уже посчитан при приеме загрузки, он берется готовым.
+    """
+    digest = getattr(file_, "content_hash", None)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    if hasattr(file_, "seek"):
+        file_.seek(0)
+    if hasattr(file_, "chunks"):
+        chunks = file_.chunks(CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: file_.read(CHUNK_SIZE), b"")
+    for chunk in chunks:
+        sha.update(chunk)
+    if hasattr(file_, "seek"):
+        file_.seek(0)
+    return sha.hexdigest()
+
+
+def content_name(digest, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{UPLOAD_DIR}/{digest[:2]}/{digest}{ext}"
+
+
+def variant_name(name, ext):
+    """Имя другого формата той же картинки: posts/ab/<хеш>.webp"""
+    return os.path.splitext(name)[0] + ext
+
+
+def post_image_path(instance, filename):
+    """upload_to для Post.image: имя по хешу содержимого"""
+    return content_name(hash_file(instance.image.file), filename)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое не перезаписывает и не переименовывает
+    файлы: одно имя всегда означает одно и то же содержимое."""
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        # Варианты других форматов (см. posts.uploads) лежат рядом
+        for ext, variant in getattr(content, "variants", {}).items():
+            self._save(variant_name(name, ext), variant)
+        if not self.exists(name):
+            # Пишем рядом и переименовываем: параллельная загрузка того же
+            # файла заменит его идентичной копией, а не оставит половину
+            tmp = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+            os.replace(self.path(tmp), self.path(name))
+        if hasattr(content, "temporary_file_path"):
+            # Временный файл перенесен или больше не нужен
+            content.close()
+        return name
@@ -0,0 +1,34 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+def _placeholder(image):
+    thumbnails.schedule(image.name)
+    url = static(settings.THUMBNAIL_PLACEHOLDER)
+    return thumbnails.Thumbnail(url, ready=False)
+
+
+@register.simple_tag
+def post_thumbnail(image, preset="card"):
+    """Миниатюра картинки поста с srcset или заглушка, если пул
+    еще не успел ее построить; в запросе картинка не ресайзится"""
+    if not image:
+        return None
+
+    # Страницы ленты разрешены заранее, см. thumbnails.resolve_page
+    resolved = getattr(image.instance, "_thumbnails", {})
+    if preset in resolved:
+        return resolved[preset] or _placeholder(image)
+
+    found = []
+    for geometry, options in thumbnails.variants(preset):
+        thumbnail = thumbnails.lookup(image, geometry, options)
+        if thumbnail is None:
+            return _placeholder(image)
+        found.append(thumbnail)
+    return thumbnails.Thumbnail.from_files(found)
@@ -0,0 +1,152 @@
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.counters import get_stats  # isort:skip
+from posts.models import (  # isort:skip
+    Comment, FeedItem, Follow, Group, Post
+)
+from posts.search import search_posts  # isort:skip
+
+User = get_user_model()
+
+
+class AdminScaleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+        self.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        self.other = Group.objects.create(
+            title="Другая", slug="other", description="Описание"
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.posts = [
+            Post.objects.create(
+                author=self.author, text=f"Пост {i}", group=self.group
+            )
+            for i in range(4)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text="Комментарий"
+        )
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def changelist(self, model):
+        return reverse(f"admin:posts_{model}_changelist")
+
+    def action(self, model, action, objects, **data):
+        return self.client.post(self.changelist(model), {
+            "action": action,
+            ACTION_CHECKBOX_NAME: [obj.pk for obj in objects],
+            **data,
+        })
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк"""
+        for model in ("post", "comment", "follow"):
+            with self.subTest(model=model):
+                url = self.changelist(model)
+                with CaptureQueriesContext(connection) as few:
+                    self.client.get(url)
+                Post.objects.bulk_create(
+                    Post(author=self.author, text="Еще", group=self.group)
+                    for _ in range(10)
+                )
+                for post in Post.objects.all()[:5]:
+                    Comment.objects.create(
+                        post=post, author=self.reader, text="Еще"
+                    )
+                with CaptureQueriesContext(connection) as many:
+                    self.client.get(url)
+
+                self.assertEqual(len(few), len(many))
+
+    @override_settings(ESTIMATED_COUNT_LIMIT=2)
+    def test_large_result_count_estimated(self):
+        """Сверх лимита количество не считается точным COUNT(*)"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist("post"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.context["cl"].result_count, 4)
+        for query in queries.captured_queries:
+            if "COUNT(*)" in query["sql"]:
+                self.assertIn("LIMIT 3", query["sql"])
+
+    @override_settings(ESTIMATED_COUNT_LIMIT=2)
+    def test_filtered_result_count_exact(self):
+        """Найденные и отфильтрованные посты считаются точно, а не
+        по оценке всей таблицы"""
+        Post.objects.bulk_create(
+            Post(author=self.reader, text="Другое") for _ in range(6)
+        )
+        urls = (
+            self.changelist("post") + "?q=пост",
+            self.changelist("post") + f"?author__id__exact={self.author.pk}",
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+
+                self.assertEqual(response.context["cl"].result_count, 4)
+
+    def test_regroup_action(self):
+        """Перенос в группу одним UPDATE с пересчетом счетчиков"""
+        self.action(
+            "post", "regroup", self.posts[:3], group_slug=self.other.slug
+        )
+
+        self.group.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.other.posts_count, 3)
+        self.assertEqual(self.other.posts.count(), 3)
+
+    def test_delete_posts_action(self):
+        """Удаление постов чистит зависимые строки и счетчики"""
+        self.action("post", "delete_fast", self.posts[:2])
+
+        self.group.refresh_from_db()
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(self.group.posts_count, 2)
+        self.assertEqual(get_stats(self.author).posts_count, 2)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(FeedItem.objects.count(), 2)
+        self.assertEqual(search_posts("пост").count(), 2)
+
+    def test_delete_comments_action(self):
+        """Удаление комментариев уменьшает счетчик поста"""
+        self.action("comment", "delete_fast", Comment.objects.all())
+
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].comments_count, 0)
+
+    def test_delete_follows_action(self):
+        """Удаление подписок чистит ленты и счетчики подписок"""
+        self.action("follow", "delete_fast", Follow.objects.all())
+
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(get_stats(self.author).followers_count, 0)
+        self.assertEqual(get_stats(self.reader).following_count, 0)
+
+    @override_settings(DATABASE_SHARDS=["shard1"])
+    def test_bulk_actions_refused_when_sharded(self):
+        """Массовые операции не трогают базы при шардировании"""
+        response = self.action("follow", "delete_fast", Follow.objects.all())
+
+        self.assertTrue(Follow.objects.exists())
+        message = next(iter(get_messages(response.wsgi_request)))
+        self.assertIn("недоступны при шардировании", str(message))
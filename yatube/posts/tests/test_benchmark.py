@@ -0,0 +1,107 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import benchmark
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            "seed_yatube", users=10, groups=2, posts=30, comments=30,
+            follows=20, stdout=StringIO(),
+        )
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def call(self, **options):
+        out = StringIO()
+        call_command(
+            "benchmark_yatube", iterations=3, warmup=1, stdout=out,
+            stderr=out, **options
+        )
+        return out.getvalue()
+
+    def test_every_url_measured(self):
+        path = os.path.join(self.tmp, "results.json")
+        output = self.call(output=path)
+
+        with open(path) as f:
+            results = json.load(f)
+        names = set(results["urls"])
+        self.assertIn("posts:index", names)
+        self.assertIn("posts:follow_index", names)
+        self.assertIn("users:password_reset_confirm", names)
+        self.assertIn("posts:index", output)
+        for name, result in results["urls"].items():
+            with self.subTest(name=name):
+                self.assertLess(result["status"], 400)
+                self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        self.assertEqual(results["urls"]["posts:follow_index"]["status"], 200)
+        self.assertGreater(results["urls"]["posts:index"]["queries"], 0)
+
+    def test_exclude(self):
+        path = os.path.join(self.tmp, "results.json")
+        self.call(output=path, exclude=["search", "users:logout"])
+
+        with open(path) as f:
+            names = set(json.load(f)["urls"])
+        self.assertNotIn("posts:search", names)
+        self.assertNotIn("users:logout", names)
+
+    def baseline(self):
+        """Результаты прогона с запасом по времени: сравнение с ними
+        ловит только изменения запросов и статусов"""
+        path = os.path.join(self.tmp, "baseline.json")
+        self.call(output=path)
+        with open(path) as f:
+            baseline = json.load(f)
+        for result in baseline["urls"].values():
+            result["p95_ms"] += 1000
+        return path, baseline
+
+    def save(self, path, results):
+        with open(path, "w") as f:
+            json.dump(results, f)
+
+    def test_baseline_regression(self):
+        path, baseline = self.baseline()
+        baseline["urls"]["posts:index"]["queries"] = 0
+        self.save(path, baseline)
+
+        with self.assertRaisesMessage(CommandError, "Регрессий: 1"):
+            self.call(baseline=path)
+
+    def test_no_regressions(self):
+        path, baseline = self.baseline()
+        self.save(path, baseline)
+
+        self.assertIn("Регрессий нет", self.call(baseline=path))
+
+    def test_compare(self):
+        base = {"urls": {"a": {
+            "p95_ms": 10.0, "queries": 4, "status": 200,
+        }}}
+        same = {"urls": {"a": {
+            "p95_ms": 11.0, "queries": 4, "status": 200,
+        }}}
+        slow = {"urls": {"a": {
+            "p95_ms": 13.0, "queries": 5, "status": 302,
+        }}}
+
+        self.assertEqual(benchmark.compare(same, base, 0.2), [])
+        self.assertEqual(len(benchmark.compare(slow, base, 0.2)), 3)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
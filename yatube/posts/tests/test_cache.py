@@ -0,0 +1,81 @@
+import hashlib
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.cache import INDEX_SCOPE, bump_version, stats  # isort:skip
+from posts.models import Post  # isort:skip
+
+User = get_user_model()
+
+
+@override_settings(CACHE_EARLY_RECOMPUTE_BETA=0)
+class IndexCacheStampedeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.url = reverse("posts:index")
+
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+        self.guest_client = Client()
+
+    def lock_key(self):
+        path = hashlib.md5(self.url.encode()).hexdigest()
+        return f"index_page:0:{path}:lock"
+
+    def test_hit_and_miss_counted(self):
+        """Первый запрос строит страницу, второй берет ее из кэша"""
+        self.guest_client.get(self.url)
+        self.guest_client.get(self.url)
+
+        self.assertEqual(stats.snapshot(), {"misses": 1, "hits": 1})
+
+    def test_stale_page_served_while_rebuilding(self):
+        """Пока страницу пересобирают, отдается устаревшая копия"""
+        old = self.guest_client.get(self.url).content
+        Post.objects.create(author=self.author, text="Новый пост")
+        cache.add(self.lock_key(), 1)
+
+        response = self.guest_client.get(self.url)
+
+        self.assertEqual(response.content, old)
+        self.assertEqual(stats.snapshot().get("stale"), 1)
+
+    @override_settings(CACHE_LOCK_WAIT=0.1, CACHE_LOCK_POLL=0.01)
+    def test_cold_miss_waits_for_lock_then_builds(self):
+        """Без копии запрос ждет пересборку, а затем строит страницу сам"""
+        cache.add(self.lock_key(), 1)
+
+        response = self.guest_client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats.snapshot().get("lock_waits"), 1)
+        self.assertEqual(stats.snapshot().get("misses"), 1)
+
+    def test_version_bump_rebuilds_page(self):
+        """Новая версия области пересобирает страницу"""
+        self.guest_client.get(self.url)
+        bump_version(INDEX_SCOPE)
+        self.guest_client.get(self.url)
+
+        self.assertEqual(stats.snapshot(), {"misses": 2})
+
+    def test_command_reports_shared_counters(self):
+        """Команда читает счетчики из общего кэша и обнуляет их"""
+        self.guest_client.get(self.url)
+        self.guest_client.get(self.url)
+        out = StringIO()
+
+        call_command("cache_stats", "--reset", stdout=out)
+
+        self.assertIn("hits: 1", out.getvalue())
+        self.assertIn("misses: 1", out.getvalue())
+        self.assertIn("hit ratio: 50.0%", out.getvalue())
+        self.assertEqual(stats.snapshot(), {})
@@ -0,0 +1,167 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.cache import INDEX_SCOPE, get_version  # isort:skip
+from posts.counters import get_stats  # isort:skip
+from posts.models import (  # isort:skip
+    AuthorStats, Comment, FeedItem, Follow, Group, Post
+)
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.user = User.objects.create_user(username="user")
+        self.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="test-slug",
+            description="Тестовое описание"
+        )
+        self.group2 = Group.objects.create(
+            title="Тестовая группа2",
+            slug="test-slug2",
+            description="Тестовое описание"
+        )
+
+    def refresh(self):
+        self.group.refresh_from_db()
+        self.group2.refresh_from_db()
+
+    def test_post_counters(self):
+        """Счетчики постов группы и автора"""
+        post = Post.objects.create(
+            author=self.author, text="Пост", group=self.group
+        )
+        self.refresh()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(get_stats(self.author).posts_count, 1)
+
+        post.group = self.group2
+        post.save()
+        self.refresh()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.group2.posts_count, 1)
+
+        post.delete()
+        self.refresh()
+        self.assertEqual(self.group2.posts_count, 0)
+        self.assertEqual(get_stats(self.author).posts_count, 0)
+
+    def test_bulk_created_posts_counted(self):
+        """bulk_create тоже обновляет счетчики"""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пост {i}", group=self.group)
+            for i in range(3)
+        )
+        self.refresh()
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertEqual(get_stats(self.author).posts_count, 3)
+
+    def test_author_change_moves_counter(self):
+        """Смена автора поста переносит счетчик постов"""
+        post = Post.objects.create(author=self.author, text="Пост")
+
+        post.author = self.user
+        post.save()
+
+        self.assertEqual(get_stats(self.author).posts_count, 0)
+        self.assertEqual(get_stats(self.user).posts_count, 1)
+
+    def test_decrement_stops_at_zero(self):
+        """Разошедшийся счетчик не уходит ниже нуля"""
+        post = Post.objects.create(
+            author=self.author, text="Пост", group=self.group
+        )
+        Group.objects.update(posts_count=0)
+        AuthorStats.objects.update(posts_count=0)
+
+        post.delete()
+
+        self.refresh()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(get_stats(self.author).posts_count, 0)
+
+    def test_bulk_created_posts_fanned_out(self):
+        """bulk_create раскладывает посты по лентам и сбрасывает кэш"""
+        Follow.objects.create(user=self.user, author=self.author)
+        version = get_version(INDEX_SCOPE)
+
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пост {i}") for i in range(3)
+        )
+
+        self.assertEqual(FeedItem.objects.filter(user=self.user).count(), 3)
+        self.assertNotEqual(get_version(INDEX_SCOPE), version)
+
+    def test_comment_counter(self):
+        """Счетчик комментариев поста"""
+        post = Post.objects.create(author=self.author, text="Пост")
+        comment = Comment.objects.create(
+            post=post, author=self.user, text="Комментарий"
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counters(self):
+        """Счетчики подписчиков и подписок"""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(get_stats(self.author).followers_count, 1)
+        self.assertEqual(get_stats(self.user).following_count, 1)
+
+        follow.delete()
+        self.assertEqual(get_stats(self.author).followers_count, 0)
+        self.assertEqual(get_stats(self.user).following_count, 0)
+
+    def test_recount_command_fixes_drift(self):
+        """Команда пересчета восстанавливает счетчики"""
+        post = Post.objects.create(
+            author=self.author, text="Пост", group=self.group
+        )
+        Comment.objects.create(post=post, author=self.user, text="Текст")
+        Follow.objects.create(user=self.user, author=self.author)
+        Group.objects.update(posts_count=10)
+        Post.objects.update(comments_count=10)
+        AuthorStats.objects.all().delete()
+
+        call_command("recount_counters", stdout=StringIO())
+
+        self.refresh()
+        post.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.group2.posts_count, 0)
+        self.assertEqual(post.comments_count, 1)
+        stats = get_stats(self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(get_stats(self.user).following_count, 1)
+
+    def test_paginator_uses_counters(self):
+        """Страницы группы и профиля не считают посты запросом"""
+        Post.objects.create(author=self.author, text="Пост", group=self.group)
+        urls = [
+            reverse("posts:group_list", kwargs={"slug": self.group.slug}),
+            reverse("posts:profile", kwargs={"username": "author"}),
+        ]
+        client = Client()
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+                paginator = response.context["page_obj"].paginator
+                self.assertEqual(paginator.count, 1)
+                for query in queries.captured_queries:
+                    self.assertNotIn("COUNT(*)", query["sql"].upper())
@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import exporter
+from posts.models import Comment, Follow, Group, Post  # isort:skip
+
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author", email="author@example.com"
+        )
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        cls.posts = []
+        for i in range(7):
+            post = Post.objects.create(
+                author=cls.author if i % 2 else cls.reader,
+                group=cls.group if i < 3 else None,
+                text=f"Пост {i}",
+            )
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=start + timedelta(days=i)
+            )
+            cls.posts.append(post)
+        Comment.objects.create(
+            post=cls.posts[1], author=cls.reader, text="Комментарий"
+        )
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, "export.ndjson")
+
+    def export(self, path=None, **options):
+        call_command(
+            "export_yatube", path or self.path, stdout=StringIO(), **options
+        )
+
+    def records(self, path=None):
+        path = path or self.path
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_export_all_types(self):
+        self.export(chunk_size=3)
+        records = self.records()
+
+        types = [record["type"] for record in records]
+        self.assertEqual(
+            types, ["user"] * 2 + ["group"] + ["post"] * 7
+            + ["comment", "follow"]
+        )
+        posts = [record for record in records if record["type"] == "post"]
+        self.assertEqual(
+            [post["id"] for post in posts], [post.pk for post in self.posts]
+        )
+        self.assertEqual(posts[1]["author"], "author")
+        self.assertEqual(posts[1]["group"], "group")
+        self.assertEqual(posts[1]["pub_date"], "2021-01-02T00:00:00+00:00")
+        self.assertEqual(records[-2]["post"], self.posts[1].pk)
+        self.assertEqual(records[-1]["user"], "reader")
+
+    def test_chunked_by_primary_key(self):
+        """Таблицы читаются пачками по id, без OFFSET"""
+        with CaptureQueriesContext(connection) as queries:
+            self.export(types="post", chunk_size=3)
+
+        selects = [
+            query["sql"] for query in queries.captured_queries
+            if 'FROM "posts_post"' in query["sql"]
+        ]
+        self.assertEqual(len(selects), 4)
+        for sql in selects:
+            self.assertRegex(sql, r'ORDER BY "posts_post"."id" ASC\s+LIMIT 3')
+            self.assertNotIn("OFFSET", sql)
+
+    def test_filters(self):
+        cases = {
+            "author": ({"author": "author"}, [1, 3, 5]),
+            "group": ({"group": "group"}, [0, 1, 2]),
+            "dates": ({"since": "2021-01-03", "until": "2021-01-05"}, [2, 3]),
+        }
+        for name, (options, expected) in cases.items():
+            with self.subTest(name=name):
+                self.export(types="post,comment", **options)
+                posts = [
+                    record["id"] for record in self.records()
+                    if record["type"] == "post"
+                ]
+                self.assertEqual(
+                    posts, [self.posts[i].pk for i in expected]
+                )
+        self.export(types="comment", author="reader")
+        self.assertEqual(self.records(), [])
+
+    def test_invalid_params(self):
+        for options in (
+            {"types": "post,secret"},
+            {"author": "ghost"},
+            {"since": "вчера"},
+            {"after": "post"},
+        ):
+            with self.subTest(options=options):
+                with self.assertRaises(CommandError):
+                    self.export(**options)
+
+    def test_gzip(self):
+        path = os.path.join(self.tmp, "export.ndjson.gz")
+        self.export(path, chunk_size=2)
+        plain = os.path.join(self.tmp, "plain.ndjson")
+        self.export(plain)
+
+        self.assertEqual(self.records(path), self.records(plain))
+
+    def test_resume(self):
+        """Прерванная выгрузка дописывается с последней пачки"""
+        for name in ("export.ndjson", "export.ndjson.gz"):
+            with self.subTest(name=name):
+                path = os.path.join(self.tmp, name)
+                lines = exporter.Exporter.lines
+                calls = []
+
+                def failing_lines(job, kind, rows):
+                    calls.append(kind)
+                    if len(calls) == 4:
+                        raise KeyboardInterrupt
+                    return lines(job, kind, rows)
+
+                with mock.patch.object(
+                    exporter.Exporter, "lines", failing_lines
+                ):
+                    with self.assertRaises(KeyboardInterrupt):
+                        self.export(path, chunk_size=2)
+                with open(path, "ab") as f:
+                    f.write(b"\x1f\x8b broken chunk")
+                self.assertTrue(os.path.exists(f"{path}.checkpoint"))
+                with self.assertRaises(CommandError):
+                    self.export(
+                        path, chunk_size=2, resume=True, types="post"
+                    )
+
+                self.export(path, chunk_size=2, resume=True)
+                complete = os.path.join(self.tmp, f"complete-{name}")
+                self.export(complete)
+                self.assertEqual(self.records(path), self.records(complete))
+                self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_roundtrip_with_import(self):
+        """Выгрузку принимает import_yatube"""
+        self.export()
+        before = self.records()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+        call_command("import_yatube", self.path, stdout=StringIO())
+        self.export()
+        after = self.records()
+        strip = ("id", "post", "date_joined")
+        for record in before + after:
+            for key in strip:
+                if record["type"] in ("user", "group", "follow"):
+                    record.pop(key, None)
+        self.assertEqual(after, before)
+
+    def test_admin_endpoint(self):
+        admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        staff = User.objects.create_user(username="staff", is_staff=True)
+        url = reverse("admin:posts_post_export")
+        client = Client()
+
+        client.force_login(staff)
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_login(admin)
+        response = client.get(url, {
+            "types": "post", "gzip": 1, "after": f"post:{self.posts[4].pk}",
+        })
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(
+            [json.loads(line)["id"] for line in content.splitlines()],
+            [self.posts[5].pk, self.posts[6].pk],
+        )
+        self.assertEqual(
+            client.get(url, {"group": "missing"}).status_code, 400
+        )
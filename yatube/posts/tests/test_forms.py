@@ -1,13 +1,20 @@
+import hashlib
+import io
 import shutil
 import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from posts import uploads  # isort:skip
 from posts.forms import CommentForm, PostForm  # isort:skip
 from posts.models import Group, Post  # isort:skip
+from posts.uploads import StreamingImageUploadHandler  # isort:skip
 
 User = get_user_model()
 MEDIA_ROOT = tempfile.mkdtemp()
@@ -180,3 +187,107 @@ class CommentFormTests(TestCase):
 
         self.assertRedirects(response, expected_url)
         self.assertIsNone(comment)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESS_WORKERS=0)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="uploader")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def upload(self, size=(40, 20), text="Пост с фото", truncate=None,
+               **save_options):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "blue").save(buffer, "JPEG", **save_options)
+        image = SimpleUploadedFile(
+            "photo.jpg", buffer.getvalue()[:truncate],
+            content_type="image/jpeg",
+        )
+        return self.client.post(
+            reverse("posts:post_create"),
+            data={"text": text, "image": image},
+        )
+
+    def assertImageError(self, response, code):
+        form = response.context["form"]
+        self.assertEqual(form.errors.as_data()["image"][0].code, code)
+        self.assertFalse(Post.objects.exists())
+
+    def test_exif_stripped(self):
+        """Картинка перекодируется без EXIF"""
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        self.upload(exif=exif.tobytes())
+
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertNotIn("exif", image.info)
+
+    def test_limits_rejected(self):
+        """Слишком большой файл или картинка не сохраняются"""
+        limits = {
+            "too_large": {"IMAGE_UPLOAD_MAX_SIZE": 100},
+            "too_many_pixels": {"IMAGE_MAX_PIXELS": 40 * 20 - 1},
+        }
+        for code, limit in limits.items():
+            with self.subTest(code=code), override_settings(**limit):
+                self.assertImageError(self.upload(), code)
+
+    def test_truncated_image_rejected(self):
+        """Картинка с целым заголовком и обрезанными данными — ошибка
+        формы, а не 500"""
+        response = self.upload(size=(400, 400), truncate=-50)
+
+        self.assertImageError(response, "invalid_image")
+
+    def test_pool_failure_rejected(self):
+        """Таймаут или сломанный пул обработки — ошибка формы"""
+        with mock.patch.object(
+            uploads, "process", side_effect=uploads.Unavailable
+        ):
+            response = self.upload()
+
+        self.assertImageError(response, "unavailable")
+
+    @override_settings(IMAGE_PROCESS_WORKERS=1)
+    def test_broken_pool_replaced(self):
+        """Сломанный пул сбрасывается, следующая загрузка создаст новый"""
+        executor = mock.Mock()
+        executor.submit.side_effect = BrokenProcessPool
+        with mock.patch.object(uploads, "_executor", executor):
+            with self.assertRaises(uploads.Unavailable):
+                uploads._run_in_pool(())
+
+            self.assertIsNone(uploads._executor)
+
+    def test_not_processed_when_form_invalid(self):
+        """Картинка не перекодируется, пока остальные поля с ошибками"""
+        with mock.patch.object(uploads, "process") as process:
+            response = self.upload(text="")
+
+        process.assert_not_called()
+        self.assertIn("text", response.context["form"].errors)
+
+    def test_upload_handler_hashes_while_streaming(self):
+        """Хеш загрузки считается обработчиком, файл лежит на диске"""
+        handler = StreamingImageUploadHandler()
+        handler.new_file("image", "a.gif", "image/gif", 6)
+        handler.receive_data_chunk(b"abc", 0)
+        handler.receive_data_chunk(b"def", 3)
+        upload = handler.file_complete(6)
+
+        self.assertEqual(
+            upload.content_hash, hashlib.sha256(b"abcdef").hexdigest()
+        )
+        self.assertEqual(upload.read(), b"abcdef")
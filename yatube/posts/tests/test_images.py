@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from posts import images  # isort:skip
+from posts.models import ImageBlob, Post  # isort:skip
+
+User = get_user_model()
+MEDIA_ROOT = tempfile.mkdtemp()
+
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+
+
+def upload(name="small.gif"):
+    return SimpleUploadedFile(
+        name=name, content=SMALL_GIF, content_type="image/gif"
+    )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageDedupTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, image):
+        return Post.objects.create(
+            author=self.author, text="Пост", image=image
+        )
+
+    def files(self):
+        return [
+            name for _, _, names in os.walk(MEDIA_ROOT) for name in names
+        ]
+
+    def test_same_upload_shares_file(self):
+        """Повторная загрузка той же картинки не создает новый файл"""
+        first = self.create_post(upload("one.gif"))
+        second = self.create_post(upload("two.gif"))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual(ImageBlob.objects.get().refs, 2)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последним постом"""
+        first = self.create_post(upload())
+        second = self.create_post(upload())
+        path = first.image.path
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+
+        second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        # on_commit внутри TestCase не срабатывает, вызываем его работу
+        images.purge(second.image.name)
+        self.assertFalse(os.path.exists(path))
+
+    def test_dedupe_command_merges_legacy_files(self):
+        """Команда переносит старые файлы в имена по хешу"""
+        os.makedirs(os.path.join(MEDIA_ROOT, "posts"))
+        for name in ("a.gif", "b.gif", "orphan.gif"):
+            with open(os.path.join(MEDIA_ROOT, "posts", name), "wb") as f:
+                f.write(SMALL_GIF)
+        Post.objects.bulk_create([
+            Post(author=self.author, text="A", image="posts/a.gif"),
+            Post(author=self.author, text="B", image="posts/b.gif"),
+        ])
+
+        with mock.patch(
+            "django.db.transaction.on_commit",
+            side_effect=lambda func: func(),
+        ):
+            call_command("dedupe_images", stdout=open(os.devnull, "w"))
+
+        names = set(Post.objects.values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        files = self.files()
+        self.assertEqual(len(files), 2)
+        self.assertIn("orphan.gif", files)
+        self.assertEqual(ImageBlob.objects.get(name=names.pop()).refs, 2)
+
+    def test_dedupe_rollback_keeps_file(self):
+        """Если обновление базы откатилось, старый файл остается на месте"""
+        os.makedirs(os.path.join(MEDIA_ROOT, "posts"))
+        with open(os.path.join(MEDIA_ROOT, "posts", "a.gif"), "wb") as f:
+            f.write(SMALL_GIF)
+        post = self.create_post("posts/a.gif")
+
+        with mock.patch.object(images, "acquire", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command("dedupe_images", stdout=open(os.devnull, "w"))
+
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, "posts/a.gif")
+        self.assertTrue(os.path.exists(post.image.path))
@@ -0,0 +1,211 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from posts import importer
+from posts.models import (  # isort:skip
+    AuthorStats, Comment, FeedItem, Follow, Group, Post
+)
+from posts.search import search_posts  # isort:skip
+
+User = get_user_model()
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line if isinstance(line, str) else json.dumps(line))
+                f.write("\n")
+        return path
+
+    def call(self, *args, **options):
+        out = StringIO()
+        call_command(
+            "import_yatube", *args, stdout=out, stderr=out, **options
+        )
+        return out.getvalue()
+
+    def community(self, posts=5):
+        records = [
+            {"type": "user", "username": "leo", "first_name": "Лев"},
+            {"type": "user", "username": "anna"},
+            {"type": "group", "slug": "books", "title": "Книги"},
+        ]
+        records += [
+            {
+                "type": "post", "id": 100 + i, "author": "leo",
+                "group": "books" if i % 2 else None,
+                "text": f"Пост номер {i}",
+                "pub_date": (
+                    datetime(2020, 1, 1, 10) + timedelta(days=i)
+                ).isoformat(),
+            }
+            for i in range(posts)
+        ]
+        records += [
+            {"type": "comment", "post": 100, "author": "anna",
+             "text": "Комментарий", "created": "2020-02-01T00:00:00Z"},
+            {"type": "follow", "user": "anna", "author": "leo"},
+        ]
+        return records
+
+    def test_import_ndjson(self):
+        path = self.write("data.ndjson", self.community())
+        output = self.call(path, batch_size=3)
+
+        self.assertIn("rows/s", output)
+        leo = User.objects.get(username="leo")
+        self.assertEqual(leo.first_name, "Лев")
+        self.assertFalse(leo.has_usable_password())
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.author, leo)
+        self.assertEqual(
+            post.pub_date.isoformat(), "2020-01-01T10:00:00+00:00"
+        )
+        self.assertEqual(Comment.objects.get().post, post)
+        self.assertTrue(
+            Follow.objects.filter(user__username="anna", author=leo).exists()
+        )
+
+    def test_derived_data_rebuilt(self):
+        """Счетчики, лента и поиск пересобраны после импорта"""
+        self.call(self.write("data.ndjson", self.community()))
+
+        leo = User.objects.get(username="leo")
+        anna = User.objects.get(username="anna")
+        self.assertEqual(Group.objects.get(slug="books").posts_count, 2)
+        self.assertEqual(Post.objects.get(pk=100).comments_count, 1)
+        stats = AuthorStats.objects.get(user=leo)
+        self.assertEqual(stats.posts_count, 5)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(FeedItem.objects.filter(user=anna).count(), 5)
+        self.assertEqual(
+            [post.pk for post in search_posts("номер 3")], [103]
+        )
+
+    def test_batched_writes(self):
+        """Строки пишутся пачками, а не запросом на объект"""
+        path = self.write("data.ndjson", self.community(posts=200))
+        with CaptureQueriesContext(connection) as queries:
+            self.call(path, batch_size=100, skip_rebuild=True)
+
+        inserts = [
+            query for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "posts_post"')
+        ]
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertLessEqual(len(inserts), 4)
+
+    def test_invalid_records_skipped(self):
+        path = self.write("data.ndjson", [
+            {"type": "user", "username": "leo"},
+            "not json",
+            {"type": "post", "author": "ghost", "text": "Чужой"},
+            {"type": "post", "author": "leo", "group": "none", "text": "-"},
+            {"type": "post", "author": "leo"},
+            {"type": "comment", "post": 999, "author": "leo", "text": "-"},
+            {"type": "spam"},
+            {"type": "post", "author": "leo", "text": "Хороший пост"},
+        ])
+        output = self.call(path, verbosity=2)
+
+        self.assertEqual(
+            list(Post.objects.values_list("text", flat=True)),
+            ["Хороший пост"],
+        )
+        self.assertIn("6 skipped", output)
+        self.assertIn("record 3: нет пользователя 'ghost'", output)
+
+    def test_malformed_fields_skipped(self):
+        """Поля не того типа и повторы id в одной пачке пропускаются,
+        а не обрывают импорт"""
+        path = self.write("data.ndjson", [
+            {"type": "user", "username": ["x"]},
+            {"type": "user", "username": "leo"},
+            {"type": "group", "slug": "books", "title": {"a": 1}},
+            {"type": "post", "id": 5, "author": "leo", "text": "Первый"},
+            {"type": "post", "id": 5, "author": "leo", "text": "Повтор"},
+            {"type": "post", "author": {"a": 1}, "text": "-"},
+            {"type": "post", "author": "leo", "text": ["-"]},
+            {"type": "comment", "id": 7, "post": 5, "author": "leo",
+             "text": "Комментарий"},
+            {"type": "comment", "id": 7, "post": 5, "author": "leo",
+             "text": "Повтор"},
+            {"type": "comment", "post": 5, "author": "leo",
+             "text": "Поздний", "created": 1},
+            {"type": "follow", "user": "leo", "author": ["leo"]},
+        ])
+        output = self.call(path, verbosity=2)
+
+        self.assertEqual(
+            list(User.objects.values_list("username", flat=True)), ["leo"]
+        )
+        self.assertFalse(Group.objects.exists())
+        self.assertEqual(Post.objects.get().text, "Первый")
+        self.assertEqual(Comment.objects.get().text, "Комментарий")
+        self.assertIn("2 duplicates, 6 skipped", output)
+        self.assertIn("поле title должно быть строкой", output)
+
+    def test_csv(self):
+        path = os.path.join(self.tmp, "users.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("username,first_name\nleo,Лев\nanna,\n")
+        self.call(path, record_type="user")
+
+        self.assertEqual(
+            dict(User.objects.values_list("username", "first_name")),
+            {"leo": "Лев", "anna": ""},
+        )
+        with self.assertRaises(CommandError):
+            self.call(path)
+
+    def test_resume_from_checkpoint(self):
+        """После сбоя импорт продолжается с последней пачки"""
+        path = self.write("data.ndjson", self.community(posts=8))
+        checkpoint = os.path.join(self.tmp, "import.checkpoint")
+        flush = importer.Importer.flush
+        calls = []
+
+        def failing_flush(job):
+            calls.append(1)
+            if len(calls) == 3:
+                raise RuntimeError("crash")
+            return flush(job)
+
+        with mock.patch.object(importer.Importer, "flush", failing_flush):
+            with self.assertRaises(RuntimeError):
+                self.call(path, batch_size=4, checkpoint=checkpoint)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)["position"], 8)
+        self.assertEqual(Post.objects.count(), 5)
+
+        output = self.call(path, batch_size=4, checkpoint=checkpoint)
+        self.assertIn("5 records", output)
+        self.assertEqual(Post.objects.count(), 8)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_reimport_skips_existing(self):
+        path = self.write("data.ndjson", self.community())
+        self.call(path)
+        output = self.call(path)
+
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(User.objects.count(), 2)
+        self.assertIn("8 duplicates", output)
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import microbench
+from posts.models import Group, Post  # isort:skip
+
+User = get_user_model()
+
+
+class MicrobenchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username="author")
+        group = Group.objects.create(title="Группа", slug="group")
+        for i in range(25):
+            Post.objects.create(author=author, group=group, text=f"Пост {i}")
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def call(self, **options):
+        out = StringIO()
+        call_command(
+            "microbench_yatube", number=2, repeat=2, warmup=1, stdout=out,
+            stderr=out, **options
+        )
+        return out.getvalue()
+
+    def test_all_benchmarks(self):
+        path = os.path.join(self.tmp, "results.json")
+        output = self.call(output=path)
+
+        with open(path) as f:
+            results = json.load(f)["benchmarks"]
+        self.assertEqual(list(results), list(microbench.BENCHMARKS))
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertIn(name, output)
+                self.assertGreater(result["mean_us"], 0)
+                self.assertGreaterEqual(result["variance_us2"], 0)
+                self.assertGreater(result["peak_kib"], 0)
+
+    def test_templates_do_not_query(self):
+        """Страница постов отрисовывается без запросов к базе"""
+        results = microbench.run(
+            microbench.selected(["render"]), number=1, repeat=1, warmup=0
+        )["benchmarks"]
+
+        self.assertEqual(
+            set(results),
+            {
+                "render.article",
+                "render.paginator.offset",
+                "render.paginator.cursor",
+            },
+        )
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertEqual(result["queries"], 0)
+
+    def test_allocations_without_reset_peak(self):
+        """Пик вызова считается и без tracemalloc.reset_peak
+        (Python < 3.9)"""
+        with mock.patch.object(
+            tracemalloc, "reset_peak", side_effect=AttributeError,
+            create=True,
+        ):
+            result = microbench.allocations(lambda: bytearray(2 ** 20), 3)
+
+        self.assertGreaterEqual(result["peak_kib"], 1024)
+        self.assertLess(result["retained_bytes"], 2 ** 20)
+
+    def test_list(self):
+        output = self.call(list=True, only=["form"])
+        self.assertEqual(output.split(), ["form.post", "form.comment"])
+
+    def test_baseline_regression(self):
+        path = os.path.join(self.tmp, "baseline.json")
+        self.call(output=path, only=["pagination.cursor"])
+        with open(path) as f:
+            baseline = json.load(f)
+        result = baseline["benchmarks"]["pagination.cursor"]
+        result["mean_us"] += 10 ** 6
+        result["queries"] = 0
+        with open(path, "w") as f:
+            json.dump(baseline, f)
+
+        with self.assertRaisesMessage(CommandError, "Регрессий: 1"):
+            self.call(baseline=path, only=["pagination"])
+
+    def test_unknown_only(self):
+        with self.assertRaises(CommandError):
+            self.call(only=["nothing"])
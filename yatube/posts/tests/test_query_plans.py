@@ -0,0 +1,205 @@
+import re
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.admin import ScaleAdminMixin
+from posts.models import Comment, Follow, Group, Post  # isort:skip
+
+User = get_user_model()
+
+# Проход по таблице или индексу целиком вместо поиска по ключу;
+# виртуальные таблицы FTS и подзапросы ищут сами
+FULL_SCAN_RE = re.compile(r"\bSCAN (?!subquery\b)(?!.*\bVIRTUAL TABLE\b)")
+# Проход по таблице или индексу в порядке сортировки без фильтра:
+# его обрывает LIMIT после первых строк
+ORDERED_WALK_RE = re.compile(r"^SCAN \S+( USING (COVERING )?INDEX \S+)?$")
+WHERE_RE = re.compile(r"\bWHERE\b")
+LIMIT_RE = re.compile(r"\bLIMIT\b")
+# Запросы, которым полный проход разрешен
+FULL_SCAN_ALLOWED = (
+    # Варианты группы в форме поста: нужна вся таблица групп
+    re.compile(r'^SELECT [^()]* FROM "posts_group"$'),
+    # Границы иерархии дат админки: MIN и MAX вместе SQLite считает
+    # проходом по индексу дат
+    re.compile(r'^SELECT MIN\(.*\) AS "first", MAX\(.*\) AS "last" FROM '),
+)
+TEMP_SORT = "USE TEMP B-TREE"
+EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN SQLite")
+class QueryPlanTests(TestCase):
+    """Запросы страниц идут по индексам: без полного прохода по таблицам
+    и без сортировки во временном B-дереве"""
+
+    # Исключения: сортировку по релевантности индекс дать не может,
+    # а иерархия дат админки проходит узкий покрывающий индекс целиком
+    exempt = ("posts_post_fts", "django_date_trunc")
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.user = User.objects.create_user(username="user")
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.post = Post.objects.create(
+            author=cls.author, text="Тестовый пост", group=cls.group
+        )
+        Post.objects.create(author=cls.user, text="Другой пост")
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f"Пост {i}")
+            for i in range(settings.PAGINATION_OBJECTS_NUM)
+        )
+        for text in ("Комментарий", "Ответ"):
+            Comment.objects.create(post=cls.post, author=cls.user, text=text)
+        Follow.objects.create(user=cls.author, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexedQueries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith(EXPLAINED):
+                continue
+            if any(marker in sql for marker in self.exempt):
+                continue
+            plan = self.explain(sql)
+            with self.subTest(sql=sql, plan=plan):
+                for step in plan:
+                    if not self.scan_allowed(sql, step):
+                        self.assertNotRegex(step, FULL_SCAN_RE)
+                    self.assertNotIn(TEMP_SORT, step)
+        return response
+
+    def scan_allowed(self, sql, step):
+        if any(pattern.search(sql) for pattern in FULL_SCAN_ALLOWED):
+            return True
+        return bool(
+            ORDERED_WALK_RE.match(step)
+            and LIMIT_RE.search(sql)
+            and not WHERE_RE.search(sql)
+        )
+
+    def next_page(self, response):
+        """Параметры следующей страницы: курсор или номер"""
+        page = response.context["page_obj"]
+        self.assertTrue(page.has_next())
+        if getattr(page, "is_cursor", False):
+            return {"after": page.next_cursor}
+        return {"page": page.next_page_number()}
+
+    def test_pages(self):
+        post_id = self.post.id
+        pages = {
+            "posts:index": {},
+            "posts:group_list": {"slug": self.group.slug},
+            "posts:profile": {"username": self.author.username},
+            "posts:post_detail": {"post_id": post_id},
+            "posts:follow_index": {},
+            "posts:post_create": {},
+        }
+        paged = ("posts:index", "posts:group_list", "posts:profile",
+                 "posts:follow_index")
+        for name, kwargs in pages.items():
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                response = self.assertIndexedQueries(
+                    lambda: self.client.get(url)
+                )
+                if name not in paged:
+                    continue
+                params = self.next_page(response)
+                cache.clear()
+                self.assertIndexedQueries(
+                    lambda: self.client.get(url, params)
+                )
+
+    def test_paged_and_search(self):
+        detail = reverse("posts:post_detail", args=(self.post.id,))
+        urls = (
+            (detail, {"after": "x"}),
+            (reverse("posts:search"), {"q": "пост"}),
+            (reverse("posts:post_edit", args=(self.post.id,)), {}),
+        )
+        for url, params in urls:
+            with self.subTest(url=url):
+                self.assertIndexedQueries(
+                    lambda: self.author_client.get(url, params)
+                )
+
+    def test_actions(self):
+        post_id = self.post.id
+        username = self.author.username
+        requests = (
+            ("posts:add_comment", {"post_id": post_id}, {"text": "Еще"}),
+            ("posts:profile_unfollow", {"username": username}, {}),
+            ("posts:profile_follow", {"username": username}, {}),
+            ("posts:post_edit", {"post_id": post_id}, {"text": "Новый"}),
+            ("posts:post_create", {}, {"text": "Новый пост"}),
+        )
+        for name, kwargs, data in requests:
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                client = self.client
+                if name in ("posts:post_edit", "posts:post_create"):
+                    client = self.author_client
+                self.assertIndexedQueries(lambda: client.post(url, data))
+
+    @override_settings(API_PAGE_SIZE=1)
+    def test_api(self):
+        post_id = self.post.id
+        pages = {
+            "api:posts": {},
+            "api:group_posts": {"slug": self.group.slug},
+            "api:user_posts": {"username": self.author.username},
+            "api:post_detail": {"post_id": post_id},
+            "api:comments": {"post_id": post_id},
+            "api:groups": {},
+            "api:follow": {},
+        }
+        for name, kwargs in pages.items():
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                self.assertIndexedQueries(lambda: self.client.get(url))
+                next_url = self.client.get(url).json().get("next")
+                if next_url:
+                    self.assertIndexedQueries(
+                        lambda: self.client.get(next_url)
+                    )
+
+    def test_admin_changelists(self):
+        admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        self.client.force_login(admin)
+        # Страница списка, а не вся выборка: строк меньше list_per_page
+        per_page = mock.patch.object(
+            ScaleAdminMixin, "list_per_page", 1, create=True
+        )
+        for model in ("post", "comment", "follow"):
+            with self.subTest(model=model):
+                url = reverse(f"admin:posts_{model}_changelist")
+                with per_page:
+                    self.assertIndexedQueries(lambda: self.client.get(url))
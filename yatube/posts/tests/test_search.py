@@ -0,0 +1,152 @@
+import datetime as dt
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Post  # isort:skip
+from posts.search import get_backend, search_posts  # isort:skip
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+
+    def setUp(self):
+        self.client = Client()
+
+    def create(self, text):
+        return Post.objects.create(author=self.author, text=text)
+
+    def found(self, query):
+        return list(search_posts(query).values_list("text", flat=True))
+
+    def test_finds_words_and_prefix(self):
+        """Ищутся все слова запроса, последнее — по префиксу"""
+        self.create("Котики правят интернетом")
+        self.create("Собаки тоже ничего")
+        self.create("Котики и собаки")
+
+        self.assertEqual(
+            set(self.found("котики")),
+            {"Котики правят интернетом", "Котики и собаки"},
+        )
+        self.assertEqual(self.found("котики собак"), ["Котики и собаки"])
+        self.assertEqual(self.found('" * ( OR'), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при изменении и удалении поста"""
+        post = self.create("Первая версия")
+        post.text = "Вторая версия"
+        post.save()
+
+        self.assertEqual(self.found("первая"), [])
+        self.assertEqual(self.found("вторая"), ["Вторая версия"])
+
+        post.delete()
+        self.assertEqual(self.found("вторая"), [])
+
+    @override_settings(SEARCH_RECENCY_WEIGHT=0)
+    def test_ranked_by_relevance(self):
+        """Более релевантный пост выше"""
+        self.create("погода " + "слово " * 30)
+        self.create("погода погода погода")
+        for i in range(5):
+            self.create(f"Текст без совпадений {i}")
+
+        self.assertEqual(self.found("погода")[0], "погода погода погода")
+
+    def test_newer_ranked_higher_at_equal_relevance(self):
+        """При равной релевантности свежий пост выше"""
+        old = self.create("Новости дня")
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=60)
+        )
+        new = self.create("Новости дня")
+
+        ids = list(search_posts("новости").values_list("id", flat=True))
+        self.assertEqual(ids, [new.id, old.id])
+
+    def test_bulk_created_posts_indexed(self):
+        """bulk_create тоже попадает в индекс"""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пачка {i}") for i in range(3)
+        )
+        self.assertEqual(len(self.found("пачка")), 3)
+
+        get_backend().rebuild()
+        self.assertEqual(len(self.found("пачка")), 3)
+
+    def test_bulk_create_indexes_only_its_rows(self):
+        """Индексируются строки, вставленные этим bulk_create, а не все
+        новые строки таблицы"""
+        insert = models.QuerySet.bulk_create
+
+        def concurrent_insert(queryset, objs, *args, **kwargs):
+            # Пост без сигналов от параллельного запроса
+            insert(
+                models.QuerySet(Post),
+                [Post(author=self.author, text="Чужой")],
+            )
+            return insert(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(
+            models.QuerySet, "bulk_create", concurrent_insert
+        ):
+            posts = Post.objects.bulk_create(
+                [Post(author=self.author, text=f"Пачка {i}") for i in range(2)]
+            )
+
+        self.assertEqual(
+            [Post.objects.get(pk=post.pk).text for post in posts],
+            ["Пачка 0", "Пачка 1"],
+        )
+        self.assertEqual(self.found("чужой"), [])
+        self.assertEqual(len(self.found("пачка")), 2)
+
+    @override_settings(PAGINATION_OBJECTS_NUM=2)
+    def test_search_page_uses_cursor_pagination(self):
+        """Страница поиска листается курсором и сохраняет запрос"""
+        for i in range(5):
+            self.create(f"Поиск номер {i}")
+        url = reverse("posts:search")
+
+        seen = []
+        response = self.client.get(url, {"q": "поиск"})
+        while True:
+            page = response.context["page_obj"]
+            seen += [post.text for post in page]
+            if not page.has_next():
+                break
+            self.assertContains(response, "?q=%D0%BF")
+            response = self.client.get(
+                url, {"q": "поиск", "after": page.next_cursor}
+            )
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет через индекс, а не LIKE"""
+        self.create("Искомый пост")
+        self.create("Другой пост")
+        self.client.force_login(self.admin)
+
+        response = self.client.get(
+            reverse("admin:posts_post_changelist"), {"q": "искомый"}
+        )
+
+        self.assertEqual(response.context["cl"].result_count, 1)
+        sql = str(response.context["cl"].queryset.query)
+        self.assertIn("MATCH", sql)
+        self.assertNotIn("LIKE", sql)
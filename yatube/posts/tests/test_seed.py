@@ -0,0 +1,113 @@
+import random
+from collections import Counter
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from posts import feed, seed
+from posts.models import (  # isort:skip
+    AuthorStats, Comment, FeedItem, Follow, Group, Post
+)
+
+User = get_user_model()
+
+
+class SkewTests(TestCase):
+    def test_skewed_in_range_and_heavy_head(self):
+        rng = random.Random(1)
+        counts = Counter(seed.skewed(rng, 100, 1.1) for _ in range(5000))
+
+        self.assertTrue(set(counts) <= set(range(100)))
+        # Первый объект популярнее, чем вся вторая половина
+        self.assertGreater(
+            counts[0], sum(counts[i] for i in range(50, 100))
+        )
+
+
+class SeedCommandTests(TestCase):
+    def call(self, **options):
+        options = {
+            "users": 30, "groups": 4, "posts": 200, "comments": 300,
+            "follows": 100, **options,
+        }
+        out = StringIO()
+        call_command("seed_yatube", stdout=out, **options)
+        return out.getvalue()
+
+    def test_counts(self):
+        output = self.call()
+
+        self.assertIn("rows/s", output)
+        self.assertEqual(
+            User.objects.filter(username__startswith="seed").count(), 30
+        )
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        # Повторы пар пропускаются, подписок на себя нет
+        self.assertLessEqual(Follow.objects.count(), 100)
+        self.assertFalse(
+            Follow.objects.filter(user_id=F("author_id")).exists()
+        )
+
+    def test_power_law(self):
+        self.call()
+
+        posts = sorted(
+            AuthorStats.objects.values_list("posts_count", flat=True),
+            reverse=True,
+        )
+        self.assertGreater(posts[0], 4 * posts[len(posts) // 2])
+        groups = list(
+            Group.objects.order_by("-posts_count")
+            .values_list("posts_count", flat=True)
+        )
+        self.assertGreater(groups[0], 2 * groups[-1])
+        self.assertTrue(Post.objects.filter(group=None).exists())
+
+    def test_deterministic(self):
+        self.call(seed=7, prefix="a")
+        first = list(
+            Post.objects.order_by("pk").values_list(
+                "author__username", "text"
+            )
+        )
+        self.call(seed=7, prefix="a")
+
+        self.assertEqual(Post.objects.count(), 400)
+        second = list(
+            Post.objects.order_by("pk").values_list(
+                "author__username", "text"
+            )[200:]
+        )
+        self.assertEqual(first, second)
+
+    def test_invalid_counts_rejected(self):
+        for options in ({"users": 0}, {"posts": -1}, {"posts": 0}):
+            with self.subTest(**options):
+                with self.assertRaises(CommandError):
+                    self.call(**options)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=5)
+    def test_feeds_match_per_user_rebuild(self):
+        """rebuild_all раскладывает ленты так же, как rebuild"""
+        self.call()
+        self.assertTrue(
+            AuthorStats.objects.filter(followers_count__gte=5).exists()
+        )
+        bulk = set(FeedItem.objects.values_list("user", "post", "pub_date"))
+
+        FeedItem.objects.all().delete()
+        followers = Follow.objects.order_by().values_list("user", flat=True)
+        for user_id in set(followers):
+            feed.rebuild(user_id)
+
+        self.assertTrue(bulk)
+        self.assertEqual(
+            bulk,
+            set(FeedItem.objects.values_list("user", "post", "pub_date")),
+        )
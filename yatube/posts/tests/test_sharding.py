@@ -0,0 +1,371 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.db import sharding
+from posts import feed
+from posts.counters import get_stats
+from posts.models import (  # isort:skip
+    AuthorStats, Comment, FeedItem, Follow, Group, Post
+)
+from posts.search import search_posts  # isort:skip
+
+User = get_user_model()
+SHARDS = ["shard1", "shard2", "shard3"]
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ShardingTests(TransactionTestCase):
+    """Посты и комментарии на трех базах SQLite"""
+
+    databases = {"default", *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                **connections.databases["default"],
+                "NAME": os.path.join(cls.tmp, f"{alias}.sqlite3"),
+                "TEST": {},
+            }
+            # Без ограничений FOREIGN KEY, как на настоящих шардах
+            with override_settings(DATABASE_SHARDS=SHARDS):
+                call_command("migrate", database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections.databases[alias]
+            delattr(connections._connections, alias)
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def setUp(self):
+        # Основная тестовая база создана без шардов, с ограничениями
+        # FOREIGN KEY, а ленты ссылаются на посты с шардов
+        connections["default"].disable_constraint_checking()
+        self.addCleanup(connections["default"].enable_constraint_checking)
+        cache.clear()
+        self.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        self.authors = [
+            User.objects.create_user(username=f"author{i}")
+            for i in range(3)
+        ]
+        self.reader = User.objects.create_user(username="reader")
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+        self.posts = [
+            Post.objects.create(
+                author=self.authors[i % 3], text=f"Пост {i}",
+                group=self.group if i % 2 else None,
+            )
+            for i in range(9)
+        ]
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def rows(self, alias, model=Post):
+        return set(
+            model._default_manager.db_manager(alias)
+            .values_list("pk", flat=True)
+        )
+
+    def queries(self, url):
+        contexts = {
+            alias: CaptureQueriesContext(connections[alias])
+            for alias in SHARDS
+        }
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = self.client.get(url)
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        self.assertEqual(response.status_code, 200)
+        return response, {
+            alias: len(context) for alias, context in contexts.items()
+        }
+
+    def test_posts_placed_by_author(self):
+        """Посты автора лежат на одном шарде, id указывает на него"""
+        for author in self.authors:
+            alias = sharding.shard_for_key(author.pk)
+            posts = {post.pk for post in self.posts if post.author == author}
+            with self.subTest(author=author.username):
+                self.assertEqual(self.rows(alias) & posts, posts)
+                for pk in posts:
+                    self.assertEqual(sharding.shard_for_pk(pk), alias)
+        self.assertFalse(self.rows("default"))
+        self.assertEqual(
+            len(set().union(*(self.rows(alias) for alias in SHARDS))), 9
+        )
+
+    def test_profile_hits_single_shard(self):
+        """Профиль читает только шард автора"""
+        author = self.authors[0]
+        response, queries = self.queries(
+            reverse("posts:profile", args=(author.username,))
+        )
+
+        alias = sharding.shard_for_key(author.pk)
+        self.assertEqual(len(response.context["page_obj"]), 3)
+        self.assertTrue(queries[alias])
+        self.assertEqual(
+            sum(queries.values()), queries[alias], "other shards queried"
+        )
+
+    def test_cross_shard_feeds_merged_in_order(self):
+        """Главная, группа и подписки сливают шарды по дате"""
+        newest_first = [post.pk for post in reversed(self.posts)]
+        in_group = [
+            pk for pk in newest_first
+            if Post.objects.get(pk=pk).group_id == self.group.pk
+        ]
+        urls = {
+            reverse("posts:index"): newest_first,
+            reverse("posts:group_list", args=(self.group.slug,)): in_group,
+            reverse("posts:follow_index"): newest_first,
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                response, _ = self.queries(url)
+                page = response.context["page_obj"]
+                self.assertEqual([post.pk for post in page], expected)
+                newest = [post.pk for post in self.posts].index(expected[0])
+                self.assertEqual(
+                    page[0].author.username, self.authors[newest % 3].username
+                )
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_authors_merged_into_feed(self):
+        """Посты популярных авторов читаются с шардов и вливаются
+        в ленту подписок"""
+        feed.rebuild_all()
+        self.assertFalse(FeedItem.objects.exists())
+        response, _ = self.queries(reverse("posts:follow_index"))
+
+        self.assertEqual(
+            [post.pk for post in response.context["page_obj"]],
+            [post.pk for post in reversed(self.posts)],
+        )
+
+    @override_settings(PAGINATION_OBJECTS_NUM=4)
+    def test_offset_pages(self):
+        """Страницы слияния идут подряд без пропусков и повторов"""
+        posts = Post.objects.all()
+        pages = [
+            [post.pk for post in posts[start:start + 4]]
+            for start in (0, 4, 8)
+        ]
+
+        self.assertEqual(posts.count(), 9)
+        self.assertEqual(
+            sum(pages, []), [post.pk for post in reversed(self.posts)]
+        )
+
+    def test_post_page_and_comment_on_post_shard(self):
+        """Страница поста и его комментарии — на шарде поста"""
+        post = self.posts[4]
+        alias = sharding.shard_for_pk(post.pk)
+        self.client.post(
+            reverse("posts:add_comment", args=(post.pk,)),
+            {"text": "Комментарий"},
+        )
+
+        comment = Comment.objects.get(post=post)
+        self.assertIn(comment.pk, self.rows(alias, Comment))
+        self.assertEqual(sharding.shard_for_pk(comment.pk), alias)
+        response, queries = self.queries(
+            reverse("posts:post_detail", args=(post.pk,))
+        )
+        self.assertContains(response, "Комментарий")
+        self.assertEqual(sum(queries.values()), queries[alias])
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_create_and_edit_post(self):
+        """Новый пост попадает на шард автора и в ленты подписчиков"""
+        author = self.authors[1]
+        client = Client()
+        client.force_login(author)
+        client.post(reverse("posts:post_create"), {"text": "Новый пост"})
+
+        post = Post.objects.get(text="Новый пост")
+        self.assertEqual(post._state.db, sharding.shard_for_key(author.pk))
+        self.assertTrue(FeedItem.objects.filter(post_id=post.pk).exists())
+        client.post(
+            reverse("posts:post_edit", args=(post.pk,)),
+            {"text": "Исправленный пост", "group": self.group.pk},
+        )
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 5)
+        self.assertEqual(
+            [found.pk for found in search_posts("исправленный")], [post.pk]
+        )
+
+    def test_api_resolves_authors_across_databases(self):
+        """API берет имена авторов и группы из основной базы"""
+        expected = [
+            {
+                "id": post.pk,
+                "author": post.author.username,
+                "group": "group" if post.group_id else None,
+            }
+            for post in reversed(self.posts)
+        ]
+        for url in (reverse("api:posts"), reverse("api:follow")):
+            with self.subTest(url=url):
+                data = self.client.get(
+                    url, {"fields": "id,author,group"}
+                ).json()
+                self.assertEqual(data["results"], expected)
+
+    def test_unknown_post_is_404(self):
+        """id не существующего шарда — 404, а не ошибка"""
+        for pk in (5, 10 ** 6):
+            with self.subTest(pk=pk):
+                response = self.client.get(
+                    reverse("posts:post_detail", args=(pk,))
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_recount_sums_shards(self):
+        """Пересчет счетчиков складывает посты со всех шардов"""
+        Comment.objects.create(
+            post=self.posts[4], author=self.reader, text="Комментарий"
+        )
+        Group.objects.update(posts_count=100)
+        Post.objects.update(comments_count=100)
+        AuthorStats.objects.all().delete()
+
+        call_command("recount_counters", stdout=StringIO())
+
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 4)
+        self.assertEqual(
+            {post.pk: post.comments_count for post in Post.objects.all()},
+            {post.pk: int(post == self.posts[4]) for post in self.posts},
+        )
+        for author in self.authors:
+            with self.subTest(author=author.username):
+                stats = get_stats(author)
+                self.assertEqual(stats.posts_count, 3)
+                self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(get_stats(self.reader).posts_count, 0)
+
+    @override_settings(FEED_BACKFILL_SIZE=2)
+    def test_rebuild_all_reads_shards(self):
+        """Пересборка лент берет последние посты авторов с шардов"""
+        feed.rebuild_all()
+
+        self.assertEqual(
+            set(FeedItem.objects.values_list("user_id", "post_id")),
+            {(self.reader.pk, post.pk) for post in self.posts[3:]},
+        )
+
+    def assertOnOwnShards(self, model):
+        for alias in SHARDS:
+            for pk in self.rows(alias, model):
+                self.assertEqual(sharding.shard_for_pk(pk), alias)
+
+    def test_import_places_rows_on_author_shards(self):
+        """Импорт выдает постам id на шарде автора, комментарии
+        находят свои посты по id из входа"""
+        path = os.path.join(self.tmp, "import.ndjson")
+        records = [
+            {"type": "post", "id": 7, "author": "author1", "text": "Один"},
+            {"type": "post", "id": 8, "author": "author2", "text": "Два"},
+            {"type": "comment", "id": 9, "post": 7, "author": "reader",
+             "text": "Комментарий"},
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+        call_command("import_yatube", path, stdout=StringIO())
+
+        first = Post.objects.get(text="Один")
+        self.assertEqual(
+            first._state.db, sharding.shard_for_key(self.authors[1].pk)
+        )
+        self.assertEqual(sharding.shard_for_pk(first.pk), first._state.db)
+        self.assertEqual(Post.objects.count(), 11)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.post_id, first.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.comments_count, 1)
+        self.assertOnOwnShards(Post)
+        self.assertOnOwnShards(Comment)
+
+    def test_seed(self):
+        """Синтетические данные раскладываются по шардам"""
+        call_command(
+            "seed_yatube", users=10, groups=2, posts=40, comments=30,
+            follows=20, stdout=StringIO(),
+        )
+
+        self.assertEqual(Post.objects.count(), 49)
+        self.assertEqual(Comment.objects.count(), 30)
+        self.assertEqual(
+            sum(Post.objects.order_by().values_list(
+                "comments_count", flat=True
+            )),
+            30,
+        )
+        self.assertOnOwnShards(Post)
+        self.assertOnOwnShards(Comment)
+        for comment in Comment.objects.all():
+            self.assertEqual(
+                sharding.shard_for_pk(comment.post_id),
+                sharding.shard_for_pk(comment.pk),
+            )
+
+    def test_deleting_author_deletes_sharded_rows(self):
+        """Удаление пользователя удаляет его посты и комментарии"""
+        author = self.authors[2]
+        author_id = author.pk
+        Comment.objects.create(
+            post=self.posts[0], author=author, text="Комментарий"
+        )
+        author.delete()
+
+        self.assertFalse(Post.objects.filter(author_id=author_id).exists())
+        self.assertFalse(Comment.objects.exists())
+
+
+class ShardRelationsTests(TestCase):
+    def test_foreign_keys_kept_without_shards(self):
+        """Без шардов связи постов остаются ограничениями в базе"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            )
+        references = {
+            tuple(info["columns"]) for info in constraints.values()
+            if info["foreign_key"]
+        }
+        self.assertIn(("author_id",), references)
+        self.assertIn(("group_id",), references)
+
+    def test_foreign_keys_dropped_with_shards(self):
+        field = Post._meta.get_field("author")
+        self.assertTrue(field.db_constraint)
+        with override_settings(DATABASE_SHARDS=SHARDS):
+            self.assertFalse(field.db_constraint)
@@ -0,0 +1,173 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import thumbnails  # isort:skip
+from posts.models import Post  # isort:skip
+
+User = get_user_model()
+MEDIA_ROOT = tempfile.mkdtemp()
+
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x02\x00"
+    b"\x01\x00\x80\x00\x00\x00\x00\x00"
+    b"\xFF\xFF\xFF\x21\xF9\x04\x00\x00"
+    b"\x00\x00\x00\x2C\x00\x00\x00\x00"
+    b"\x02\x00\x01\x00\x00\x02\x02\x0C"
+    b"\x0A\x00\x3B"
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=self.author,
+            text="Пост с картинкой",
+            image=SimpleUploadedFile(
+                name="small.gif", content=SMALL_GIF, content_type="image/gif"
+            ),
+        )
+        self.url = reverse(
+            "posts:post_detail", kwargs={"post_id": self.post.id}
+        )
+        self.client = Client()
+
+    def tearDown(self):
+        thumbnails._pending.clear()
+        thumbnails._local_store().clear()
+
+    def test_placeholder_until_generated(self):
+        """Пока миниатюры нет, показывается заглушка, а картинка
+        ставится в очередь"""
+        # TestCase не фиксирует транзакции: очередь после фиксации
+        # запускается сразу, а сама генерация подменена
+        with mock.patch.object(
+            transaction, "on_commit", side_effect=lambda func: func()
+        ), mock.patch.object(thumbnails, "generate") as generate:
+            response = self.client.get(self.url)
+
+        self.assertContains(response, "placeholder.svg")
+        self.assertIn(self.post.image.name, thumbnails._pending)
+        generate.assert_called_once_with(self.post.image.name)
+
+    def test_rolled_back_schedule_not_pending(self):
+        """После отката транзакции картинка не числится в очереди"""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                thumbnails.schedule(self.post.image.name)
+                raise RuntimeError
+
+        self.assertNotIn(self.post.image.name, thumbnails._pending)
+
+    def test_failed_image_not_rescheduled(self):
+        """Картинка, миниатюры которой не построились, не ставится
+        в пул на каждом показе поста"""
+        post = Post.objects.create(
+            author=self.author,
+            text="Пост с битой картинкой",
+            image=SimpleUploadedFile(
+                name="broken.gif", content=b"GIF89a broken",
+                content_type="image/gif",
+            ),
+        )
+        url = reverse("posts:post_detail", kwargs={"post_id": post.id})
+        with mock.patch.object(
+            transaction, "on_commit", side_effect=lambda func: func()
+        ), mock.patch.object(
+            thumbnails, "generate", wraps=thumbnails.generate
+        ) as generate, self.assertLogs("posts.thumbnails", "ERROR"):
+            for _ in range(3):
+                response = self.client.get(url)
+                self.assertContains(response, "placeholder.svg")
+
+        generate.assert_called_once_with(post.image.name)
+        self.assertNotIn(post.image.name, thumbnails._pending)
+
+    def test_generation_refreshes_cached_pages(self):
+        """Готовая миниатюра заменяет заглушку в закэшированной
+        главной и меняет ETag"""
+        index = reverse("posts:index")
+        response = self.client.get(index)
+        self.assertContains(response, "placeholder.svg")
+        etag = response["ETag"]
+
+        thumbnails.generate(self.post.image.name)
+
+        response = self.client.get(index, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "placeholder.svg")
+
+    def test_generated_thumbnail_with_srcset(self):
+        """После генерации выводится миниатюра со всеми ширинами srcset"""
+        thumbnails.generate(self.post.image.name)
+
+        response = self.client.get(self.url)
+
+        self.assertNotContains(response, "placeholder.svg")
+        for width in (480, 960, 1440):
+            with self.subTest(width=width):
+                self.assertContains(response, f" {width}w")
+
+    def test_feed_page_resolved_in_one_lookup(self):
+        """Миниатюры страницы ленты достаются одним запросом к KV,
+        повторно — из LRU процесса без запросов"""
+        for i in range(3):
+            post = Post.objects.create(
+                author=self.author,
+                text=f"Пост {i}",
+                image=SimpleUploadedFile(
+                    name=f"small{i}.gif",
+                    content=SMALL_GIF,
+                    content_type="image/gif",
+                ),
+            )
+            thumbnails.generate(post.image.name)
+        thumbnails.generate(self.post.image.name)
+        thumbnails._local_store().clear()
+        cache.clear()
+        thumbnails.resolve_stats.reset()
+        posts = list(Post.objects.for_feed())
+
+        with self.assertNumQueries(1):
+            thumbnails.resolve_page(posts)
+        for post in posts:
+            with self.subTest(post=post.pk):
+                self.assertIn(" 1440w", post._thumbnails["card"].srcset)
+
+        cache.clear()
+        with self.assertNumQueries(0):
+            thumbnails.resolve_page(posts)
+        stats = thumbnails.resolve_stats.snapshot()
+        self.assertEqual(stats["calls"], 2)
+        # Одинаковые картинки хранятся одним файлом с общими миниатюрами
+        files = {post.image.name for post in posts}
+        self.assertEqual(stats["keys"], 2 * len(files) * 3)
+
+    def test_index_uses_resolved_thumbnails(self):
+        """Главная страница выводит заранее найденные миниатюры"""
+        thumbnails.generate(self.post.image.name)
+        thumbnails.resolve_stats.reset()
+
+        response = self.client.get(reverse("posts:index"))
+
+        self.assertContains(response, " 960w")
+        self.assertEqual(thumbnails.resolve_stats.snapshot()["calls"], 1)
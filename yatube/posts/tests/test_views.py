@@ -1,16 +1,25 @@
+import base64
+import json
 import math
 import shutil
 import tempfile
+import warnings
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Comment, Follow, Group, Post  # isort:skip
+from posts.feed import is_popular, rebuild_all
+from posts.models import (  # isort:skip
+    Comment, FeedItem, Follow, Group, Post
+)
 
 User = get_user_model()
 MEDIA_ROOT = tempfile.mkdtemp()
@@ -222,7 +231,8 @@ class PostPagesTests(TestCase):
         url = reverse("posts:index")
 
         response = self.authorized_client.get(url)
-        post2.delete()
+        # update() не посылает сигналов — страница остается в кэше
+        Post.objects.filter(pk=post2.pk).update(text="Изменено")
         response_old = self.authorized_client.get(url)
         self.assertEqual(response.content, response_old.content)
 
@@ -230,6 +240,28 @@ class PostPagesTests(TestCase):
         response_new = self.authorized_client.get(url)
         self.assertNotEqual(response_old.content, response_new.content)
 
+    def test_index_cache_invalidated_by_post_changes(self):
+        """Новый и удаленный пост сразу видны на главной"""
+        url = reverse("posts:index")
+        self.authorized_client.get(url)
+
+        post2 = Post.objects.create(author=self.author, text="Новый пост")
+        response = self.authorized_client.get(url)
+        self.assertContains(response, post2.text)
+
+        post2.delete()
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, post2.text)
+
+    def test_index_cache_survives_login(self):
+        """Вход пользователя не сбрасывает кэш главной"""
+        url = reverse("posts:index")
+        self.authorized_client.get(url)
+        key_before = cache.get("version:index")
+
+        self.client.force_login(self.author)
+        self.assertEqual(cache.get("version:index"), key_before)
+
 
 class FollowTests(TestCase):
     def setUp(self):
@@ -307,6 +339,106 @@ class FollowTests(TestCase):
         response = unsub_client.get(reverse("posts:follow_index"))
         self.assertNotIn(post, response.context.get("page_obj").object_list)
 
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост раскладывается по лентам подписчиков"""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text="Пост", author=self.author)
+
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.user, post=post).exists()
+        )
+
+    def test_follow_backfills_and_unfollow_trims_feed(self):
+        """Подписка заполняет ленту, отписка очищает"""
+        post = Post.objects.create(text="Пост", author=self.author)
+
+        self.authorized_client.get(
+            reverse(
+                "posts:profile_follow",
+                kwargs={"username": self.author.username}
+            )
+        )
+        self.assertTrue(self.user.feed.filter(post=post).exists())
+
+        self.authorized_client.get(
+            reverse(
+                "posts:profile_unfollow",
+                kwargs={"username": self.author.username}
+            )
+        )
+        self.assertFalse(self.user.feed.exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_author_read_on_open(self):
+        """Посты популярного автора не раскладываются,
+        но видны в ленте подписчика"""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text="Пост", author=self.author)
+
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse("posts:follow_index"))
+        self.assertIn(post, response.context.get("page_obj").object_list)
+
+    def walk_follow_index(self):
+        url = reverse("posts:follow_index")
+        pks = []
+        with CaptureQueriesContext(connection) as queries:
+            page = self.authorized_client.get(url).context["page_obj"]
+            pks += [post.pk for post in page]
+            while page.next_cursor:
+                page = self.authorized_client.get(
+                    url, {"after": page.next_cursor}
+                ).context["page_obj"]
+                pks += [post.pk for post in page]
+        return pks, queries
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_popular_author_merged_into_feed(self):
+        """Посты популярного автора вливаются в разложенную ленту:
+        таблица постов не перебирается по подзапросу ленты"""
+        other = User.objects.create_user(username="other")
+        popular = User.objects.create_user(username="popular")
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=popular)
+        # Разложен, пока автор еще не был популярным
+        posts = [Post.objects.create(text="Ранний", author=popular)]
+        Follow.objects.create(user=other, author=popular)
+        for i in range(12):
+            author = popular if i % 2 else self.author
+            posts.append(Post.objects.create(text=f"Пост {i}", author=author))
+
+        pks, queries = self.walk_follow_index()
+
+        self.assertEqual(pks, [post.pk for post in reversed(posts)])
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if sql.startswith('SELECT') and 'FROM "posts_post"' in sql:
+                self.assertNotIn("posts_feeditem", sql)
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_author_no_longer_popular_until_rebuild(self):
+        """Отписка не дописывает посты популярного автора в ленты:
+        он читается при открытии ленты до пересборки лент"""
+        other = User.objects.create_user(username="other")
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(text="Пост", author=self.author)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+
+        Follow.objects.filter(user=other).delete()
+
+        self.assertTrue(is_popular(self.author.pk))
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        response = self.authorized_client.get(reverse("posts:follow_index"))
+        self.assertIn(post, response.context["page_obj"].object_list)
+
+        rebuild_all()
+
+        self.assertFalse(is_popular(self.author.pk))
+        self.assertTrue(
+            FeedItem.objects.filter(user=self.user, post=post).exists()
+        )
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -350,11 +482,16 @@ class PaginatorViewsTest(TestCase):
 
         for page_url in self.page_urls:
             posts_per_page = settings.PAGINATION_OBJECTS_NUM
+            params = {}
             for page in range(1, max_pages + 1):
                 with self.subTest(page_url=page_url, page=page):
-                    response = self.authorized_client.get(
-                        page_url + f"?page={page}"
-                    )
+                    response = self.authorized_client.get(page_url, {
+                        **params, "page": page
+                    })
+                    # Главная листается курсором, а не номером страницы
+                    page_obj = response.context["page_obj"]
+                    if getattr(page_obj, "is_cursor", False):
+                        params = {"after": page_obj.next_cursor}
 
                     residual_size = self.object_size - (page * posts_per_page)
                     if residual_size < 0:
@@ -364,6 +501,15 @@ class PaginatorViewsTest(TestCase):
                         len(response.context["page_obj"]), posts_per_page
                     )
 
+    def test_index_does_not_count_posts(self):
+        """Главная не считает все посты на каждой пересборке"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(reverse("posts:index"))
+
+        self.assertTrue(response.context["page_obj"].has_next())
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"])
+
     def test_first_page_show_correct_context(self):
         """Шаблон сформирован с правильным контекстом."""
         for page_url in self.page_urls:
@@ -383,3 +529,311 @@ class PaginatorViewsTest(TestCase):
                 for context, expected in context_detail.items():
                     with self.subTest(context=context):
                         self.assertEqual(context, expected)
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(username="author")
+        cls.user = User.objects.create_user(username="user")
+
+        cls.object_size = 23
+        Post.objects.bulk_create(
+            Post(author=cls.author, text=f"Тестовая пост {i}")
+            for i in range(cls.object_size)
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.url = reverse("posts:follow_index")
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_cursor_pages_walk_whole_feed(self):
+        """Курсорные страницы проходят ленту без пропусков и повторов"""
+        seen = []
+        response = self.authorized_client.get(self.url)
+        while True:
+            page_obj = response.context["page_obj"]
+            seen.extend(post.id for post in page_obj)
+            if not page_obj.has_next():
+                break
+            response = self.authorized_client.get(
+                self.url + f"?after={page_obj.next_cursor}"
+            )
+
+        expected = list(Post.objects.values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_previous_page(self):
+        """Курсор before возвращает предыдущую страницу"""
+        first = self.authorized_client.get(self.url).context["page_obj"]
+        second = self.authorized_client.get(
+            self.url + f"?after={first.next_cursor}"
+        ).context["page_obj"]
+        self.assertTrue(second.has_previous())
+
+        back = self.authorized_client.get(
+            self.url + f"?before={second.previous_cursor}"
+        ).context["page_obj"]
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_cursor_page_does_not_count(self):
+        """Курсорная пагинация не выполняет COUNT(*)"""
+        first = self.authorized_client.get(self.url).context["page_obj"]
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(
+                self.url + f"?after={first.next_cursor}"
+            )
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"].upper())
+            self.assertNotIn("OFFSET", query["sql"].upper())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор отдает первую страницу"""
+        first = self.authorized_client.get(self.url).context["page_obj"]
+        response = self.authorized_client.get(self.url + "?after=%%%")
+        self.assertEqual(list(response.context["page_obj"]), list(first))
+
+    def test_crafted_cursor_returns_first_page(self):
+        """Курсор с чужими типами значений или null — тоже первая
+        страница, а не ошибка сервера"""
+        first = self.authorized_client.get(self.url).context["page_obj"]
+        for values in ([123, 1], [{"a": 1}, 1], [None, None], ["x", []]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(values).encode()
+            ).decode()
+            for param in ("after", "before"):
+                with self.subTest(values=values, param=param):
+                    response = self.authorized_client.get(
+                        self.url, {param: cursor}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(
+                        list(response.context["page_obj"]), list(first)
+                    )
+
+
+class FeedQueryCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(
+            username="author", first_name="Имя", last_name="Фамилия"
+        )
+        cls.user = User.objects.create_user(username="user")
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="test-slug",
+            description="Тестовое описание"
+        )
+
+        cls.feed_urls = [
+            reverse("posts:index"),
+            reverse("posts:follow_index"),
+            reverse("posts:profile", kwargs={"username": cls.author.username}),
+            reverse("posts:group_list", kwargs={"slug": cls.group.slug}),
+        ]
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url)
+        return len(queries)
+
+    def create_posts(self, amount):
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пост {i}", group=self.group)
+            for i in range(amount)
+        )
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        """Количество запросов ленты не зависит от числа постов"""
+        self.create_posts(1)
+        expected = {url: self.count_queries(url) for url in self.feed_urls}
+
+        self.create_posts(settings.PAGINATION_OBJECTS_NUM)
+        for url in self.feed_urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), expected[url])
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentsPageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.author = User.objects.create_user(username="author")
+        cls.post = Post.objects.create(author=cls.author, text="Пост")
+        for i in range(7):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f"Комментарий {i}"
+            )
+        cls.url = reverse("posts:post_detail", kwargs={"post_id": cls.post.id})
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_comments_paginated(self):
+        """Комментарии выводятся постранично"""
+        response = self.author_client.get(self.url)
+
+        self.assertContains(response, "Комментарий 6")
+        self.assertContains(response, "Комментарий 4")
+        self.assertNotContains(response, "Комментарий 3")
+        self.assertContains(response, "?after=")
+
+    def test_comments_block_cached(self):
+        """Повторный показ страницы не читает комментарии из базы"""
+        self.author_client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.author_client.get(self.url)
+
+        for query in queries.captured_queries:
+            self.assertNotIn("posts_comment", query["sql"])
+
+    def test_add_comment_invalidates_first_page_only(self):
+        """Новый комментарий сбрасывает только первую страницу"""
+        first = self.author_client.get(self.url)
+        next_url = self.url + f"?after={first.context['page_obj'].next_cursor}"
+        self.author_client.get(next_url)
+
+        self.author_client.post(
+            reverse("posts:add_comment", kwargs={"post_id": self.post.id}),
+            data={"text": "Новый комментарий"},
+        )
+
+        self.assertContains(self.author_client.get(self.url), "Новый")
+        with CaptureQueriesContext(connection) as queries:
+            self.author_client.get(next_url)
+        for query in queries.captured_queries:
+            self.assertNotIn("posts_comment", query["sql"])
+
+
+    def test_invalid_cursor_not_cached(self):
+        """Битый курсор отдает первую страницу мимо кэша и без ключей
+        с произвольными символами"""
+        for after in ("a b", "x" * 600, "%%%"):
+            with self.subTest(after=after[:10]):
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error", CacheKeyWarning)
+                    response = self.author_client.get(
+                        self.url, {"after": after}
+                    )
+                self.assertContains(response, "Комментарий 6")
+                with CaptureQueriesContext(connection) as queries:
+                    self.author_client.get(self.url, {"after": after})
+                self.assertTrue(
+                    any(
+                        "posts_comment" in query["sql"]
+                        for query in queries.captured_queries
+                    )
+                )
+
+    def test_equivalent_cursors_share_cache(self):
+        """Тот же курсор в другой записи попадает в тот же ключ"""
+        first = self.author_client.get(self.url)
+        cursor = first.context["page_obj"].next_cursor
+        self.author_client.get(self.url, {"after": cursor})
+
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        spaced = base64.urlsafe_b64encode(
+            json.dumps(values, indent=2).encode()
+        ).decode()
+        self.assertNotEqual(spaced.rstrip("="), cursor)
+        with CaptureQueriesContext(connection) as queries:
+            self.author_client.get(self.url, {"after": spaced})
+        for query in queries.captured_queries:
+            self.assertNotIn("posts_comment", query["sql"])
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text="Пост", group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.urls = {
+            "index": reverse("posts:index"),
+            "group": reverse("posts:group_list", args=[self.group.slug]),
+            "profile": reverse("posts:profile", args=["author"]),
+            "post": reverse("posts:post_detail", args=[self.post.id]),
+        }
+
+    def get(self, url, response, client=None):
+        client = client or self.client
+        return client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизмененная страница отдается ответом 304"""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(url)
+
+                self.assertEqual(self.get(url, response).status_code, 304)
+
+    def test_not_modified_skips_rendering(self):
+        """На 304 страница поста тратит один запрос и не рендерится"""
+        url = self.urls["post"]
+        response = self.client.get(url)
+
+        with self.assertNumQueries(1):
+            self.assertFalse(self.get(url, response).content)
+
+    def test_changes_produce_new_etag(self):
+        """Изменения данных страницы меняют ее ETag"""
+        changes = {
+            "index": lambda: Post.objects.create(
+                author=self.author, text="Новый"
+            ),
+            "profile": lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+            "post": lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text="Комментарий"
+            ),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                url = self.urls[name]
+                response = self.reader_client.get(url)
+                change()
+
+                self.assertEqual(
+                    self.get(url, response, self.reader_client).status_code,
+                    200,
+                )
+
+    def test_etag_depends_on_user(self):
+        """Чужой ETag не подходит другому пользователю"""
+        url = self.urls["profile"]
+        response = self.client.get(url)
+
+        self.assertEqual(
+            self.get(url, response, self.reader_client).status_code, 200
+        )
@@ -0,0 +1,266 @@
+"""Миниатюры картинок постов.
+
+Миниатюры всех размеров строятся пулом потоков сразу после сохранения
+поста, а шаблон только ищет готовую запись в KV-хранилище sorl-thumbnail
+и, если ее еще нет, показывает заглушку вместо ресайза внутри запроса.
+Для страницы ленты записи всех постов достаются одним запросом
+(resolve_page) через LRU процесса.
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache.lru import LRUStore
+
+from .cache import INDEX_SCOPE, bump_version
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class Thumbnail:
+    def __init__(self, url, srcset="", ready=True):
+        self.url = url
+        self.srcset = srcset
+        self.ready = ready
+
+    @classmethod
+    def from_files(cls, files):
+        srcset = ", ".join(f"{im.url} {im.width}w" for im in files)
+        return cls(files[0].url, srcset)
+
+
+class LatencyStats:
+    """Время пакетного разрешения миниатюр в пределах процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, seconds, keys):
+        with self._lock:
+            self.calls += 1
+            self.keys += keys
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "keys": self.keys,
+                "total": self.total,
+                "mean": self.total / self.calls if self.calls else 0.0,
+                "max": self.max,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.keys = 0
+            self.total = 0.0
+            self.max = 0.0
+
+
+resolve_stats = LatencyStats()
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix="thumbnails",
+            )
+        return _executor
+
+
+def variants(preset):
+    """Все (geometry, options) пресета: основной размер и ширины srcset"""
+    config = settings.THUMBNAIL_PRESETS[preset]
+    width, height = (int(x) for x in config["geometry"].split("x"))
+    result = [(config["geometry"], config["options"])]
+    for srcset_width in config.get("srcset", ()):
+        if srcset_width != width:
+            geometry = f"{srcset_width}x{round(srcset_width * height / width)}"
+            result.append((geometry, config["options"]))
+    return result
+
+
+def _thumbnail_file(file_, geometry, options):
+    """ImageFile миниатюры, как его назовет бэкенд sorl, без чтения
+    исходника — повторяет подготовку опций из ThumbnailBackend"""
+    backend = default.backend
+    source = ImageFile(file_)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def lookup(file_, geometry, options):
+    """Готовая миниатюра из KV-хранилища или None; файлы не трогает"""
+    return default.kvstore.get(_thumbnail_file(file_, geometry, options))
+
+
+def _failed_key(name):
+    return f"thumbnail_failed:{hashlib.md5(name.encode()).hexdigest()}"
+
+
+def generate(name):
+    """Строит миниатюры всех пресетов для картинки"""
+    # Ключ KV-хранилища зависит от хранилища исходника, поэтому
+    # строим от того же хранилища, что и поле картинки
+    source = ImageFile(name, Post._meta.get_field("image").storage)
+    try:
+        for preset in settings.THUMBNAIL_PRESETS:
+            for geometry, options in variants(preset):
+                thumbnail = get_thumbnail(source, geometry, **options)
+                # Ошибку чтения исходника sorl только пишет в лог и
+                # возвращает миниатюру без записи в KV-хранилище
+                if default.kvstore.get(thumbnail) is None:
+                    raise ValueError(f"Cannot read image {name}")
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+        # Иначе каждый показ поста снова ставил бы битую картинку в пул
+        cache.set(
+            _failed_key(name), True, settings.THUMBNAIL_FAILURE_TIMEOUT
+        )
+    else:
+        # Страницы с картинками постов закэшированы и отдают ETag
+        # по версии ленты; без новой версии в них осталась бы заглушка
+        bump_version(INDEX_SCOPE)
+    finally:
+        _pending.discard(name)
+        close_old_connections()
+
+
+def schedule(name):
+    """Ставит картинку в очередь пула после фиксации транзакции.
+
+    В _pending картинка попадает только при фиксации: после отката
+    она не должна числиться в очереди. Картинка, миниатюры которой
+    недавно не удалось построить, не ставится до THUMBNAIL_FAILURE_TIMEOUT.
+    """
+    if not name or name in _pending or cache.get(_failed_key(name)):
+        return
+
+    def submit():
+        if name in _pending:
+            return
+        _pending.add(name)
+        if settings.THUMBNAIL_WORKERS:
+            _get_executor().submit(generate, name)
+        else:
+            generate(name)
+
+    transaction.on_commit(submit)
+
+
+_local_kv = None
+
+
+def _local_store():
+    # Готовая миниатюра не меняется, поэтому локальная копия записи
+    # живет долго; промахи не кэшируются — их заполнит пул
+    global _local_kv
+    if _local_kv is None:
+        _local_kv = LRUStore(
+            settings.THUMBNAIL_LOCAL_ENTRIES, settings.THUMBNAIL_LOCAL_BYTES
+        )
+    return _local_kv
+
+
+def _get_many_raw(keys):
+    """Значения KV-хранилища для набора ключей за один проход"""
+    local = _local_store()
+    values, missing = {}, []
+    for key in keys:
+        value = local.get(key)
+        if value is None:
+            missing.append(key)
+        else:
+            values[key] = value.decode()
+
+    kvstore = default.kvstore
+    if missing and isinstance(kvstore, CachedDBStore):
+        cached = kvstore.cache.get_many(missing)
+        missing = [key for key in missing if key not in cached]
+        if missing:
+            rows = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list("key", "value")
+            )
+            kvstore.cache.set_many(rows, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            cached.update(rows)
+        fetched = {
+            key: value for key, value in cached.items()
+            if value != EMPTY_VALUE
+        }
+    else:
+        fetched = {key: kvstore._get_raw(key) for key in missing}
+
+    for key, value in fetched.items():
+        if value:
+            values[key] = value
+            local.set(key, value.encode(), None)
+    return values
+
+
+def resolve_page(objects, preset="card"):
+    """Заранее находит миниатюры картинок всех постов страницы.
+
+    Результат кладется в пост и подхватывается тегом post_thumbnail,
+    вместо отдельного обращения к KV-хранилищу на каждую картинку.
+    """
+    started = time.monotonic()
+    wanted = []
+    for obj in objects:
+        image = getattr(obj, "image", None)
+        if image:
+            files = [
+                _thumbnail_file(image, geometry, options)
+                for geometry, options in variants(preset)
+            ]
+            wanted.append((obj, files))
+
+    keys = {add_prefix(file_.key) for _, files in wanted for file_ in files}
+    values = _get_many_raw(keys)
+
+    for obj, files in wanted:
+        found = [values.get(add_prefix(file_.key)) for file_ in files]
+        resolved = getattr(obj, "_thumbnails", {})
+        resolved[preset] = (
+            Thumbnail.from_files([deserialize_image_file(v) for v in found])
+            if all(found)
+            else None
+        )
+        obj._thumbnails = resolved
+
+    resolve_stats.record(time.monotonic() - started, len(keys))
@@ -0,0 +1,206 @@
+"""Прием картинок постов с ограниченным расходом памяти.
+
+Загрузка пишется во временный файл кусками, по дороге считаются sha256
+и размер; слишком большой файл дальше не пишется. Размер в пикселях
+проверяется по заголовку до декодирования, а само декодирование
+и перекодирование (без EXIF, с WebP-вариантом) идет в пуле процессов.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps, features
+
+from .storage import hash_file, variant_name
+
+FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+
+
+class Unavailable(Exception):
+    """Пул обработки картинок не ответил вовремя или сломался;
+    загрузку можно повторить"""
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """Пишет загрузку на диск, считая хеш и размер на лету"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra,
+        )
+        self.file.too_large = False
+        self.sha = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            # Остаток тела дочитывается без записи, а форма покажет ошибку
+            self.file.too_large = True
+        if not self.file.too_large:
+            self.sha.update(raw_data)
+            self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        if not self.file.too_large:
+            self.file.content_hash = self.sha.hexdigest()
+        return self.file
+
+
+def streaming_uploads(view):
+    """Подключает StreamingImageUploadHandler к view.
+
+    Обработчики загрузки нельзя менять после чтения request.POST,
+    а CsrfViewMiddleware его читает, поэтому CSRF проверяется здесь же,
+    уже после замены обработчиков.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+
+    return wrapper
+
+
+def check_pixels(upload):
+    """Не больше ли картинка IMAGE_MAX_PIXELS; Pillow читает только
+    заголовок, пиксели не декодируются"""
+    if hasattr(upload, "temporary_file_path"):
+        upload = upload.temporary_file_path()
+    with Image.open(upload) as image:
+        width, height = image.size
+    return width * height <= settings.IMAGE_MAX_PIXELS
+
+
+def reencode(source, target, webp_target, quality):
+    """Перекодирует картинку без метаданных; выполняется в пуле процессов.
+
+    Возвращает формат результата и записан ли WebP-вариант.
+    """
+    with Image.open(source) as image:
+        fmt = image.format if image.format in FORMATS else "PNG"
+        options = {"icc_profile": image.info.get("icc_profile")}
+        if fmt == "GIF":
+            options["save_all"] = getattr(image, "is_animated", False)
+        else:
+            image = ImageOps.exif_transpose(image)
+        if fmt == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            options.update(quality=quality, optimize=True, progressive=True)
+        elif fmt == "PNG":
+            options["optimize"] = True
+        elif fmt == "WEBP":
+            options["quality"] = quality
+        image.save(target, fmt, **options)
+
+        webp = fmt not in ("WEBP", "GIF") and features.check("webp")
+        if webp:
+            image.save(webp_target, "WEBP", quality=quality)
+    return fmt, webp
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: fork многопоточного процесса сервера небезопасен
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _run_in_pool(args):
+    global _executor
+    executor = _get_executor()
+    try:
+        return executor.submit(reencode, *args).result(
+            timeout=settings.IMAGE_PROCESS_TIMEOUT
+        )
+    except FutureTimeoutError:
+        raise Unavailable
+    except BrokenProcessPool:
+        # Упавший процесс ломает весь пул: следующая загрузка
+        # получит новый
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        raise Unavailable
+
+
+def _temporary_file(name, content_type):
+    return TemporaryUploadedFile(name, content_type, 0, None)
+
+
+def process(upload):
+    """Перекодированная копия загрузки с тем же content_hash.
+
+    Имя файла в хранилище — хеш исходной загрузки, поэтому повторная
+    загрузка тех же байтов по-прежнему находит готовый файл. Unavailable,
+    если пул не справился; ошибки Pillow на битой картинке
+    пробрасываются как есть.
+    """
+    source = upload
+    if not hasattr(upload, "temporary_file_path"):
+        source = _temporary_file(upload.name, upload.content_type)
+        for chunk in upload.chunks():
+            source.write(chunk)
+        source.flush()
+    content_hash = hash_file(upload)
+
+    target = _temporary_file(upload.name, upload.content_type)
+    webp = _temporary_file(variant_name(upload.name, ".webp"), "image/webp")
+    args = (
+        source.temporary_file_path(),
+        target.temporary_file_path(),
+        webp.temporary_file_path(),
+        settings.IMAGE_QUALITY,
+    )
+    try:
+        if settings.IMAGE_PROCESS_WORKERS:
+            fmt, has_webp = _run_in_pool(args)
+        else:
+            fmt, has_webp = reencode(*args)
+    except BaseException:
+        target.close()
+        webp.close()
+        raise
+    finally:
+        if source is not upload:
+            source.close()
+
+    ext = os.path.splitext(upload.name)[1].lower()
+    if ext != FORMATS[fmt] and (fmt, ext) != ("JPEG", ".jpeg"):
+        target.name = variant_name(upload.name, FORMATS[fmt])
+    target.content_type = Image.MIME[fmt]
+    target.size = os.path.getsize(target.temporary_file_path())
+    target.content_hash = content_hash
+    target.variants = {}
+    if has_webp:
+        webp.size = os.path.getsize(webp.temporary_file_path())
+        target.variants[".webp"] = webp
+    else:
+        webp.close()
+    return target
@@ -3,28 +3,68 @@ from functools import wraps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
 from yatube.settings import CACHE_TIMEOUT
 
+from core.db.routers import primary_reads, replica_reads
+
+from . import feed, thumbnails, uploads
+from .cache import (
+    INDEX_SCOPE, cache_versioned, comments_page_key, comments_scope,
+    get_version, page_etag, profile_scope
+)
+from .counters import get_stats
 from .forms import CommentForm, PostForm  # isort:skip
 from .models import Follow, Group, Post
+from .paginator import CountedPaginator, CursorPaginator, InvalidCursor
+from .search import search_posts
+
 
+def add_pagination(
+    objects_num=settings.PAGINATION_OBJECTS_NUM, cursor=False, transform=None
+):
+    """Декоратор для добавления пагинации
 
-def add_pagination(objects_num=settings.PAGINATION_OBJECTS_NUM):
-    """Декоратор для добавления пагинации"""
+    С cursor=True страницы выбираются по ключу сортировки
+    через ?after= / ?before= без COUNT(*) и OFFSET.
+    transform превращает строки страницы в объекты для шаблона.
+    """
 
     def decorator(func):
         @wraps(func)
         def wrapper(request, *args, **kwargs):
             response = func(request, *args, **kwargs)
             obj = response.context_data.pop("obj")
-
-            paginator = Paginator(obj, objects_num)
-            page_number = request.GET.get("page")
-            page_obj = paginator.get_page(page_number)
+            # Количество из счетчика, если view его знает
+            obj_count = response.context_data.pop("obj_count", None)
+
+            if cursor:
+                paginator = CursorPaginator(
+                    obj, objects_num, transform=transform
+                )
+                page_obj = paginator.get_page(
+                    after=request.GET.get("after"),
+                    before=request.GET.get("before"),
+                )
+            elif obj_count is not None:
+                paginator = CountedPaginator(obj, objects_num, obj_count)
+                page_number = request.GET.get("page")
+                page_obj = paginator.get_page(page_number)
+            else:
+                paginator = Paginator(obj, objects_num)
+                page_number = request.GET.get("page")
+                page_obj = paginator.get_page(page_number)
+
+            # Миниатюры всей страницы одним обращением к KV-хранилищу
+            page_obj.object_list = list(page_obj.object_list)
+            thumbnails.resolve_page(page_obj.object_list)
 
             response.context_data["page_obj"] = page_obj
             return response.render()
@@ -34,33 +74,77 @@ def add_pagination(objects_num=settings.PAGINATION_OBJECTS_NUM):
     return decorator
 
 
-@cache_page(CACHE_TIMEOUT, key_prefix="index_page")
-@add_pagination()
+# Валидаторы условных GET: версии областей из кэша и, где без этого
+# никак, один запрос по первичному ключу; шаблон при 304 не рендерится
+
+
+def feed_etag(request, *args, **kwargs):
+    return page_etag(request, get_version(INDEX_SCOPE))
+
+
+def profile_etag(request, username):
+    # Счетчики подписок и кнопка "подписаться" меняются без постов
+    return page_etag(
+        request, get_version(INDEX_SCOPE), get_version(profile_scope(username))
+    )
+
+
+def post_etag(request, post_id):
+    comments_count = (
+        Post.objects.filter(pk=post_id)
+        .values_list("comments_count", flat=True)
+        .first()
+    )
+    if comments_count is None:
+        return None
+    return page_etag(
+        request,
+        get_version(INDEX_SCOPE),
+        get_version(comments_scope(post_id)),
+        comments_count,
+    )
+
+
+@replica_reads
+@condition(etag_func=feed_etag)
+@cache_versioned(CACHE_TIMEOUT, key_prefix="index_page", scope=INDEX_SCOPE)
+# Счетчика всех постов нет, а COUNT(*) по всей таблице — на каждую
+# пересборку самой посещаемой страницы
+@add_pagination(cursor=True)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.for_feed()
     return TemplateResponse(request, "posts/index.html", {"obj": posts})
 
 
+@replica_reads
+@condition(etag_func=feed_etag)
 @add_pagination()
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    # Не group.posts: посты группы лежат на всех шардах
+    posts = Post.objects.filter(group=group).for_feed()
 
     context = {
         "group": group,
         "obj": posts,
+        "obj_count": group.posts_count,
     }
     return TemplateResponse(request, "posts/group_list.html", context)
 
 
+@replica_reads
+@condition(etag_func=profile_etag)
 @add_pagination()
 def profile(request, username):
     user = get_object_or_404(get_user_model(), username=username)
-    posts = user.posts.all()
+    posts = user.posts.for_feed()
+    stats = get_stats(user)
 
     context = {
         "author": user,
+        "author_stats": stats,
         "obj": posts,
+        "obj_count": stats.posts_count,
         "is_author": user != request.user,
     }
 
@@ -71,15 +155,61 @@ def profile(request, username):
     return TemplateResponse(request, "posts/profile.html", context)
 
 
+def render_comments(post, comments, request):
+    """Блок комментариев страницы; первая страница и страницы ?after=
+    кэшируются, ?before= собирается каждый раз"""
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    key = None
+    if not before:
+        # В ключ — курсор в каноническом виде: сырой параметр может
+        # быть любой длины и с любыми символами; битый не кэшируется
+        paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE)
+        try:
+            cursor = paginator.normalize_cursor(after) if after else None
+        except InvalidCursor:
+            pass
+        else:
+            key = comments_page_key(post.id, cursor)
+    if key is not None:
+        html = cache.get(key)
+        if html is not None:
+            return mark_safe(html)
+
+    if key is None:
+        return render_comments_page(comments, after, before)
+    # В кэш — только из основной базы: отстающая реплика оставила бы
+    # в нем устаревший блок до следующей смены версии
+    with primary_reads():
+        html = render_comments_page(comments, after, before)
+    cache.set(key, html, settings.COMMENTS_CACHE_TIMEOUT)
+    return html
+
+
+def render_comments_page(comments, after, before):
+    paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE)
+    page_obj = paginator.get_page(after=after, before=before)
+    return render_to_string(
+        "posts/includes/comments_display.html",
+        {"page_obj": page_obj},
+    )
+
+
+@replica_reads
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comment.all()
+    post = get_object_or_404(
+        Post.objects.with_related(), id=post_id
+    )
+    comments = post.comment.for_display()
     comment_form = CommentForm(request.POST or None)
 
     context = {
         "post": post,
+        "author_stats": get_stats(post.author),
         "comment_form": comment_form,
         "comments": comments,
+        "comments_html": render_comments(post, comments, request),
         "is_author": post.author == request.user,
     }
 
@@ -87,6 +217,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@uploads.streaming_uploads
 def post_create(request):
     user = request.user
 
@@ -95,12 +226,14 @@ def post_create(request):
         post = form.save(False)
         post.author = user
         post.save()
+        thumbnails.schedule(post.image.name)
         return redirect("posts:profile", user.username)
 
     return render(request, "posts/create_post.html", {"form": form})
 
 
 @login_required
+@uploads.streaming_uploads
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     user = request.user
@@ -112,7 +245,9 @@ def post_edit(request, post_id):
         request.POST or None, files=request.FILES or None, instance=post
     )
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if "image" in form.changed_data:
+            thumbnails.schedule(post.image.name)
         return redirect("posts:post_detail", post_id)
 
     context = {"form": form, "is_edit": True}
@@ -131,14 +266,27 @@ def add_comment(request, post_id):
     return redirect("posts:post_detail", post_id=post_id)
 
 
+@replica_reads
 @login_required
-@add_pagination()
+@add_pagination(cursor=True, transform=feed.as_posts)
 def follow_index(request):
-    following_ids = request.user.follower.values_list("author", flat=True)
-    posts = Post.objects.filter(author_id__in=following_ids)
+    posts = feed.follow_posts(request.user)
     return TemplateResponse(request, "posts/index.html", {"obj": posts})
 
 
+@add_pagination(cursor=True)
+def post_search(request):
+    query = request.GET.get("q", "").strip()
+    posts = search_posts(query, Post.objects.for_feed())
+
+    context = {
+        "query": query,
+        "obj": posts,
+        "page_query": urlencode({"q": query}),
+    }
+    return TemplateResponse(request, "posts/search.html", context)
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(get_user_model(), username=username)
@@ -49,15 +49,17 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "users.apps.UsersConfig",
-    "posts",
+    "posts.apps.PostsConfig",
     "core",
     "about",
+    "api",
     "sorl.thumbnail",
     "debug_toolbar",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.db.middleware.PrimaryPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -93,19 +95,88 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# SQLite с WAL и PRAGMA для рабочего сервера, см. core/db/backends/sqlite3;
+# соединение потока живет CONN_MAX_AGE секунд, а не один запрос
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "core.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "OPTIONS": {
+            "PRAGMAS": {},
+            "TRANSACTION_MODE": "IMMEDIATE",
+        },
     }
 }
 
+# Реплики только для чтения: файлы копий базы через запятую, например
+# DB_REPLICAS=/srv/replica1.sqlite3; копирует manage.py sync_replicas
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.environ.get("DB_REPLICAS", "").split(","))
+):
+    alias = f"replica{number + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": path,
+        "OPTIONS": {
+            "PRAGMAS": {"query_only": 1},
+            # Реплика только читает: блокировка записи ей не нужна
+            "TRANSACTION_MODE": "DEFERRED",
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Шарды постов и комментариев: файлы баз через запятую, например
+# DB_SHARDS=/srv/shard1.sqlite3,/srv/shard2.sqlite3, см. core/db/sharding.py.
+# Каждый шард создается manage.py migrate --database shardN
+DATABASE_SHARDS = []
+for number, path in enumerate(
+    filter(None, os.environ.get("DB_SHARDS", "").split(","))
+):
+    alias = f"shard{number + 1}"
+    DATABASES[alias] = {**DATABASES["default"], "NAME": path}
+    DATABASE_SHARDS.append(alias)
+
+DATABASE_ROUTERS = [
+    "core.db.routers.ShardRouter",
+    "core.db.routers.ReplicaRouter",
+]
+# Сколько секунд после записи пользователь читает из основной базы;
+# не меньше интервала синхронизации реплик
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = "db_pin"
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
 
+# Общий кэш для всех воркеров: узлы memcached через запятую,
+# например CACHE_NODES=10.0.0.1:11211,10.0.0.2:11211
+CACHE_NODES = os.environ.get("CACHE_NODES")
+if CACHE_NODES:
+    CACHES = {
+        "default": {
+            "BACKEND": "core.cache.backends.TwoLevelCache",
+            "LOCATION": "local",
+            "TIMEOUT": 300,
+            "OPTIONS": {
+                "SHARED": "shared",
+                "LOCAL_MAX_ENTRIES": 1000,
+                "LOCAL_MAX_BYTES": 32 * 1024 * 1024,
+                "LOCAL_TIMEOUT": 2,
+            },
+        },
+        "shared": {
+            "BACKEND": "core.cache.backends.ShardedMemcachedCache",
+            "LOCATION": CACHE_NODES.split(","),
+            "TIMEOUT": 300,
+        },
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -152,6 +223,67 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 
-PAGINATION_OBJECTS_NUM = 10
+# Размеры миниатюр, которые пул строит при загрузке картинки поста
+THUMBNAIL_PRESETS = {
+    "card": {
+        "geometry": "960x339",
+        "options": {"crop": "center", "upscale": True},
+        "srcset": (480, 960, 1440),
+    },
+}
+# 0 — строить миниатюры в потоке запроса
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_PLACEHOLDER = "img/placeholder.svg"
+# Сколько секунд не повторять построение миниатюр после ошибки
+THUMBNAIL_FAILURE_TIMEOUT = 5 * 60
+# LRU записей KV-хранилища миниатюр в памяти процесса
+THUMBNAIL_LOCAL_ENTRIES = 10000
+THUMBNAIL_LOCAL_BYTES = 8 * 1024 * 1024
+
+# Загрузка картинок постов, см. posts/uploads.py
+IMAGE_UPLOAD_MAX_SIZE = 32 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40 * 10 ** 6
+IMAGE_QUALITY = 90
+# 0 — перекодировать в процессе сервера
+IMAGE_PROCESS_WORKERS = 2
+IMAGE_PROCESS_TIMEOUT = 60
+
+# Ресайз по запросу: /media/r/<w>x<h>/<путь>, см. core/resize.py
+RESIZE_CACHE_DIR = os.path.join(BASE_DIR, "cache", "resized")
+RESIZE_CACHE_BYTES = 512 * 1024 * 1024
+RESIZE_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+RESIZE_MAX_SIZE = 2560
+RESIZE_QUALITY = 85
+# 0 — ресайз в потоке запроса
+RESIZE_WORKERS = 2
+RESIZE_TIMEOUT = 30
+
+# Поиск по постам, см. posts/search; None — по типу базы
+SEARCH_BACKEND = None
+# Прибавка к оценке релевантности за каждый день свежести поста
+SEARCH_RECENCY_WEIGHT = 1 / 30
 
-CACHE_TIMEOUT = 20
+PAGINATION_OBJECTS_NUM = 10
+# Сколько строк админка считает точно, дальше — оценка по статистике
+ESTIMATED_COUNT_LIMIT = 10000
+COMMENTS_PER_PAGE = 20
+COMMENTS_CACHE_TIMEOUT = 60 * 60
+API_PAGE_SIZE = 20
+
+# Кэш главной сбрасывается сигналами моделей, TTL — лишь страховка
+CACHE_TIMEOUT = 60 * 60 * 6
+# Сколько после истечения отдавать устаревшую копию, пока ее пересобирают
+CACHE_STALE_TIMEOUT = 60 * 60
+# Блокировка пересборки страницы и ожидание ее результата, в секундах
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 2
+CACHE_LOCK_POLL = 0.05
+# Множитель досрочного пересчета, 0 — выключен
+CACHE_EARLY_RECOMPUTE_BETA = 1.0
+
+# Авторы с таким числом подписчиков не раскладываются по лентам;
+# обратно их переключает только пересборка лент (feed.rebuild_all)
+FEED_FANOUT_LIMIT = 10000
+# Сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL_SIZE = 1000
+FEED_BATCH_SIZE = 500
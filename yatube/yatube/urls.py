@@ -3,10 +3,18 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import resize_image
+
 urlpatterns = [
+    path(
+        "media/r/<int:width>x<int:height>/<path:name>",
+        resize_image,
+        name="resize_image",
+    ),
     path("", include("posts.urls", namespace="posts")),
     path("about/", include("about.urls", namespace="about")),
     path("auth/", include("users.urls", namespace="users")),
+    path("api/v1/", include("api.urls", namespace="api")),
     path("admin/", admin.site.urls),
 ]
 